@@ -0,0 +1,418 @@
+"""Handler micro-benchmarks for menfes.py against an in-process fake Bot API.
+
+Contoh:
+    python3 bench_menfes.py                       # semua skenario, hasil JSON ke stdout
+    python3 bench_menfes.py --scenario vote_burst --updates 5000 --latency 0.02
+    python3 bench_menfes.py --output before.json  # simpan hasil untuk dibandingkan
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "Menfes Bench", "username": "menfes_bench_bot"}
+CHANNEL_CHAT = {"id": -1001000000001, "type": "channel", "title": "Bench Channel", "username": "gantichlu"}
+
+
+class FakeBotAPI(BaseRequest):
+    """BaseRequest that answers Bot API calls locally, records them and injects latency and errors"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_methods=None, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_methods = set(error_methods or [])
+        self.calls = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.errors.clear()
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = params.get("chat_id", 0)
+        if isinstance(chat_id, str) and chat_id.startswith("@"):
+            chat = CHANNEL_CHAT
+        else:
+            chat_id = int(chat_id)
+            chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "first_name": "User"}
+        message = {"message_id": self._message_id, "date": int(time.time()), "chat": chat, "from": BOT_USER}
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChatMember":
+            user = {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "User"}
+            return {"status": "member", "user": user}
+        if method == "getChat":
+            chat_id = params.get("chat_id")
+            return CHANNEL_CHAT if chat_id == "@gantichlu" else {"id": -1001000000002, "type": "supergroup", "title": "Bench Group"}
+        if method == "sendMediaGroup":
+            return [self._message(params) for _ in params.get("media", [])]
+        if method.startswith(("send", "edit", "copy", "forward")):
+            return self._message(params)
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._random.random() * self.jitter)
+        if self.error_rate and (not self.error_methods or api_method in self.error_methods) \
+                and self._random.random() < self.error_rate:
+            self.errors[api_method] += 1
+            body = {"ok": False, "error_code": 400, "description": "Bad Request: injected by bench"}
+            return 400, json.dumps(body).encode()
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+
+def user_dict(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def video_update(update_id: int, user_id: int, duration: int = 15) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+            "from": user_dict(user_id),
+            "caption": f"halo dari user {user_id}",
+            "video": {
+                "file_id": f"video-{update_id}",
+                "file_unique_id": f"uniq-{update_id}",
+                "width": 720,
+                "height": 1280,
+                "duration": duration,
+            },
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str, message: dict) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user_dict(user_id),
+            "chat_instance": "bench",
+            "data": data,
+            "message": message,
+        },
+    }
+
+
+def channel_post_message(message_id: int) -> dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": CHANNEL_CHAT,
+        "caption": "MENFES VIDEO\n\nPesan:\nbench\n\n👍 0 | 👎 0",
+        "video": {"file_id": "v", "file_unique_id": "u", "width": 1, "height": 1, "duration": 5},
+    }
+
+
+def private_bot_message(user_id: int) -> dict:
+    return {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+        "from": BOT_USER,
+        "text": "Selamat datang",
+    }
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name: str, latencies, duration: float, api: FakeBotAPI, extra=None) -> dict:
+    calls = sum(api.calls.values())
+    result = {
+        "scenario": name,
+        "updates": len(latencies),
+        "duration_s": round(duration, 4),
+        "ops_per_sec": round(len(latencies) / duration, 1) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+        "api_calls": calls,
+        "api_calls_per_update": round(calls / len(latencies), 3) if latencies else 0.0,
+        "api_calls_by_method": dict(sorted(api.calls.items())),
+        "api_errors_injected": dict(sorted(api.errors.items())),
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+async def drain_background(menfes, timeout: float = 30.0) -> None:
+    """Wait for debounced caption edits and other fire-and-forget work started by the handlers"""
+    deadline = time.monotonic() + timeout
+    while menfes._background_tasks and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def run_updates(application, payloads, concurrency: int):
+    """Feed updates through Application.process_update, returns (latencies, duration)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(payload):
+        update = Update.de_json(payload, application.bot)
+        async with semaphore:
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    return latencies, time.perf_counter() - started
+
+
+async def scenario_blacklist(menfes, application, api, args) -> dict:
+    """is_user_blacklisted() against a large ban list, no Bot API involved"""
+    with open(menfes.BLACKLIST_FILE, "w") as f:
+        for user_id in range(10_000_000, 10_000_000 + args.blacklist_size):
+            f.write(f"{user_id}\n")
+    menfes.blacklist_index.reload()
+
+    rng = random.Random(args.seed)
+    ids = [rng.randrange(10_000_000 - args.blacklist_size, 10_000_000 + args.blacklist_size) for _ in range(args.updates)]
+    latencies = []
+    started = time.perf_counter()
+    for user_id in ids:
+        t = time.perf_counter()
+        await menfes.is_user_blacklisted(user_id)
+        latencies.append(time.perf_counter() - t)
+    duration = time.perf_counter() - started
+
+    open(menfes.BLACKLIST_FILE, "w").close()
+    menfes.blacklist_index.reload()
+    return summarize("blacklist_lookup", latencies, duration, api, {"blacklist_size": args.blacklist_size})
+
+
+async def scenario_check_membership(menfes, application, api, args) -> dict:
+    """'Cek Kembali' presses from a population where most users press more than once"""
+    rng = random.Random(args.seed)
+    population = max(1, args.updates // 4)
+    payloads = [
+        callback_update(i, user_id, "check_membership", private_bot_message(user_id))
+        for i, user_id in enumerate(rng.randrange(1, population + 1) for _ in range(args.updates))
+    ]
+    latencies, duration = await run_updates(application, payloads, args.concurrency)
+    await drain_background(menfes)
+    return summarize("check_membership", latencies, duration, api, {"distinct_users": population})
+
+
+async def scenario_vote_burst(menfes, application, api, args) -> dict:
+    """Many distinct users clicking like/dislike on a handful of channel posts"""
+    rng = random.Random(args.seed)
+    posts = [channel_post_message(500_000 + i) for i in range(args.posts)]
+    payloads = []
+    for i in range(args.updates):
+        data = ("like_" if rng.random() < 0.8 else "dislike_") + "42"
+        payloads.append(callback_update(i, 1_000 + i, data, rng.choice(posts)))
+    latencies, duration = await run_updates(application, payloads, args.concurrency)
+    await drain_background(menfes)
+    return summarize("vote_burst", latencies, duration, api, {"posts": args.posts})
+
+
+async def scenario_submission_burst(menfes, application, api, args) -> dict:
+    """Video submissions from distinct users (nobody is on cooldown)"""
+    payloads = [video_update(i, 2_000_000 + i) for i in range(args.updates)]
+    latencies, duration = await run_updates(application, payloads, args.concurrency)
+    await drain_background(menfes)
+    return summarize("submission_burst", latencies, duration, api)
+
+
+async def scenario_caption_filter(menfes, application, api, args) -> dict:
+    """CaptionFilter.check() (normalization + automaton scan) for growing banned-term lists"""
+    rng = random.Random(args.seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    def word(low: int, high: int) -> str:
+        return "".join(rng.choice(letters) for _ in range(rng.randint(low, high)))
+
+    vocabulary = [word(2, 9) for _ in range(5000)]
+    largest = max(args.filter_sizes)
+    terms = [("*" if rng.random() < 0.2 else "") + word(4, 12) for _ in range(largest)]
+    captions = []
+    for _ in range(args.updates):
+        caption = []
+        while sum(len(w) + 1 for w in caption) < args.caption_length:
+            caption.append(rng.choice(vocabulary))
+        if rng.random() < 0.01:
+            caption.insert(rng.randrange(len(caption) + 1), terms[rng.randrange(largest)].lstrip("*"))
+        captions.append(" ".join(caption))
+
+    by_size = []
+    latencies, duration = [], 0.0
+    for size in sorted(args.filter_sizes):
+        path = os.path.abspath(f"bench_terms_{size}.txt")
+        with open(path, "w") as f:
+            f.write("".join(f"{term}\n" for term in terms[:size]))
+        started = time.perf_counter()
+        caption_filter = menfes.CaptionFilter(path)
+        caption_filter.open()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        blocked = 0
+        started = time.perf_counter()
+        for caption in captions:
+            t = time.perf_counter()
+            blocked += caption_filter.check(caption) is not None
+            latencies.append(time.perf_counter() - t)
+        duration = time.perf_counter() - started
+        by_size.append({
+            "terms": size,
+            "automaton_nodes": len(caption_filter._matcher),
+            "build_ms": round(build_ms, 2),
+            "ops_per_sec": round(len(captions) / duration, 1),
+            "chars_per_sec": round(sum(map(len, captions)) / duration),
+            "p50_us": round(percentile(latencies, 50) * 1e6, 1),
+            "p99_us": round(percentile(latencies, 99) * 1e6, 1),
+            "blocked": blocked,
+        })
+        os.remove(path)
+
+    # Angka utama dari list terbesar; waktu scan seharusnya hampir tidak berubah antar ukuran list
+    return summarize("caption_filter", latencies, duration, api, {
+        "caption_length": args.caption_length,
+        "by_list_size": by_size,
+    })
+
+
+SCENARIOS = {
+    "blacklist_lookup": scenario_blacklist,
+    "check_membership": scenario_check_membership,
+    "vote_burst": scenario_vote_burst,
+    "submission_burst": scenario_submission_burst,
+    "caption_filter": scenario_caption_filter,
+}
+
+
+async def run(args) -> dict:
+    # menfes membuat blacklist.txt dan database di direktori kerja, jadi jalankan di direktori sementara
+    workdir = tempfile.mkdtemp(prefix="menfes_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import menfes
+
+    if not args.log:
+        logging.disable(logging.CRITICAL)
+    menfes.vote_store.edit_interval = args.vote_edit_interval
+    menfes.admin_log_sink.interval = args.log_digest_interval
+
+    api = FakeBotAPI(args.latency, args.jitter, args.error_rate, args.error_methods, args.seed)
+    # Tanpa rate limiter: yang diukur biaya handler, bukan batas kirim Telegram
+    application = menfes.build_application(request=api, rate_limiter=None)
+    await application.initialize()
+    menfes.state_store.open()
+    menfes.admin_log_sink.start(application.bot)
+
+    results = []
+    try:
+        for name in args.scenario or SCENARIOS:
+            api.reset()
+            result = await SCENARIOS[name](menfes, application, api, args)
+            results.append(result)
+            print(
+                f"{name:18} {result['ops_per_sec']:>10} ops/s  p50 {result['p50_ms']:>8} ms  "
+                f"p99 {result['p99_ms']:>8} ms  {result['api_calls_per_update']:>6} calls/update",
+                file=sys.stderr
+            )
+    finally:
+        await menfes.admin_log_sink.stop()
+        await asyncio.to_thread(menfes.state_store.close)
+        await application.shutdown()
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": {
+            "updates": args.updates,
+            "concurrency": args.concurrency,
+            "latency_s": args.latency,
+            "jitter_s": args.jitter,
+            "error_rate": args.error_rate,
+            "error_methods": args.error_methods,
+            "vote_edit_interval_s": args.vote_edit_interval,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only this scenario (repeatable)")
+    parser.add_argument("--updates", type=int, default=2000, help="updates per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="updates processed at the same time")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake Bot API latency per call in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency per call in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Bot API calls that fail")
+    parser.add_argument("--error-methods", nargs="*", default=[], help="only inject errors for these API methods")
+    parser.add_argument("--blacklist-size", type=int, default=50_000, help="ban list size for blacklist_lookup")
+    parser.add_argument("--filter-sizes", type=int, nargs="+", default=[100, 1000, 10_000],
+                        help="banned-term list sizes for caption_filter")
+    parser.add_argument("--caption-length", type=int, default=200, help="characters per caption in caption_filter")
+    parser.add_argument("--posts", type=int, default=5, help="channel posts receiving votes in vote_burst")
+    parser.add_argument("--vote-edit-interval", type=float, default=0.2, help="override VOTE_EDIT_INTERVAL")
+    parser.add_argument("--log-digest-interval", type=float, default=0.5, help="override LOG_DIGEST_INTERVAL")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log", action="store_true", help="keep the bot's log output (off by default)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,45 @@
 import os
 import time
 import re
+import asyncio
+import hashlib
+import heapq
+import hmac
+import html
+import json
 import logging
-from datetime import datetime
-from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+import logging.handlers
+import math
+import multiprocessing
+import signal
+import sys
+import queue
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from functools import wraps
+from itertools import islice
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaVideo
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    ApplicationHandlerStop,
+    TypeHandler,
+    ChatMemberHandler,
     filters
 )
 
@@ -19,6 +49,8 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+# Satu baris per update (handler, user, latency, outcome); hanya aktif di LOG_MODE 'json' kecuali diatur di LOG_LEVELS
+update_logger = logging.getLogger('menfes.updates')
 
 # Konfigurasi bot
 BOT_TOKEN = 'gantibottekan'
@@ -29,105 +61,3367 @@ GROUP_ID = None       # Akan diisi saat bot berjalan
 GROUP_LINK = f'https://t.me/{GROUP_USERNAME}'  # Group link
 ADMIN_ID = 1780107438  # Admin ID for receiving logs
 MAX_VIDEO_DURATION = 30  # Maximum video duration in seconds
+MAX_VIDEO_SIZE = 50 * 1024 * 1024  # Maximum video file size in bytes, 0 = no limit
+ALLOWED_VIDEO_MIME_TYPES = ('video/mp4', 'video/quicktime', 'video/webm', 'video/x-matroska')  # Empty = any format; videos without a MIME type are accepted
 COOLDOWN_TIME = 3 * 60  # 3 minutes in seconds
 
+# Cara menerima update: polling (default) atau webhook di belakang reverse proxy
+USE_WEBHOOK = False
+WEBHOOK_URL = ''  # Public HTTPS URL Telegram posts to, e.g. 'https://bot.example.com/menfes-webhook'
+WEBHOOK_LISTEN = '127.0.0.1'  # Address of the local HTTP server
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = '/menfes-webhook'
+WEBHOOK_SECRET_TOKEN = ''  # Required in webhook mode, checked against X-Telegram-Bot-Api-Secret-Token (1-256 chars: A-Z, a-z, 0-9, _ and -)
+WEBHOOK_MAX_BODY = 1024 * 1024  # Max update size in bytes
+WEBHOOK_MAX_HEADER = 16 * 1024  # Max size of request line + headers in bytes
+WEBHOOK_READ_TIMEOUT = 10  # Seconds a client may take to send a request
+
+# Bot API server lain (telegram-bot-api self-hosted atau server palsu soak_menfes.py), kosong = api.telegram.org
+BOT_API_BASE_URL = ''  # e.g. 'http://127.0.0.1:8081/bot' (token is appended)
+BOT_API_BASE_FILE_URL = ''  # e.g. 'http://127.0.0.1:8081/file/bot'
+
+# Startup cache: hash deskripsi/command yang sudah dikirim dan ID numerik channel/grup
+BOOTSTRAP_CACHE_FILE = 'menfes_bootstrap.json'
+CHAT_ID_RETRY_DELAY = 5  # First retry delay (seconds) when a chat ID lookup fails, doubled per attempt
+CHAT_ID_RETRY_MAX_DELAY = 5 * 60
+
+# Concurrency: > 1 processes that many updates at once (updates of one user still run in order)
+CONCURRENT_UPDATES = 1
+PER_USER_QUEUE_LIMIT = 20  # Max updates of one user waiting behind the one being processed
+
+# Multi-proses: > 1 menjalankan supervisor yang polling sekali lalu membagi update ke sekian worker per user_id
+WORKER_PROCESSES = 1
+WORKER_QUEUE_SIZE = 1000  # Max updates waiting for one worker before the supervisor stops polling
+WORKER_POLL_TIMEOUT = 10  # Long-poll timeout (seconds) of the supervisor's getUpdates
+WORKER_RESTART_DELAY = 1  # First delay (seconds) before a crashed worker is restarted, doubled per quick crash
+WORKER_RESTART_MAX_DELAY = 60
+WORKER_STABLE_TIME = 60  # A worker that ran this long before crashing is restarted without backoff
+WORKER_SHUTDOWN_TIMEOUT = 30  # Seconds workers get to finish queued updates before they are killed
+WORKER_GROUP_SLOTS = 16  # Shared rate-limit buckets for groups/channels, chats are hashed into the slots
+
+# Gate sebelum semua handler: hanya chat privat, user dibanned ditolak, flood control per user
+GATE_USER_RATE = 1  # Updates per second a user may send on average (messages, commands and button presses)
+GATE_USER_BURST = 10  # Updates a user may send back to back before throttling starts
+GATE_NOTICE_INTERVAL = 60  # Min seconds between "too fast"/"banned" notices to the same user
+GATE_PRUNE_INTERVAL = 5 * 60  # Seconds between sweeps that forget idle users
+
+# Membership cache
+MEMBERSHIP_CACHE_TTL = 10 * 60  # How long a positive membership result is trusted (seconds)
+MEMBERSHIP_NEGATIVE_TTL = 30  # Short TTL for negative results so users who just joined are re-checked quickly
+MEMBERSHIP_STALE_TTL = 6 * 60 * 60  # Max age of a positive result served when Telegram errors or times out
+MEMBERSHIP_CACHE_SIZE = 50000  # Max (chat, user) entries before LRU eviction
+MEMBERSHIP_HEDGE_DELAY = 1.5  # Start the username-based lookup if the numeric one hasn't answered by then
+VERIFY_TIMEOUT = 8  # Shared deadline for the group + channel checks (seconds)
+
+# Roster anggota: kalau bot admin di channel dan grup, keanggotaan dilacak lokal dari update chat_member
+MEMBER_ROSTER = False
+ROSTER_RECONCILE_INTERVAL = 10 * 60  # Seconds between reconciliation rounds
+ROSTER_RECONCILE_MAX_AGE = 24 * 60 * 60  # Entries not confirmed for this long are re-checked with getChatMember
+ROSTER_RECONCILE_BATCH = 500  # Max entries re-checked per round
+ROSTER_RECONCILE_RATE = 5  # getChatMember calls per second during reconciliation
+
+# Admin log digest
+LOG_DIGEST_INTERVAL = 60  # Seconds between digest messages to ADMIN_ID
+LOG_DIGEST_MAX_EVENTS = 100  # Send the digest early once this many events are queued
+LOG_QUEUE_SIZE = 5000  # Oldest events are dropped when the queue is full
+TELEGRAM_MESSAGE_LIMIT = 4096  # Max characters per Telegram text message
+
+# Outbound Bot API scheduling (Telegram limits: ~30 msg/s global, ~20 msg/min per group/channel)
+OUTBOUND_GLOBAL_RATE = 30  # Messages per second across all chats
+OUTBOUND_GROUP_RATE = 20 / 60  # Messages per second per group or channel
+OUTBOUND_GROUP_BURST = 5  # Messages a group/channel may receive back to back before throttling
+OUTBOUND_PRIVATE_RATE = 1  # Messages per second per private chat
+OUTBOUND_PRIVATE_BURST = 3  # Messages a private chat may receive back to back (e.g. reply + confirmation) before throttling
+OUTBOUND_MAX_RETRIES = 3  # How often a request is retried after RetryAfter
+# Priorities, lower is served first
+PRIORITY_REPLY = 0  # Replies to users
+PRIORITY_CHANNEL_POST = 1  # Videos posted to the channel
+PRIORITY_VOTE_EDIT = 2  # Like/dislike caption edits
+PRIORITY_ADMIN_LOG = 3  # Admin log digests
+PRIORITY_NAMES = {
+    PRIORITY_REPLY: 'reply',
+    PRIORITY_CHANNEL_POST: 'channel',
+    PRIORITY_VOTE_EDIT: 'vote_edit',
+    PRIORITY_ADMIN_LOG: 'admin_log',
+}
+
+# Like/dislike
+VOTE_EDIT_INTERVAL = 3  # Min seconds between caption edits of the same channel post
+VOTE_MAX_POSTS = 50000  # Max channel posts whose vote counts and voters are kept in memory
+VOTE_RETENTION = 7 * 24 * 60 * 60  # Voting on a post closes this many seconds after it was published
+VOTE_PRUNE_INTERVAL = 10 * 60  # Seconds between sweeps that drop expired posts
+VOTE_EDIT_MAX_RETRIES = 3  # Caption edits retried after transient errors before waiting for the next vote
+
+# Leaderboard (/top) dan digest mingguan
+LEADERBOARD_SIZE = 10  # Entries shown per window by /top and the digest
+LEADERBOARD_WINDOWS = {'day': 24 * 60 * 60, 'week': 7 * 24 * 60 * 60}  # Rolling windows by post age; 'all' is always kept
+LEADERBOARD_DIGEST_CHAT = None  # Chat the week's top videos are posted to (e.g. CHANNEL_ID), None = no digest
+LEADERBOARD_DIGEST_WEEKDAY = 6  # 0 = Monday ... 6 = Sunday (server local time)
+LEADERBOARD_DIGEST_HOUR = 20
+
+# State database (cooldowns, votes, bans, submission history)
+STATE_DB_FILE = 'menfes_state.db'
+STATE_BATCH_SIZE = 500  # Max queued writes committed in one transaction
+STATE_SWEEP_INTERVAL = 10 * 60  # Seconds between expiry sweeps of cooldowns and old votes
+
+# Shared state backend: 'local' untuk satu proses, 'resp' supaya beberapa worker berbagi cooldown, ban,
+# vote dan cache keanggotaan lewat server Redis-compatible (Redis 6.2+, Valkey, atau menfes_state_server.py)
+STATE_BACKEND = 'local'
+STATE_BACKEND_HOST = '127.0.0.1'
+STATE_BACKEND_PORT = 6379
+STATE_BACKEND_PREFIX = 'menfes:'  # Key prefix, lets several bots share one server
+STATE_BACKEND_POOL_SIZE = 8  # Max open connections to the backend
+STATE_BACKEND_TIMEOUT = 2  # Seconds before a backend command is considered failed
+
+# Duplicate videos (matched by Telegram's file_unique_id)
+DUPLICATE_RETENTION = 30 * 24 * 60 * 60  # The same video can't be submitted again within this many seconds
+DUPLICATE_CACHE_SIZE = 100000  # Recently accepted videos kept in memory (LRU)
+DUPLICATE_FILTER_CAPACITY = 1000000  # Expected videos in the retention window, sizes the Bloom filter
+DUPLICATE_FILTER_ERROR_RATE = 0.01  # Bloom filter false positives (each one costs a local database lookup)
+
+# Filter caption: kata/frasa terlarang, dikelola admin lewat /filter atau diedit langsung
+BANNED_TERMS_FILE = 'banned_terms.txt'
+BANNED_TERMS_RELOAD_INTERVAL = 5  # Seconds between checks for manual edits of the terms file
+
+# Moderation: video masuk antrian dan baru diposting ke channel setelah di-approve admin
+MODERATION_MODE = False
+MODERATION_BATCH_SIZE = 10  # Videos per review message (max 10, Telegram's media group limit)
+MODERATION_MAX_OPEN_BATCHES = 3  # Review messages awaiting a decision before new batches are held back
+MODERATION_REVIEW_INTERVAL = 60  # Seconds between checks for pending videos to send for review
+MODERATION_PREVIEW_LENGTH = 200  # Caption characters shown per video in the review message
+MODERATION_MAX_ATTEMPTS = 5  # Failed sends (review or publish) before an item is dropped as failed
+MODERATION_RETRY_DELAY = 5  # Seconds before retrying a failed item, doubled after every further failure
+MODERATION_RETRY_MAX_DELAY = 600  # Upper bound of the retry delay in seconds
+
+# Metrics (handler/Bot API latency, errors, rejections); always collected, endpoint is optional
+METRICS_PORT = 0  # Port of the local Prometheus endpoint, 0 = off
+METRICS_LISTEN = '127.0.0.1'
+METRICS_PATH = '/metrics'
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Histogram upper bounds in seconds
+
+# Logging: 'plain' = teks ke stderr (default), 'json' = JSON lines ke file rotasi lewat thread terpisah
+LOG_MODE = 'plain'
+LOG_FILE = 'menfes.log'
+LOG_ROTATE = 'size'  # 'size' rotates at LOG_MAX_BYTES, or a TimedRotatingFileHandler interval like 'midnight' or 'H'
+LOG_MAX_BYTES = 20 * 1024 * 1024
+LOG_BACKUP_COUNT = 10  # Rotated files kept
+LOG_QUEUE_LIMIT = 10000  # Records waiting for the writer thread; extra records are dropped instead of blocking
+LOG_LEVELS = {'httpx': 'WARNING'}  # Per-logger levels, e.g. {'telegram': 'DEBUG', 'menfes.updates': 'WARNING'}
+LOG_SAMPLE_RATES = {'vote': 0.1}  # Fraction of records kept per event type (here 1 in 10 vote clicks)
+
+# Profiler on-demand (/profile start|stop, admin only); tidak ada thread atau task selama mati
+PROFILE_DIR = 'profiles'  # Collapsed-stack files (flamegraph.pl / speedscope) are written here
+PROFILE_DEFAULT_DURATION = 60  # Seconds when /profile start is given no duration
+PROFILE_MAX_DURATION = 10 * 60  # The profiler stops by itself after at most this many seconds
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples of the event loop thread
+PROFILE_LAG_INTERVAL = 0.1  # Seconds between event loop lag probes
+PROFILE_TOP = 10  # Hot spots listed in the summary sent to ADMIN_ID
+
 # Store last message time for each user
 last_message_time = {}
 
-# Path to blacklist file
-BLACKLIST_FILE = 'blacklist.txt'
+# Path to blacklist file
+BLACKLIST_FILE = 'blacklist.txt'
+BLACKLIST_RELOAD_INTERVAL = 5  # Seconds between checks for manual edits of the blacklist file
+
+# Create blacklist file if it doesn't exist
+if not os.path.exists(BLACKLIST_FILE):
+    with open(BLACKLIST_FILE, 'w') as f:
+        pass
+
+class LogContextFilter(logging.Filter):
+    """Attach the handler and user of the update being processed to every record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'handler'):
+            record.handler = current_handler.get()
+        if not hasattr(record, 'user_id'):
+            record.user_id = current_user.get()
+        return True
+
+class LogSamplingFilter(logging.Filter):
+    """Keep 1 in N records of high-volume events, N derived from LOG_SAMPLE_RATES"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) for event, rate in rates.items() if rate > 0}
+        self.dropped_events = {event for event, rate in rates.items() if rate <= 0}
+        self._seen = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        if event in self.dropped_events:
+            return False
+        every = self.every.get(event)
+        if every is None:
+            return True
+        seen = self._seen.get(event, 0)
+        self._seen[event] = seen + 1
+        # Counter, bukan random: hasil sampling stabil dan tiap record membawa faktor pengalinya
+        record.sample_rate = every
+        return seen % every == 0
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line with a fixed set of fields, easy to grep or load with jq"""
+
+    FIELDS = ('handler', 'user_id', 'event', 'latency_ms', 'outcome', 'sample_rate')
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full and leaves formatting to the listener thread"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Listener ada di proses yang sama, record tidak perlu diformat atau di-pickle di event loop
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_log_listener = None
+_log_queue_handler = None
+
+def setup_logging() -> None:
+    """Apply LOG_LEVELS and LOG_SAMPLE_RATES, and in 'json' mode move log I/O to a background thread"""
+    global _log_listener, _log_queue_handler
+    update_logger.setLevel(logging.INFO if LOG_MODE == 'json' else logging.WARNING)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    root = logging.getLogger()
+    filters_ = (LogContextFilter(), LogSamplingFilter(LOG_SAMPLE_RATES))
+    if LOG_MODE != 'json':
+        for handler in root.handlers:
+            for log_filter in filters_:
+                handler.addFilter(log_filter)
+        return
+
+    if LOG_ROTATE == 'size':
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    else:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    file_handler.setFormatter(JsonLineFormatter())
+    # Warning dan error tetap muncul di stderr supaya terlihat saat bot dijalankan manual
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    _log_queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_LIMIT))
+    for log_filter in filters_:
+        _log_queue_handler.addFilter(log_filter)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_log_queue_handler)
+    _log_listener = logging.handlers.QueueListener(
+        _log_queue_handler.queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _log_listener.start()
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def log_records_dropped() -> int:
+    return _log_queue_handler.dropped if _log_queue_handler is not None else 0
+
+# Keep references to fire-and-forget tasks so they aren't garbage collected mid-flight
+_background_tasks = set()
+
+# Helper functions
+def spawn_background(coro) -> asyncio.Task:
+    """Run a coroutine in the background without awaiting it"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT):
+    """Split text into chunks of at most limit characters, preferring line boundaries"""
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+class Metrics:
+    """Counters, gauges and latency histograms kept in plain dicts and rendered in Prometheus text format"""
+
+    LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [per-bucket counts (last is +Inf), sum, count]
+        self._help = {}  # name -> (type, help text)
+        self._collectors = []  # callables yielding (name, labels, value) gauges at scrape time
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def add_collector(self, collector) -> None:
+        self._collectors.append(collector)
+
+    # Label disimpan sebagai tuple (('handler', 'start'),) supaya bisa jadi key dict tanpa alokasi tambahan
+    def inc(self, name: str, labels: tuple = (), value: float = 1) -> None:
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name: str, labels: tuple, delta: float) -> None:
+        key = (name, labels)
+        self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, labels: tuple, seconds: float) -> None:
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def counter_value(self, name: str, **labels) -> float:
+        """Sum of a counter over all label sets that contain the given labels"""
+        wanted = set(labels.items())
+        return sum(value for (metric, key), value in self._counters.items() if metric == name and wanted <= set(key))
+
+    def histogram_summary(self, name: str):
+        """Yield (labels, count, average seconds) for each label set of a histogram"""
+        for (metric, labels), (_, total, count) in self._histograms.items():
+            if metric == name and count:
+                yield labels, count, total / count
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{str(value).translate(Metrics.LABEL_ESCAPES)}"' for key, value in pairs) + "}"
+
+    def _header(self, lines: list, name: str, default_kind: str, seen: set) -> None:
+        if name in seen:
+            return
+        seen.add(name)
+        kind, help_text = self._help.get(name, (default_kind, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        lines = []
+        seen = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            self._header(lines, name, 'counter', seen)
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+
+        gauges = dict(self._gauges)
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges[(name, labels)] = value
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        for (name, labels), value in sorted(gauges.items()):
+            self._header(lines, name, 'gauge', seen)
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+
+        for (name, labels), (counts, total, count) in sorted(self._histograms.items()):
+            self._header(lines, name, 'histogram', seen)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def stats_text(self) -> str:
+        handler_lines = []
+        for labels, count, average in sorted(self.histogram_summary('menfes_handler_duration_seconds')):
+            handler = dict(labels)['handler']
+            errors = self.counter_value('menfes_handler_errors_total', handler=handler)
+            handler_lines.append(f"• {handler}: {count}x, rata-rata {average * 1000:.0f} ms, error {errors:.0f}")
+        rejected = ", ".join(
+            f"{dict(key)['reason']}: {value:.0f}"
+            for (name, key), value in sorted(self._counters.items()) if name == 'menfes_submissions_rejected_total'
+        ) or "-"
+        verify_failures = self.counter_value('menfes_verification_failures_total')
+        return (
+            "\n".join(handler_lines or ["• Belum ada update"]) + "\n"
+            f"• Video ditolak: {rejected}\n"
+            f"• Verifikasi gagal: {verify_failures:.0f}"
+        )
+
+metrics = Metrics()
+metrics.describe('menfes_handler_duration_seconds', 'histogram', "Time spent in each update handler")
+metrics.describe('menfes_handler_errors_total', 'counter', "Handler errors by exception type")
+metrics.describe('menfes_updates_in_flight', 'gauge', "Updates currently being handled")
+metrics.describe('menfes_bot_api_duration_seconds', 'histogram', "Bot API call latency per method, including queueing")
+metrics.describe('menfes_bot_api_queue_seconds', 'histogram', "Time send/edit calls waited for a rate limit token")
+metrics.describe('menfes_bot_api_errors_total', 'counter', "Failed Bot API calls by method and exception type")
+metrics.describe('menfes_submissions_rejected_total', 'counter', "Videos rejected before posting, by pipeline stage")
+metrics.describe('menfes_submission_stage_seconds', 'histogram', "Time spent in each submission validation stage")
+metrics.describe('menfes_verification_failures_total', 'counter', "Group/channel membership checks that failed")
+metrics.describe('menfes_gate_dropped_total', 'counter', "Updates dropped before reaching a handler, by reason")
+
+# Nama handler yang sedang berjalan, supaya error yang ditangkap di dalam handler tetap tercatat per handler
+current_handler = ContextVar('current_handler', default='background')
+current_user = ContextVar('current_user', default=None)
+current_outcome = ContextVar('current_outcome', default='ok')
+
+def instrument_handler(name: str, callback):
+    """Wrap a handler callback to record its latency, in-flight count, outcome and uncaught errors"""
+    labels = (('handler', name),)
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        user = getattr(update, 'effective_user', None)
+        tokens = (
+            current_handler.set(name),
+            current_user.set(user.id if user else None),
+            current_outcome.set('ok'),
+        )
+        metrics.gauge_add('menfes_updates_in_flight', labels, 1)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            metrics.inc('menfes_handler_errors_total', (('handler', name), ('type', type(e).__name__)))
+            current_outcome.set(f"error:{type(e).__name__}")
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            metrics.observe('menfes_handler_duration_seconds', labels, latency)
+            metrics.gauge_add('menfes_updates_in_flight', labels, -1)
+            if update_logger.isEnabledFor(logging.INFO):
+                outcome = current_outcome.get()
+                update_logger.info(
+                    f"{name} {outcome}",
+                    extra={'event': 'update', 'latency_ms': round(latency * 1000, 2), 'outcome': outcome}
+                )
+            for var, token in zip((current_handler, current_user, current_outcome), tokens):
+                var.reset(token)
+
+    return wrapper
+
+def count_rejection(reason: str) -> None:
+    metrics.inc('menfes_submissions_rejected_total', (('reason', reason),))
+    current_outcome.set(f"rejected:{reason}")
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second up to capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+class SharedTokenBucket:
+    """TokenBucket whose state lives in shared memory, so all worker processes draw from one budget"""
+
+    def __init__(self, rate: float, capacity: float, context=multiprocessing):
+        self.rate = rate
+        self.capacity = capacity
+        # [tokens, updated, paused_until]; time.monotonic() memakai jam yang sama di semua proses
+        self._state = context.Array('d', [capacity, time.monotonic(), 0.0])
+
+    @property
+    def tokens(self) -> float:
+        return self._state[0]
+
+    @property
+    def paused_until(self) -> float:
+        return self._state[2]
+
+    @paused_until.setter
+    def paused_until(self, value: float) -> None:
+        with self._state.get_lock():
+            self._state[2] = max(self._state[2], value)
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        with self._state.get_lock():
+            tokens, updated, paused_until = self._state[:]
+            # Proses lain bisa sudah mengisi ulang dengan `now` yang sedikit lebih baru
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            self._state[0] = tokens
+            self._state[1] = max(now, updated)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+        return max(wait, paused_until - now)
+
+    def consume(self) -> None:
+        # Dua proses bisa sama-sama lolos delay() untuk token terakhir; saldo minus ditebus di delay() berikutnya
+        with self._state.get_lock():
+            self._state[0] -= 1
+
+class OutboundScheduler(BaseRateLimiter):
+    """Rate limiter for the bot's send/edit calls with per-chat and global token buckets and priorities"""
+
+    # Endpoint yang kena limit pesan per chat; sisanya (getChatMember, answerCallbackQuery, ...) langsung jalan
+    LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+    def __init__(self, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._global = TokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_RATE)
+        self._chats = {}  # chat_id -> TokenBucket
+        self._group_slots = None  # SharedTokenBucket per slot in worker mode, see use_shared_budget
+        self._waiting = []  # heap of (priority, seq, chat_key, future) whose chat may have a token
+        self._blocked = []  # heap of (ready_at, priority, seq, chat_key, future) parked until their chat has a token
+        self._seq = 0
+        self._next_prune = 0.0
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+        self.dispatched = 0
+        self.retry_after_hits = 0
+
+    async def initialize(self) -> None:
+        # Application dan Updater sama-sama meng-initialize bot (dan rate limiter-nya), cukup satu dispatcher
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._task:
+            # Pakai flag, bukan cancel: di Python 3.11 cancel yang bertabrakan dengan timeout
+            # wait_for bisa berubah jadi TimeoutError dan loop tidak pernah berhenti
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    @staticmethod
+    def _is_group_chat(chat_key: str) -> bool:
+        return chat_key.startswith('@') or chat_key.startswith('-')
+
+    def use_shared_budget(self, global_bucket: SharedTokenBucket, group_slots: list) -> None:
+        """Draw the global and group/channel budgets from buckets shared with the other worker processes"""
+        # Chat privat tidak perlu dibagi: semua update satu user masuk ke worker yang sama
+        self._global = global_bucket
+        self._group_slots = group_slots
+
+    def _bucket(self, chat_key: str) -> TokenBucket:
+        if self._group_slots and self._is_group_chat(chat_key):
+            # crc32, bukan hash(): hash string diacak per proses
+            return self._group_slots[zlib.crc32(chat_key.encode()) % len(self._group_slots)]
+        bucket = self._chats.get(chat_key)
+        if bucket is None:
+            if self._is_group_chat(chat_key):
+                bucket = TokenBucket(OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(OUTBOUND_PRIVATE_RATE, OUTBOUND_PRIVATE_BURST)
+            self._chats[chat_key] = bucket
+        return bucket
+
+    @staticmethod
+    def classify(endpoint: str, chat_key: str) -> int:
+        if endpoint == 'editMessageCaption':
+            return PRIORITY_VOTE_EDIT
+        if chat_key in (str(CHANNEL_ID), str(CHANNEL_NUMERIC_ID)):
+            return PRIORITY_CHANNEL_POST
+        return PRIORITY_REPLY
+
+    def queue_depths(self) -> dict:
+        depths = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._waiting:
+            if not future.done():
+                depths[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        for _, priority, _, _, future in self._blocked:
+            if not future.done():
+                depths[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return depths
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        # Semua method kecuali getUpdates lewat sini, jadi latency dan error tiap method diukur di sini
+        start = time.perf_counter()
+        try:
+            return await self._schedule(callback, args, kwargs, endpoint, data, rate_limit_args)
+        except Exception as e:
+            metrics.inc('menfes_bot_api_errors_total', (('method', endpoint), ('type', type(e).__name__)))
+            raise
+        finally:
+            metrics.observe('menfes_bot_api_duration_seconds', (('method', endpoint),), time.perf_counter() - start)
+
+    async def _schedule(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if 'chat_id' not in data or not endpoint.startswith(self.LIMITED_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        chat_key = str(data['chat_id'])
+        priority = (rate_limit_args or {}).get('priority', self.classify(endpoint, chat_key))
+        queue_labels = (('priority', PRIORITY_NAMES.get(priority, str(priority))),)
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.perf_counter()
+            await self._acquire(priority, chat_key)
+            metrics.observe('menfes_bot_api_queue_seconds', queue_labels, time.perf_counter() - queued_at)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after_hits += 1
+                if attempt >= self.max_retries:
+                    raise
+                # Tahan semua request ke chat ini sampai waktu yang diminta Telegram lewat
+                self._bucket(chat_key).paused_until = time.monotonic() + e.retry_after
+                logger.warning(f"RetryAfter {e.retry_after}s on {endpoint} to {chat_key}, retry {attempt + 1}/{self.max_retries}")
+
+    async def _acquire(self, priority: int, chat_key: str) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiting, (priority, self._seq, chat_key, future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self) -> None:
+        while not self._stopping:
+            sleep_for = self._release_next(time.monotonic())
+            if sleep_for == 0:
+                continue
+            # Tunggu sampai ada token, atau sampai ada request baru yang mungkin bisa langsung jalan
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release_next(self, now: float):
+        """Release the highest-priority waiting request whose chat has a token.
+
+        Returns 0 if a request was released, otherwise the seconds until one could be
+        (None when nothing is waiting).
+        """
+        if now >= self._next_prune:
+            self._prune_buckets(now)
+        # Request yang chat-nya sudah punya token lagi kembali ke antrian prioritas
+        while self._blocked and self._blocked[0][0] <= now:
+            heapq.heappush(self._waiting, self._blocked[0][1:])
+            heapq.heappop(self._blocked)
+        if not self._waiting:
+            return self._blocked[0][0] - now if self._blocked else None
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return global_delay
+
+        while self._waiting:
+            priority, seq, chat_key, future = self._waiting[0]
+            if future.done():
+                # Pemanggil sudah dibatalkan
+                heapq.heappop(self._waiting)
+                continue
+            bucket = self._bucket(chat_key)
+            delay = bucket.delay(now)
+            heapq.heappop(self._waiting)
+            if delay <= 0:
+                bucket.consume()
+                self._global.consume()
+                self.dispatched += 1
+                future.set_result(None)
+                return 0
+            # Chat ini belum punya token: diparkir supaya tidak dipindai ulang di tiap release
+            heapq.heappush(self._blocked, (now + delay, priority, seq, chat_key, future))
+        return self._blocked[0][0] - now if self._blocked else None
+
+    def _prune_buckets(self, now: float) -> None:
+        """Forget buckets of chats that are idle (bucket full again) so memory stays bounded"""
+        self._next_prune = now + 60
+        busy = {chat_key for _, _, chat_key, _ in self._waiting}
+        busy.update(entry[3] for entry in self._blocked)
+        idle = [
+            chat_key for chat_key, bucket in self._chats.items()
+            if chat_key not in busy and bucket.delay(now) <= 0 and bucket.tokens >= bucket.capacity
+        ]
+        for chat_key in idle:
+            del self._chats[chat_key]
+
+    def stats_text(self) -> str:
+        depths = ", ".join(f"{name}: {count}" for name, count in self.queue_depths().items())
+        return (
+            f"• Antrian: {depths}\n"
+            f"• Terkirim: {self.dispatched} | RetryAfter: {self.retry_after_hits}"
+        )
+
+outbound_scheduler = OutboundScheduler()
+
+class AdminLogSink:
+    """Queue admin log events and deliver them to ADMIN_ID as periodic digest messages"""
+
+    def __init__(self, interval: float = LOG_DIGEST_INTERVAL, max_events: int = LOG_DIGEST_MAX_EVENTS,
+                 max_queue: int = LOG_QUEUE_SIZE):
+        self.interval = interval
+        self.max_events = max_events
+        self._events = deque(maxlen=max_queue)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._bot = None
+        self._outbox = None  # multiprocessing queue to worker 0 when this worker doesn't send digests itself
+        self._inbox = None  # multiprocessing queue worker 0 drains events of the other workers from
+        self.dropped = 0
+        self.sent_messages = 0
+
+    def forward_to(self, outbox) -> None:
+        """Worker mode: hand events to worker 0 instead of sending a digest from this process"""
+        self._outbox = outbox
+
+    def collect_from(self, inbox) -> None:
+        """Worker mode: also include events forwarded by the other workers in this process's digest"""
+        self._inbox = inbox
+
+    def enqueue(self, message: str, is_error: bool = False) -> None:
+        """Queue an event; never waits on delivery"""
+        prefix = "❌ ERROR: " if is_error else "ℹ️ INFO: "
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] {prefix}{message}"
+        if self._outbox is not None:
+            try:
+                self._outbox.put_nowait((line, is_error))
+            except queue.Full:
+                self.dropped += 1
+            return
+        self._append(line, is_error)
+
+    def _append(self, line: str, is_error: bool) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(line)
+        # Error dikirim segera, event biasa menunggu interval atau sampai antrian cukup banyak
+        if is_error or len(self._events) >= self.max_events:
+            self._wakeup.set()
+
+    def _drain_inbox(self) -> None:
+        while self._inbox is not None:
+            try:
+                line, is_error = self._inbox.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                break
+            self._append(line, is_error)
+
+    def start(self, bot: Bot) -> None:
+        if self._outbox is not None:
+            return
+        self._bot = bot
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and deliver whatever is still queued"""
+        if self._task:
+            # Flag + wakeup, bukan cancel (lihat OutboundScheduler.shutdown)
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self._drain_inbox()
+        await self.flush()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.interval
+        while not self._stopping:
+            # Event dari worker lain diambil tiap detik, digest tetap dikirim per interval (error segera)
+            timeout = deadline - loop.time()
+            if self._inbox is not None:
+                timeout = min(timeout, 1)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0, timeout))
+            except asyncio.TimeoutError:
+                pass
+            self._drain_inbox()
+            if self._wakeup.is_set() or loop.time() >= deadline:
+                self._wakeup.clear()
+                await self.flush()
+                deadline = loop.time() + self.interval
+
+    async def flush(self) -> None:
+        if not self._events or self._bot is None:
+            return
+        events = list(self._events)
+        self._events.clear()
+        header = f"📋 LOG DIGEST ({len(events)} event)"
+        if self.dropped:
+            header += f" - {self.dropped} event lama dibuang karena antrian penuh"
+            self.dropped = 0
+        for chunk in split_message(header + "\n\n" + "\n".join(events)):
+            try:
+                await self._bot.send_message(
+                    ADMIN_ID,
+                    chunk,
+                    disable_web_page_preview=True,
+                    rate_limit_args={'priority': PRIORITY_ADMIN_LOG}
+                )
+                self.sent_messages += 1
+            except Exception as e:
+                logger.error(f"Failed to send log digest: {e}")
+
+admin_log_sink = AdminLogSink()
+
+async def send_log(context: ContextTypes.DEFAULT_TYPE, message: str, is_error: bool = False, event: str = None):
+    """Queue a log message for the admin digest"""
+    try:
+        admin_log_sink.enqueue(message, is_error)
+        if is_error:
+            # send_log(..., True) dipanggil dari blok except, jadi tipe exception-nya masih bisa dibaca
+            exc_type = sys.exc_info()[0]
+            error_type = exc_type.__name__ if exc_type else 'logged'
+            metrics.inc('menfes_handler_errors_total', (('handler', current_handler.get()), ('type', error_type)))
+            current_outcome.set(f"error:{error_type}")
+            logger.error(message, extra={'event': event})
+        else:
+            # event dipakai LOG_SAMPLE_RATES untuk menyaring log bervolume tinggi
+            logger.info(message, extra={'event': event})
+    except Exception as e:
+        logger.error(f"Failed to queue log: {e}")
+
+class StateStore:
+    """SQLite (WAL) persistence; writes are queued and group-committed by a background thread"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cooldowns (
+            user_id INTEGER PRIMARY KEY,
+            last_sent REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_cooldowns_last_sent ON cooldowns (last_sent);
+
+        CREATE TABLE IF NOT EXISTS posts (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            sender_id INTEGER,
+            caption TEXT NOT NULL,
+            posted_at REAL NOT NULL,
+            likes INTEGER NOT NULL DEFAULT 0,
+            dislikes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, message_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_posts_posted_at ON posts (posted_at);
+        CREATE INDEX IF NOT EXISTS idx_posts_score ON posts (likes - dislikes);
+
+        CREATE TABLE IF NOT EXISTS votes (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            is_like INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, message_id, user_id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS bans (
+            user_id INTEGER PRIMARY KEY,
+            reason TEXT,
+            banned_by INTEGER,
+            banned_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            chat_id INTEGER,
+            message_id INTEGER,
+            duration INTEGER,
+            caption TEXT,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_submissions_user ON submissions (user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_submissions_created_at ON submissions (created_at);
+
+        CREATE TABLE IF NOT EXISTS moderation (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            file_id TEXT NOT NULL,
+            duration INTEGER,
+            caption TEXT,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            reviewed_at REAL,
+            chat_id INTEGER,
+            message_id INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_moderation_status ON moderation (status, id);
+
+        CREATE TABLE IF NOT EXISTS published_videos (
+            file_unique_id TEXT PRIMARY KEY,
+            published_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_published_videos_published_at ON published_videos (published_at);
+
+        CREATE TABLE IF NOT EXISTS roster (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            is_member INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_roster_updated_at ON roster (updated_at);
+    """
+
+    def __init__(self, path: str, batch_size: int = STATE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self.committed = 0
+        self.batches = 0
+        self.failed = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def open(self) -> None:
+        """Create the schema and start the writer thread"""
+        conn = self._connect()
+        try:
+            conn.executescript(self.SCHEMA)
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._writer, name='state-writer', daemon=True)
+        self._thread.start()
+        logger.info(f"State database opened: {self.path}")
+
+    def close(self) -> None:
+        """Commit everything still queued and stop the writer thread (blocking)"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def write(self, sql: str, params=()) -> None:
+        """Queue a write; never blocks on disk I/O"""
+        self._queue.put((sql, params))
+
+    def query(self, sql: str, params=()):
+        """Run a read on a short-lived connection (startup and admin use, not per update)"""
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _writer(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                # Group commit: semua write yang sudah antri ikut dalam satu transaksi
+                batch = [item]
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                try:
+                    self._commit(conn, batch)
+                except Exception:
+                    # Thread writer harus tetap hidup; batch ini dihitung gagal
+                    self.failed += len(batch)
+                    logger.exception(f"State writer dropped a batch of {len(batch)} write(s)")
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch) -> None:
+        try:
+            conn.execute("BEGIN")
+            for sql, params in batch:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+            self.committed += len(batch)
+            self.batches += 1
+            return
+        except sqlite3.Error as e:
+            # BEGIN yang gagal (mis. "database is locked") tidak membuka transaksi; ROLLBACK di sini
+            # akan melempar lagi dan mematikan thread writer tanpa jejak
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error as rollback_error:
+                    logger.error(f"State batch rollback failed: {rollback_error}")
+            logger.error(f"State batch of {len(batch)} write(s) failed, retrying one by one: {e}")
+        # Satu statement rusak tidak boleh membuang seluruh batch
+        for sql, params in batch:
+            try:
+                conn.execute(sql, params)
+                self.committed += 1
+            except sqlite3.Error as e:
+                self.failed += 1
+                logger.error(f"State write failed ({sql.split()[0]}): {e}")
+
+    # Write helpers
+    def save_cooldown(self, user_id: int, last_sent: float) -> None:
+        self.write(
+            "INSERT INTO cooldowns (user_id, last_sent) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET last_sent = excluded.last_sent",
+            (user_id, last_sent)
+        )
+
+    def save_post(self, chat_id: int, message_id: int, sender_id, caption: str, posted_at: float,
+                  likes: int = 0, dislikes: int = 0) -> None:
+        self.write(
+            "INSERT OR IGNORE INTO posts (chat_id, message_id, sender_id, caption, posted_at, likes, dislikes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (chat_id, message_id, int(sender_id) if str(sender_id).isdigit() else None, caption, posted_at, likes, dislikes)
+        )
+
+    def save_vote(self, chat_id: int, message_id: int, user_id: int, is_like: bool, likes: int, dislikes: int) -> None:
+        self.write(
+            "INSERT INTO votes (chat_id, message_id, user_id, is_like) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id, message_id, user_id) DO UPDATE SET is_like = excluded.is_like",
+            (chat_id, message_id, user_id, int(is_like))
+        )
+        self.write(
+            "UPDATE posts SET likes = ?, dislikes = ? WHERE chat_id = ? AND message_id = ?",
+            (likes, dislikes, chat_id, message_id)
+        )
+
+    def delete_cooldown(self, user_id: int) -> None:
+        self.write("DELETE FROM cooldowns WHERE user_id = ?", (user_id,))
+
+    def save_ban(self, user_id: int, reason: str, banned_by: int) -> None:
+        self.write(
+            "INSERT OR REPLACE INTO bans (user_id, reason, banned_by, banned_at) VALUES (?, ?, ?, ?)",
+            (user_id, reason, banned_by, time.time())
+        )
+
+    def save_submission(self, user_id: int, username: str, chat_id: int, message_id: int, duration: int, caption: str) -> None:
+        self.write(
+            "INSERT INTO submissions (user_id, username, chat_id, message_id, duration, caption, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, username, chat_id, message_id, duration, caption, time.time())
+        )
+
+    def save_moderation_item(self, item) -> None:
+        self.write(
+            "INSERT INTO moderation (id, user_id, username, file_id, duration, caption, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (item.id, item.user_id, item.username, item.file_id, item.duration, item.caption, item.status, item.created_at)
+        )
+
+    def save_moderation_status(self, item_id: int, status: str, chat_id: int = None, message_id: int = None) -> None:
+        self.write(
+            "UPDATE moderation SET status = ?, reviewed_at = COALESCE(reviewed_at, ?), "
+            "chat_id = COALESCE(?, chat_id), message_id = COALESCE(?, message_id) WHERE id = ?",
+            (status, time.time(), chat_id, message_id, item_id)
+        )
+
+    def save_published_video(self, file_unique_id: str, published_at: float) -> None:
+        self.write(
+            "INSERT OR REPLACE INTO published_videos (file_unique_id, published_at) VALUES (?, ?)",
+            (file_unique_id, published_at)
+        )
+
+    def save_roster_entry(self, chat_id: int, user_id: int, is_member: bool, updated_at: float) -> None:
+        self.write(
+            "INSERT INTO roster (chat_id, user_id, is_member, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id, user_id) DO UPDATE SET is_member = excluded.is_member, updated_at = excluded.updated_at",
+            (chat_id, user_id, int(is_member), updated_at)
+        )
+
+    def sweep(self, now: float) -> None:
+        """Queue deletion of expired cooldowns, known videos and voters of posts whose voting has closed"""
+        self.write("DELETE FROM cooldowns WHERE last_sent < ?", (now - COOLDOWN_TIME,))
+        self.write("DELETE FROM published_videos WHERE published_at < ?", (now - DUPLICATE_RETENTION,))
+        self.write(
+            "DELETE FROM votes WHERE (chat_id, message_id) IN "
+            "(SELECT chat_id, message_id FROM posts WHERE posted_at < ?)",
+            (now - VOTE_RETENTION,)
+        )
+
+    def stats_text(self) -> str:
+        return (
+            f"• Write antri: {self.pending()} | Tersimpan: {self.committed}\n"
+            f"• Batch commit: {self.batches} | Gagal: {self.failed}"
+        )
+
+state_store = StateStore(STATE_DB_FILE)
+
+def load_state() -> None:
+    """Restore cooldowns and open vote tallies from the state database"""
+    now = time.time()
+    # Di mode worker tiap proses hanya butuh cooldown user di shard-nya (lihat route_update)
+    shard_sql, shard_params = ("", ()) if worker_index is None else (" AND user_id % ? = ?", (WORKER_PROCESSES, worker_index))
+    for user_id, last_sent in state_store.query(
+        f"SELECT user_id, last_sent FROM cooldowns WHERE last_sent >= ?{shard_sql}", (now - COOLDOWN_TIME, *shard_params)
+    ):
+        last_message_time[user_id] = last_sent
+
+    known_videos = state_store.query(
+        "SELECT file_unique_id, published_at FROM published_videos WHERE published_at >= ? ORDER BY published_at",
+        (now - DUPLICATE_RETENTION,)
+    )
+    duplicate_index.load(known_videos)
+    roster_entries = member_roster.load() if MEMBER_ROSTER else 0
+    if worker_index not in (None, 0):
+        # Vote, leaderboard dan moderasi hanya hidup di worker 0
+        logger.info(
+            f"State restored: {len(last_message_time)} cooldown(s), {len(known_videos)} known video(s), "
+            f"{roster_entries} roster entr(ies)"
+        )
+        return
+
+    min_posted_at = now - VOTE_RETENTION
+    posts = state_store.query(
+        "SELECT chat_id, message_id, sender_id, caption, posted_at, likes, dislikes "
+        "FROM posts WHERE posted_at >= ? ORDER BY posted_at",
+        (min_posted_at,)
+    )
+    votes = state_store.query(
+        "SELECT v.chat_id, v.message_id, v.user_id, v.is_like FROM votes v "
+        "JOIN posts p ON p.chat_id = v.chat_id AND p.message_id = v.message_id "
+        "WHERE p.posted_at >= ?",
+        (min_posted_at,)
+    )
+    vote_store.load(posts, votes)
+
+    # Post lama cukup diambil yang skornya tertinggi (idx_posts_score), sisanya tidak pernah masuk leaderboard lagi
+    leaderboard_cutoff = now - leaderboard.max_age
+    leaderboard.load(
+        state_store.query(
+            "SELECT chat_id, message_id, caption, posted_at, likes, dislikes FROM posts "
+            "WHERE posted_at >= ? AND (likes > 0 OR dislikes > 0)",
+            (leaderboard_cutoff,)
+        ),
+        state_store.query(
+            "SELECT chat_id, message_id, caption, posted_at, likes, dislikes FROM posts "
+            "WHERE posted_at < ? ORDER BY likes - dislikes DESC, likes DESC LIMIT ?",
+            (leaderboard_cutoff, leaderboard.size)
+        )
+    )
+
+    # Video yang belum diputuskan atau belum terposting tetap di antrian setelah restart
+    moderation_rows = state_store.query(
+        "SELECT id, user_id, username, file_id, duration, caption, status, created_at "
+        "FROM moderation WHERE status IN ('pending', 'approved') ORDER BY id"
+    )
+    max_moderation_id = state_store.query("SELECT COALESCE(MAX(id), 0) FROM moderation")[0][0]
+    moderation_queue.load(moderation_rows, max_moderation_id)
+    logger.info(
+        f"State restored: {len(last_message_time)} cooldown(s), {len(posts)} post(s), {len(votes)} vote(s), "
+        f"{len(moderation_rows)} moderation item(s), {len(known_videos)} known video(s), "
+        f"{roster_entries} roster entr(ies)"
+    )
+
+def set_cooldown(user_id: int, now: float) -> None:
+    last_message_time[user_id] = now
+    state_store.save_cooldown(user_id, now)
+
+def sweep_expired_state() -> None:
+    """Evict expired cooldowns and closed posts from memory and the database"""
+    now = time.time()
+    expired = [user_id for user_id, sent_at in last_message_time.items() if now - sent_at >= COOLDOWN_TIME]
+    for user_id in expired:
+        del last_message_time[user_id]
+    vote_store.prune()
+    leaderboard.prune()
+    duplicate_index.prune()
+    if worker_index in (None, 0):
+        # Database dipakai bersama semua worker, cukup satu yang menghapus baris kedaluwarsa
+        state_store.sweep(now)
+    if expired:
+        logger.info(f"Cooldown sweep removed {len(expired)} expired entr(y/ies)")
+
+async def state_sweeper() -> None:
+    while True:
+        await asyncio.sleep(STATE_SWEEP_INTERVAL)
+        try:
+            sweep_expired_state()
+            await duplicate_index.rebuild_filter()
+        except Exception as e:
+            logger.error(f"State sweep failed: {e}")
+
+class MembershipFetchAbandoned(Exception):
+    """The caller running a coalesced membership fetch was cancelled before it finished"""
+
+class MembershipCache:
+    """LRU cache of membership results keyed by (chat, user) with request coalescing"""
+
+    def __init__(self, positive_ttl: float = MEMBERSHIP_CACHE_TTL, negative_ttl: float = MEMBERSHIP_NEGATIVE_TTL,
+                 stale_ttl: float = MEMBERSHIP_STALE_TTL, max_size: int = MEMBERSHIP_CACHE_SIZE):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (is_member, checked_at)
+        self._inflight = {}  # key -> Future shared by concurrent checks
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key, is_member: bool) -> None:
+        self._entries[key] = (is_member, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def peek_stale_positive(self, key) -> bool:
+        """True if key has a positive result young enough to serve while Telegram is unresponsive"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] and time.monotonic() - entry[1] < self.stale_ttl:
+            self.stale_hits += 1
+            return True
+        return False
+
+    async def get(self, key, fetch) -> bool:
+        """Return the cached result for key, or await fetch() once for all concurrent callers"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            is_member, checked_at = entry
+            ttl = self.positive_ttl if is_member else self.negative_ttl
+            if time.monotonic() - checked_at < ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return is_member
+
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except MembershipFetchAbandoned:
+                # Pemilik fetch dibatalkan: waiter pertama yang bangun menjalankan fetch-nya sendiri, sisanya ikut
+                self.coalesced -= 1
+                inflight = self._inflight.get(key)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            is_member = await fetch()
+        except asyncio.CancelledError:
+            # Jangan cancel future bersama: waiter akan ikut menerima CancelledError padahal mereka tidak dibatalkan
+            future.set_exception(MembershipFetchAbandoned(key))
+            future.exception()
+            raise
+        except Exception as e:
+            self.errors += 1
+            # Telegram error/timeout: pakai hasil positif lama kalau masih dalam batas stale
+            if entry is not None and entry[0] and time.monotonic() - entry[1] < self.stale_ttl:
+                self.stale_hits += 1
+                logger.warning(f"Membership check for {key} failed ({e}), serving cached positive result")
+                future.set_result(True)
+                return True
+            future.set_exception(e)
+            # Tandai exception sudah diambil supaya asyncio tidak memberi warning saat tidak ada yang menunggu
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self._store(key, is_member)
+        future.set_result(is_member)
+        return is_member
+
+    def stats_text(self) -> str:
+        lookups = self.hits + self.misses + self.coalesced
+        hit_rate = (self.hits + self.coalesced) / lookups * 100 if lookups else 0.0
+        return (
+            f"• Entri: {len(self._entries)}/{self.max_size}\n"
+            f"• Hit: {self.hits} | Miss: {self.misses} | Coalesced: {self.coalesced}\n"
+            f"• Hit rate: {hit_rate:.1f}%\n"
+            f"• Error API: {self.errors} | Stale dipakai: {self.stale_hits}\n"
+            f"• Eviction: {self.evictions}"
+        )
+
+membership_cache = MembershipCache()
+
+MEMBER_STATUSES = ('creator', 'administrator', 'member')
+
+class MemberRoster:
+    """Channel and group members tracked locally from chat_member updates, persisted in the state database"""
+
+    def __init__(self, reconcile_interval: float = ROSTER_RECONCILE_INTERVAL, max_age: float = ROSTER_RECONCILE_MAX_AGE,
+                 batch_size: int = ROSTER_RECONCILE_BATCH, rate: float = ROSTER_RECONCILE_RATE):
+        self.reconcile_interval = reconcile_interval
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.rate = rate
+        self._members = {}  # chat_id -> set of user ids currently in the chat
+        self._non_members = {}  # chat_id -> set of user ids that left, were banned or were checked as not joined
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._bot = None
+        self._synced_at = 0.0  # updated_at up to which this worker has read the roster table
+        self.hits = 0
+        self.fallbacks = 0
+        self.updates = 0
+        self.reconciled = 0
+        self.corrected = 0
+        self.reconcile_errors = 0
+
+    def __len__(self) -> int:
+        return sum(len(members) for members in self._members.values())
+
+    @staticmethod
+    def _chat(chat_id):
+        """Numeric ID of the channel/group chat_id refers to, None for chats the roster doesn't track"""
+        if chat_id == CHANNEL_ID:
+            chat_id = CHANNEL_NUMERIC_ID
+        elif chat_id == f"@{GROUP_USERNAME}":
+            chat_id = GROUP_ID
+        # ID numerik belum ter-resolve saat startup: sementara semua cek jatuh ke API
+        if chat_id is None or chat_id not in (CHANNEL_NUMERIC_ID, GROUP_ID):
+            return None
+        return chat_id
+
+    def _set(self, chat_id: int, user_id: int, is_member: bool):
+        """Update the in-memory sets, returns the previous state (None if the user was unknown)"""
+        members = self._members.setdefault(chat_id, set())
+        non_members = self._non_members.setdefault(chat_id, set())
+        previous = True if user_id in members else (False if user_id in non_members else None)
+        if is_member:
+            members.add(user_id)
+            non_members.discard(user_id)
+        else:
+            non_members.add(user_id)
+            members.discard(user_id)
+        return previous
+
+    def _shard_filter(self):
+        # Di mode worker tiap proses hanya memegang user di shard-nya (lihat route_update)
+        if worker_index is None:
+            return "", ()
+        return " AND user_id % ? = ?", (WORKER_PROCESSES, worker_index)
+
+    @staticmethod
+    def _owns(user_id: int) -> bool:
+        return worker_index is None or user_id % WORKER_PROCESSES == worker_index
+
+    def load(self) -> int:
+        """Fill the roster from the state database, returns the number of entries"""
+        shard_sql, shard_params = self._shard_filter()
+        self._synced_at = time.time()
+        rows = state_store.query(f"SELECT chat_id, user_id, is_member FROM roster WHERE 1{shard_sql}", shard_params)
+        for chat_id, user_id, is_member in rows:
+            self._set(chat_id, user_id, bool(is_member))
+        return len(rows)
+
+    def record(self, chat_id, user_id: int, is_member: bool):
+        """Store a membership state seen from Telegram, returns the previous state"""
+        chat_id = self._chat(chat_id)
+        if chat_id is None:
+            return None
+        state_store.save_roster_entry(chat_id, user_id, is_member, time.time())
+        if not self._owns(user_id):
+            # Hasil rekonsiliasi worker 0 untuk user shard lain: cukup ke database, dibaca pemiliknya lewat sync()
+            return None
+        return self._set(chat_id, user_id, is_member)
+
+    def lookup(self, chat_id, user_id: int):
+        """True/False if the roster knows the user, None if the caller must ask Telegram"""
+        chat_id = self._chat(chat_id)
+        if chat_id is not None:
+            if user_id in self._members.get(chat_id, ()):
+                self.hits += 1
+                return True
+            if user_id in self._non_members.get(chat_id, ()):
+                self.hits += 1
+                return False
+        self.fallbacks += 1
+        return None
+
+    def apply(self, change) -> None:
+        """Apply a ChatMemberUpdated (join, leave, ban, promotion) to the roster"""
+        new_member = change.new_chat_member
+        if self._chat(change.chat.id) is None:
+            return
+        self.updates += 1
+        self.record(change.chat.id, new_member.user.id, new_member.status in MEMBER_STATUSES)
+
+    def start(self, bot: Bot) -> None:
+        if not MEMBER_ROSTER:
+            return
+        self._bot = bot
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._reconcile_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Flag + wakeup, bukan cancel (lihat OutboundScheduler.shutdown)
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _reconcile_loop(self) -> None:
+        while not self._stopping:
+            await self._wait(self.reconcile_interval)
+            if self._stopping:
+                break
+            try:
+                # Di mode worker hanya worker 0 yang memanggil getChatMember; worker lain membaca hasilnya dari database
+                if worker_index in (None, 0):
+                    await self.reconcile()
+                else:
+                    await self.sync()
+            except Exception as e:
+                logger.error(f"Roster reconciliation failed: {e}")
+
+    async def sync(self) -> None:
+        """Apply roster rows of this worker's shard written by other workers since the last sync"""
+        shard_sql, shard_params = self._shard_filter()
+        # Jendela satu menit ke belakang: baris yang di-commit writer thread lebih lambat dari timestamp-nya tetap terbaca
+        rows = await asyncio.to_thread(
+            state_store.query,
+            f"SELECT chat_id, user_id, is_member, updated_at FROM roster WHERE updated_at > ?{shard_sql} ORDER BY updated_at",
+            (self._synced_at - 60, *shard_params)
+        )
+        for chat_id, user_id, is_member, updated_at in rows:
+            self._set(chat_id, user_id, bool(is_member))
+            self._synced_at = max(self._synced_at, updated_at)
+
+    async def reconcile(self) -> None:
+        """Re-check the oldest entries with getChatMember to repair updates missed while the bot was down"""
+        rows = await asyncio.to_thread(
+            state_store.query,
+            "SELECT chat_id, user_id, is_member FROM roster WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+            (time.time() - self.max_age, self.batch_size)
+        )
+        corrected = 0
+        for chat_id, user_id, was_member in rows:
+            if self._stopping:
+                break
+            if self._chat(chat_id) is None:
+                continue
+            try:
+                chat_member = await self._bot.get_chat_member(chat_id, user_id)
+                is_member = chat_member.status in MEMBER_STATUSES
+            except Exception as e:
+                # Tetap pakai status lama; timestamp diperbarui supaya entri ini tidak menyumbat ronde berikutnya
+                self.reconcile_errors += 1
+                logger.warning(f"Roster re-check of user {user_id} in {chat_id} failed: {e}")
+                is_member = bool(was_member)
+            else:
+                self.reconciled += 1
+                if is_member != bool(was_member):
+                    corrected += 1
+            self.record(chat_id, user_id, is_member)
+            # getChatMember tidak lewat OutboundScheduler, jadi laju dibatasi di sini
+            await self._wait(1 / self.rate)
+        self.corrected += corrected
+        if rows:
+            logger.info(f"Roster reconciled {len(rows)} entr(ies), {corrected} corrected")
+
+    def stats_text(self) -> str:
+        if not MEMBER_ROSTER:
+            return "• Nonaktif (MEMBER_ROSTER = False)"
+        lookups = self.hits + self.fallbacks
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        non_members = sum(len(users) for users in self._non_members.values())
+        return (
+            f"• Anggota dikenal: {len(self)} | Bukan anggota: {non_members}\n"
+            f"• Hit: {self.hits} | Fallback API: {self.fallbacks} | Hit rate: {hit_rate:.1f}%\n"
+            f"• Update chat_member: {self.updates}\n"
+            f"• Rekonsiliasi: {self.reconciled} (dikoreksi {self.corrected}, error {self.reconcile_errors})"
+        )
+
+member_roster = MemberRoster()
+
+def _membership_cache_key(chat_id, user_id: int):
+    """Normalize the different ways a chat is referenced so they share one cache entry"""
+    if chat_id == CHANNEL_ID or (CHANNEL_NUMERIC_ID is not None and chat_id == CHANNEL_NUMERIC_ID):
+        return (CHANNEL_ID, user_id)
+    # GROUP_ID masih None kalau belum ter-resolve saat startup
+    if chat_id is None or chat_id == GROUP_ID or chat_id == f"@{GROUP_USERNAME}":
+        return (f"@{GROUP_USERNAME}", user_id)
+    return (chat_id, user_id)
+
+async def _get_member_status(context: ContextTypes.DEFAULT_TYPE, chat_id, user_id: int) -> bool:
+    chat_member = await context.bot.get_chat_member(chat_id, user_id)
+    status = chat_member.status
+    is_member = status in MEMBER_STATUSES
+    logger.info(f"Membership check for user {user_id} in {chat_id}: {is_member} (status: {status})")
+    return is_member
+
+async def _fetch_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id, retry_with_username=False, chat_username=None) -> bool:
+    """Ask Telegram whether user is a member of a chat, raises if every attempt failed"""
+    fallback_chat = f"@{chat_username}" if retry_with_username and chat_username else None
+    if chat_id is None or fallback_chat in (None, chat_id):
+        # ID numerik belum ter-resolve atau tidak ada alternatif, cukup satu request
+        return await _get_member_status(context, chat_id if chat_id is not None else fallback_chat, user_id)
+
+    # Coba dengan ID numerik terlebih dahulu. Kalau gagal atau lambat, jalankan request via username
+    # secara paralel (hedged request) dan pakai hasil sukses yang pertama
+    tasks = [asyncio.create_task(_get_member_status(context, chat_id, user_id))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=MEMBERSHIP_HEDGE_DELAY)
+        last_error = None
+        if done:
+            last_error = tasks[0].exception()
+            if last_error is None:
+                return tasks[0].result()
+            logger.info(f"Retrying membership check with username {fallback_chat} after error: {last_error}")
+        else:
+            logger.info(f"Membership check in {chat_id} is slow, hedging with username {fallback_chat}")
+
+        tasks.append(asyncio.create_task(_get_member_status(context, fallback_chat, user_id)))
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def check_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id, retry_with_username=False, chat_username=None) -> bool:
+    """Check if user is a member of a chat with robust error handling"""
+    if MEMBER_ROSTER:
+        # Roster selalu paling baru (diupdate tiap join/leave/ban); Telegram hanya untuk user yang belum pernah terlihat
+        known = member_roster.lookup(chat_id, user_id)
+        if known is not None:
+            return known
+    cache_key = _membership_cache_key(chat_id, user_id)
+
+    async def fetch() -> bool:
+        # Hasil dari worker lain dipakai dulu sebelum bertanya ke Telegram
+        shared = await state_backend.get_membership(cache_key)
+        if shared is not None:
+            return shared
+        is_member = await _fetch_membership(context, user_id, chat_id, retry_with_username, chat_username)
+        await state_backend.set_membership(cache_key, is_member)
+        if MEMBER_ROSTER:
+            member_roster.record(chat_id, user_id, is_member)
+        return is_member
+
+    try:
+        return await membership_cache.get(cache_key, fetch)
+    except Exception as e:
+        # Semua percobaan gagal dan tidak ada hasil cache yang bisa dipakai
+        logger.error(f"Membership check failed for user {user_id} in {chat_id}: {e}")
+        return False
+
+class BlacklistIndex:
+    """In-memory set of banned user IDs, reloaded when the blacklist file changes on disk"""
+
+    def __init__(self, path: str, reload_interval: float = BLACKLIST_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._ids = set()
+        self._file_key = None
+        self._next_check = 0.0
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _stat_key(self):
+        # Inode berubah kalau file diganti (misal via editor atau mv), mtime/size kalau diedit langsung
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _parse_id(line: str):
+        match = re.match(r'\s*(\d+)', line)
+        return int(match.group(1)) if match else None
+
+    def reload(self) -> None:
+        """Rebuild the index from the blacklist file"""
+        # Stat diambil sebelum membaca supaya edit yang terjadi saat membaca tetap terdeteksi
+        file_key = self._stat_key()
+        ids = set()
+        with open(self.path, 'r') as f:
+            for line in f:
+                user_id = self._parse_id(line)
+                if user_id is not None:
+                    ids.add(user_id)
+        self._file_key = file_key
+        self._ids = ids
+        logger.info(f"Blacklist loaded: {len(ids)} user(s)")
+
+    def maybe_reload(self) -> None:
+        """Reload the index if the file's inode, mtime or size changed since the last load"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            if self._stat_key() != self._file_key:
+                self.reload()
+        except FileNotFoundError:
+            logger.warning(f"Blacklist file {self.path} hilang, membuat file baru")
+            open(self.path, 'a').close()
+            self.reload()
+
+    def contains(self, user_id: int) -> bool:
+        self.maybe_reload()
+        return user_id in self._ids
+
+    def add(self, user_id: int) -> bool:
+        """Add a user to the index and the file, returns False if already banned"""
+        if self.contains(user_id):
+            return False
+        with open(self.path, 'a') as f:
+            f.write(f"{user_id}\n")
+        self._ids.add(user_id)
+        self._file_key = self._stat_key()
+        return True
+
+    def import_lines(self, lines) -> int:
+        """Import user IDs from an iterable of lines, returns the number of newly banned users"""
+        self.maybe_reload()
+        added = 0
+        with open(self.path, 'a') as f:
+            for line in lines:
+                user_id = self._parse_id(line)
+                if user_id is None or user_id in self._ids:
+                    continue
+                f.write(f"{user_id}\n")
+                self._ids.add(user_id)
+                added += 1
+        self._file_key = self._stat_key()
+        return added
+
+    def import_file(self, path: str) -> int:
+        """Stream a ban list file (one user ID per line) into the index"""
+        with open(path, 'r', errors='ignore') as f:
+            return self.import_lines(f)
+
+    def export_file(self, path: str) -> int:
+        """Write all banned user IDs to path, returns the number of IDs written"""
+        self.maybe_reload()
+        ids = sorted(self._ids)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for user_id in ids:
+                f.write(f"{user_id}\n")
+        os.replace(tmp_path, path)
+        return len(ids)
+
+blacklist_index = BlacklistIndex(BLACKLIST_FILE)
+
+async def is_user_blacklisted(user_id: int) -> bool:
+    """Check if user is blacklisted"""
+    try:
+        return await state_backend.is_banned(user_id)
+    except Exception as e:
+        logger.error(f"Error checking blacklist: {e}")
+        return False
+
+async def add_user_to_blacklist(user_id: int) -> bool:
+    """Add user to blacklist"""
+    try:
+        return await state_backend.add_ban(user_id)
+    except Exception as e:
+        logger.error(f"Error adding user to blacklist: {e}")
+        return False
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings; may report false positives, never false negatives"""
+
+    __slots__ = ('bits', 'size', 'hashes')
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: k posisi dari dua hash 64-bit
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class DuplicateIndex:
+    """Recently accepted videos by file_unique_id: LRU in memory, Bloom filter in front of the database"""
+
+    def __init__(self, retention: float = DUPLICATE_RETENTION, max_recent: int = DUPLICATE_CACHE_SIZE,
+                 capacity: int = DUPLICATE_FILTER_CAPACITY, error_rate: float = DUPLICATE_FILTER_ERROR_RATE):
+        self.retention = retention
+        self.max_recent = max_recent
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._recent = OrderedDict()  # file_unique_id -> accepted_at
+        self._filter = BloomFilter(capacity, error_rate)
+        # False di mode worker: video yang diterima worker lain hanya ada di database, bukan di filter ini
+        self.filter_authoritative = True
+        self.caught = 0
+        self.db_lookups = 0
+        self.false_positives = 0
+
+    def _remember(self, file_unique_id: str, accepted_at: float) -> None:
+        self._recent[file_unique_id] = accepted_at
+        self._recent.move_to_end(file_unique_id)
+        while len(self._recent) > self.max_recent:
+            # Yang tergeser dari LRU tetap ada di Bloom filter dan database
+            self._recent.popitem(last=False)
+
+    def load(self, rows) -> None:
+        """Fill the index from (file_unique_id, accepted_at) rows, oldest first"""
+        for file_unique_id, accepted_at in rows:
+            self._filter.add(file_unique_id)
+            self._remember(file_unique_id, accepted_at)
+
+    def add(self, file_unique_id: str, now: float) -> None:
+        self._filter.add(file_unique_id)
+        self._remember(file_unique_id, now)
+        state_store.save_published_video(file_unique_id, now)
+
+    async def is_duplicate(self, file_unique_id: str) -> bool:
+        """True if the video was accepted within the retention window; only touches the local database"""
+        now = time.time()
+        accepted_at = self._recent.get(file_unique_id)
+        if accepted_at is None:
+            in_filter = file_unique_id in self._filter
+            if not in_filter and self.filter_authoritative:
+                return False
+            # Mungkin sudah tergeser dari LRU: pastikan di database (bisa juga false positive Bloom filter)
+            self.db_lookups += 1
+            rows = await asyncio.to_thread(
+                state_store.query, "SELECT published_at FROM published_videos WHERE file_unique_id = ?", (file_unique_id,)
+            )
+            if not rows:
+                if in_filter:
+                    self.false_positives += 1
+                return False
+            accepted_at = rows[0][0]
+            self._remember(file_unique_id, accepted_at)
+        if now - accepted_at >= self.retention:
+            return False
+        self._recent.move_to_end(file_unique_id)
+        self.caught += 1
+        return True
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.retention
+        expired = [file_unique_id for file_unique_id, accepted_at in self._recent.items() if accepted_at < cutoff]
+        for file_unique_id in expired:
+            del self._recent[file_unique_id]
+
+    async def rebuild_filter(self) -> None:
+        """Rebuild the Bloom filter from the database so expired videos stop producing lookups"""
+        cutoff = time.time() - self.retention
+
+        def build() -> BloomFilter:
+            bloom = BloomFilter(self.capacity, self.error_rate)
+            for (file_unique_id,) in state_store.query(
+                "SELECT file_unique_id FROM published_videos WHERE published_at >= ?", (cutoff,)
+            ):
+                bloom.add(file_unique_id)
+            return bloom
+
+        bloom = await asyncio.to_thread(build)
+        # Video yang diterima selama rebuild (atau belum ter-commit) ada di LRU
+        for file_unique_id in self._recent:
+            bloom.add(file_unique_id)
+        self._filter = bloom
+
+    def stats_text(self) -> str:
+        return (
+            f"• Video dikenal (memori): {len(self._recent)}/{self.max_recent}\n"
+            f"• Duplikat ditolak: {self.caught} | Cek database: {self.db_lookups} | False positive: {self.false_positives}"
+        )
+
+duplicate_index = DuplicateIndex()
+
+# Normalisasi caption sebelum dicocokkan: huruf kompatibilitas (fullwidth, bold, ...) dan aksen diratakan,
+# angka/simbol leetspeak yang menempel di huruf jadi huruf ("4nj1ng", bukan "2011"), tanda baca jadi spasi,
+# dan huruf yang dieja terpisah ("a n j" atau "a.n.j") digabung
+CAPTION_LEET_TABLE = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '@': 'a', '$': 's',
+})
+CAPTION_LEET_RE = re.compile(r'(?<=[^\W\d_])[0134578@$]+|[0134578@$]+(?=[^\W\d_])')
+COMBINING_MARK_RE = re.compile('[\u0300-\u036f]+')
+NON_WORD_RE = re.compile(r'[\W_]+')
+SPELLED_OUT_RE = re.compile(r'(?<!\S)\w(?: \w){2,}(?!\S)')
+# Hanya huruf yang diulang 3x atau lebih yang dianggap dipanjang-panjangkan; huruf dobel biasa ("pass", "skill") tetap
+STRETCHED_CHAR_RE = re.compile(r'(.)\1{2,}')
+
+def normalize_caption(text: str) -> str:
+    """Normalized form of a caption or banned term, padded with spaces so whole-word terms can match at the edges"""
+    text = unicodedata.normalize('NFKD', unicodedata.normalize('NFKC', text).casefold())
+    text = COMBINING_MARK_RE.sub('', text)
+    text = CAPTION_LEET_RE.sub(lambda match: match.group().translate(CAPTION_LEET_TABLE), text)
+    text = NON_WORD_RE.sub(' ', text)
+    text = SPELLED_OUT_RE.sub(lambda match: match.group().replace(' ', ''), text)
+    return f" {text.strip()} "
+
+def caption_variants(normalized: str) -> list:
+    """Forms of a normalized caption to scan: stretched letters ("anjjjing") read as one and as two letters"""
+    if not STRETCHED_CHAR_RE.search(normalized):
+        return [normalized]
+    return [STRETCHED_CHAR_RE.sub(r'\1', normalized), STRETCHED_CHAR_RE.sub(r'\1\1', normalized)]
+
+class TermMatcher:
+    """Aho-Corasick automaton over normalized banned terms, finds a match in one pass over the text"""
+
+    __slots__ = ('_goto', '_fail', '_out')
+
+    def __init__(self, patterns: dict):
+        # patterns: normalized pattern -> term as written by the admin
+        goto = [{}]
+        out = [None]
+        for pattern, term in patterns.items():
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    out.append(None)
+                node = next_node
+            out[node] = term
+
+        # Fail link per node dengan BFS; node mewarisi match dari fail link-nya, jadi scan cukup cek satu slot
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, next_node in goto[node].items():
+                pending.append(next_node)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[next_node] = goto[state].get(char, 0)
+                if out[next_node] is None:
+                    out[next_node] = out[fail[next_node]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def find(self, text: str):
+        """First banned term found in normalized text, or None"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node] is not None:
+                return out[node]
+        return None
+
+class CaptionFilter:
+    """Banned caption terms from an admin-managed file, matched by an automaton rebuilt in the background"""
+
+    def __init__(self, path: str, reload_interval: float = BANNED_TERMS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._terms = []
+        self._matcher = TermMatcher({})
+        self._file_key = None
+        self._next_check = 0.0
+        self._rebuild_task = None
+        self._dirty = False
+        self.scans = 0
+        self.blocked = 0
+        self.builds = 0
+        self.build_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def terms(self) -> list:
+        return list(self._terms)
+
+    def open(self) -> None:
+        """Create the terms file if missing and compile it (called from post_init)"""
+        if not os.path.exists(self.path):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(
+                    "# Satu kata/frasa per baris, dicocokkan sebagai kata utuh ('tai' tidak kena 'pantai').\n"
+                    "# Awali dengan * supaya juga cocok di dalam kata lain (*anjing kena 'anjingnya').\n"
+                )
+        self._install(self._build())
+
+    @staticmethod
+    def compile_term(term: str):
+        """Normalized pattern for one line of the terms file, None for blank lines and comments"""
+        term = term.strip()
+        if not term or term.startswith('#'):
+            return None
+        # Default kata utuh; '*' = cocok sebagai potongan kata. '=' (kata utuh eksplisit) tetap diterima
+        substring = term.startswith('*')
+        body = normalize_caption(term[1:] if term[0] in '*=' else term).strip()
+        if not body:
+            return None
+        return body if substring else f" {body} "
+
+    def _build(self):
+        """Read the file and compile the automaton (runs in a worker thread, touches no shared state)"""
+        started = time.perf_counter()
+        # Stat diambil sebelum membaca supaya edit yang terjadi saat membaca tetap terdeteksi
+        st = os.stat(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        patterns = {}
+        terms = []
+        for term in lines:
+            pattern = self.compile_term(term)
+            if pattern is not None:
+                patterns.setdefault(pattern, term)
+                terms.append(term)
+        matcher = TermMatcher(patterns)
+        return (st.st_ino, st.st_mtime_ns, st.st_size), terms, matcher, time.perf_counter() - started
+
+    def _install(self, built) -> None:
+        # Satu assignment per atribut; scan yang sedang jalan tetap memakai automaton lama sampai selesai
+        self._file_key, self._terms, self._matcher, seconds = built
+        self.builds += 1
+        self.build_seconds = seconds
+        logger.info(f"Caption filter built: {len(self._terms)} term(s), {len(self._matcher)} node(s) in {seconds * 1000:.1f} ms")
+
+    async def rebuild(self) -> None:
+        """Rebuild the automaton in a thread; concurrent calls share one rebuild (plus one more if the file changed meanwhile)"""
+        if self._rebuild_task is not None:
+            self._dirty = True
+            await asyncio.shield(self._rebuild_task)
+            return
+        self._rebuild_task = spawn_background(self._rebuild_loop())
+        await asyncio.shield(self._rebuild_task)
+
+    async def _rebuild_loop(self) -> None:
+        try:
+            while True:
+                self._dirty = False
+                self._install(await asyncio.to_thread(self._build))
+                if not self._dirty:
+                    break
+        except Exception as e:
+            logger.error(f"Caption filter rebuild failed, keeping the previous list: {e}")
+        finally:
+            self._rebuild_task = None
+
+    def maybe_reload(self) -> None:
+        """Start a background rebuild if the file changed on disk (manual edit or another worker)"""
+        now = time.monotonic()
+        if now < self._next_check or self._rebuild_task is not None:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (st.st_ino, st.st_mtime_ns, st.st_size) != self._file_key:
+            self._rebuild_task = spawn_background(self._rebuild_loop())
+
+    def check(self, caption: str):
+        """Banned term the caption contains, or None"""
+        self.maybe_reload()
+        self.scans += 1
+        matcher = self._matcher
+        for variant in caption_variants(normalize_caption(caption)):
+            term = matcher.find(variant)
+            if term is not None:
+                self.blocked += 1
+                return term
+        return None
+
+    def _edit_file(self, add, remove):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = [line.rstrip('\n') for line in f]
+        kept = [line for line in lines if line.strip() not in remove]
+        existing = {line.strip() for line in kept}
+        added = [term for term in dict.fromkeys(add) if term not in existing]
+        # Tulis ke file sementara lalu replace, supaya worker lain tidak pernah membaca file setengah jadi
+        fd, tmp_path = tempfile.mkstemp(prefix='.banned_terms_', dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write("".join(f"{line}\n" for line in kept + added))
+        os.replace(tmp_path, self.path)
+        return added, len(lines) - len(kept)
+
+    async def update_terms(self, add=(), remove=()):
+        """Add/remove terms in the file and rebuild, returns (added terms, number of removed lines)"""
+        added, removed = await asyncio.to_thread(self._edit_file, list(add), set(remove))
+        if added or removed:
+            await self.rebuild()
+        return added, removed
+
+    def stats_text(self) -> str:
+        return (
+            f"• Istilah: {len(self._terms)} | Node automaton: {len(self._matcher)} | "
+            f"Build: {self.builds}x, terakhir {self.build_seconds * 1000:.1f} ms\n"
+            f"• Caption discan: {self.scans} | Ditolak: {self.blocked}"
+        )
+
+caption_filter = CaptionFilter(BANNED_TERMS_FILE)
+
+async def verify_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Check group and channel membership concurrently, returns (is_group_member, is_channel_member)"""
+    checks = [
+        (
+            asyncio.create_task(check_membership(
+                context,
+                user_id,
+                GROUP_ID,
+                retry_with_username=True,
+                chat_username=GROUP_USERNAME
+            )),
+            _membership_cache_key(GROUP_ID, user_id)
+        ),
+        (
+            asyncio.create_task(check_membership(
+                context,
+                user_id,
+                CHANNEL_NUMERIC_ID if CHANNEL_NUMERIC_ID else CHANNEL_ID,
+                retry_with_username=True,
+                chat_username=CHANNEL_ID.replace('@', '') if CHANNEL_ID.startswith('@') else CHANNEL_ID
+            )),
+            _membership_cache_key(CHANNEL_ID, user_id)
+        ),
+    ]
+    # check_membership tidak pernah raise, jadi satu cek yang gagal tidak membatalkan yang lain
+    done, pending = await asyncio.wait([task for task, _ in checks], timeout=VERIFY_TIMEOUT)
+
+    results = []
+    for (task, cache_key), chat_name in zip(checks, ('group', 'channel')):
+        if task in done:
+            is_member = task.result()
+            reason = 'not_member'
+        else:
+            # Lewat deadline: biarkan request selesai di background supaya hasilnya masuk cache,
+            # sementara itu pakai hasil positif lama kalau ada
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            logger.warning(f"Membership check {cache_key} exceeded {VERIFY_TIMEOUT}s deadline")
+            is_member = membership_cache.peek_stale_positive(cache_key)
+            reason = 'timeout'
+        if not is_member:
+            metrics.inc('menfes_verification_failures_total', (('chat', chat_name), ('reason', reason)))
+        results.append(is_member)
+    return tuple(results)
+
+# Hanya baris vote yang ditambahkan bot di akhir caption; teks user yang kebetulan berisi "👍 9 | 👎 0" tidak ikut
+VOTE_LINE_RE = re.compile(r'\n*(?:<i>)?👍 (\d+) \| 👎 (\d+)(?:</i>)?\s*\Z')
+
+def vote_line(likes: int, dislikes: int) -> str:
+    return f"<i>👍 {likes} | 👎 {dislikes}</i>"
+
+def build_vote_keyboard(original_sender_id) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("👍 Like", callback_data=f"like_{original_sender_id}"),
+            InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{original_sender_id}")
+        ]
+    ])
+
+def format_menfes_caption(caption: str, username: str) -> str:
+    """Build the channel caption of a menfes video with a fresh vote line"""
+    formatted_caption = f"📨 <b>MENFES VIDEO</b>\n\n"
+    
+    if caption:
+        formatted_caption += f"<b>Pesan:</b>\n{caption}\n\n"
+        
+    formatted_caption += f"<i>Dikirim oleh: @{username}</i>\n"
+    formatted_caption += f"<i>Via: @TemanRandomMenfes_bot</i>\n\n"
+    formatted_caption += vote_line(0, 0)
+    return formatted_caption
+
+def _sorted_contains(ids: array, user_id: int) -> bool:
+    i = bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+def _sorted_insert(ids: array, user_id: int) -> None:
+    ids.insert(bisect_left(ids, user_id), user_id)
+
+def _sorted_remove(ids: array, user_id: int) -> None:
+    i = bisect_left(ids, user_id)
+    if i < len(ids) and ids[i] == user_id:
+        del ids[i]
+
+class PostVotes:
+    """Vote counts, voters and caption template of one channel post"""
+
+    __slots__ = ('likes', 'dislikes', 'caption', 'sender_id', 'posted_at', 'likers', 'dislikers',
+                 'last_edit', 'edit_scheduled', 'rendered', 'editable', 'edit_failures')
+
+    def __init__(self, caption: str, sender_id, posted_at: float, likes: int = 0, dislikes: int = 0):
+        self.likes = likes
+        self.dislikes = dislikes
+        # Disimpan tanpa baris vote, baris itu dibuat ulang di render_caption
+        self.caption = VOTE_LINE_RE.sub('', caption)
+        self.sender_id = sender_id
+        self.posted_at = posted_at
+        # User ID pemberi vote disimpan sebagai array int64 terurut (8 byte per voter)
+        self.likers = array('q')
+        self.dislikers = array('q')
+        self.last_edit = 0.0
+        self.edit_scheduled = False
+        self.rendered = (likes, dislikes)
+        self.editable = True  # False once Telegram refuses edits (message deleted, can't be edited)
+        self.edit_failures = 0  # Transient edit errors in a row
+
+    def render_caption(self) -> str:
+        return f"{self.caption}\n\n{vote_line(self.likes, self.dislikes)}"
+
+    def cast(self, user_id: int, is_like: bool) -> str:
+        """Record a vote, returns 'new', 'switched' or 'repeat'"""
+        same, other = (self.likers, self.dislikers) if is_like else (self.dislikers, self.likers)
+        if _sorted_contains(same, user_id):
+            return 'repeat'
+        result = 'new'
+        if _sorted_contains(other, user_id):
+            _sorted_remove(other, user_id)
+            if is_like:
+                self.dislikes = max(0, self.dislikes - 1)
+            else:
+                self.likes = max(0, self.likes - 1)
+            result = 'switched'
+        _sorted_insert(same, user_id)
+        if is_like:
+            self.likes += 1
+        else:
+            self.dislikes += 1
+        return result
+
+CAPTION_MESSAGE_RE = re.compile(r'<b>Pesan:</b>\n(.*?)\n\n<i>Dikirim oleh: @(\w*)', re.S)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+def post_link(chat_id: int, message_id: int) -> str:
+    """t.me link of a channel post"""
+    if CHANNEL_ID.startswith('@'):
+        return f"https://t.me/{CHANNEL_ID[1:]}/{message_id}"
+    # Channel privat: https://t.me/c/<id tanpa -100>/<message_id>
+    internal_id = str(chat_id)[4:] if str(chat_id).startswith('-100') else abs(chat_id)
+    return f"https://t.me/c/{internal_id}/{message_id}"
+
+class LeaderboardEntry:
+    """Counts and display data of one post on the leaderboard"""
+
+    __slots__ = ('key', 'posted_at', 'username', 'preview', 'likes', 'dislikes', 'version')
+
+    def __init__(self, key, posted_at: float, username: str, preview: str, likes: int = 0, dislikes: int = 0):
+        self.key = key
+        self.posted_at = posted_at
+        self.username = username
+        self.preview = preview
+        self.likes = likes
+        self.dislikes = dislikes
+        self.version = 0
+
+    def rank(self):
+        """Sort key, best first: net score, then likes, then the older post"""
+        return (self.dislikes - self.likes, -self.likes, self.posted_at)
+
+class Leaderboard:
+    """Top posts by net votes (likes - dislikes) per rolling window, updated in O(log n) per vote"""
+
+    TITLES = {
+        'day': "🏆 TOP VIDEO HARI INI",
+        'week': "🏆 TOP VIDEO MINGGU INI",
+        'all': "🏆 TOP VIDEO SEPANJANG MASA",
+    }
+    PREVIEW_LENGTH = 60
+
+    def __init__(self, size: int = LEADERBOARD_SIZE, windows: dict = LEADERBOARD_WINDOWS):
+        self.size = size
+        self.windows = dict(windows, all=None)
+        # Setelah umur ini post keluar dari semua window dan voting-nya tutup, jadi skornya final
+        self.max_age = max(max(windows.values(), default=0), VOTE_RETENTION)
+        self._entries = {}  # (chat_id, message_id) -> LeaderboardEntry of posts younger than max_age
+        # Max-heap per window dengan lazy deletion: item lama (versi beda / keluar window) dibuang saat muncul di puncak
+        self._heaps = {name: [] for name in self.windows}
+        self._hall = []  # min-heap of the best `size` posts older than max_age, feeds the 'all' window
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._bot = None
+        self.updates = 0
+        self.compactions = 0
+        self.digests_sent = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def _describe(cls, caption: str):
+        """Sender username and a one-line plain text preview taken from the channel caption"""
+        match = CAPTION_MESSAGE_RE.search(caption or "")
+        if not match:
+            return "", ""
+        preview = " ".join(html.unescape(HTML_TAG_RE.sub("", match.group(1))).split())
+        if len(preview) > cls.PREVIEW_LENGTH:
+            preview = preview[:cls.PREVIEW_LENGTH - 3] + "..."
+        return match.group(2), preview
+
+    def update(self, chat_id: int, message_id: int, post: PostVotes) -> None:
+        self._record((chat_id, message_id), post.posted_at, post.caption, post.likes, post.dislikes)
+
+    def _record(self, key, posted_at: float, caption: str, likes: int, dislikes: int) -> None:
+        """Store the post's latest counts and push one heap item per window the post is still in"""
+        age = time.time() - posted_at
+        if age >= self.max_age:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            if not likes and not dislikes:
+                return
+            username, preview = self._describe(caption)
+            entry = self._entries[key] = LeaderboardEntry(key, posted_at, username, preview)
+        elif (entry.likes, entry.dislikes) == (likes, dislikes):
+            return
+        entry.likes = likes
+        entry.dislikes = dislikes
+        entry.version += 1
+        self.updates += 1
+        item = (*entry.rank(), key, entry.version)
+        for name, window in self.windows.items():
+            if window is None or age < window:
+                heap = self._heaps[name]
+                heapq.heappush(heap, item)
+                if len(heap) > 4 * len(self._entries) + 64:
+                    self._compact(name)
+
+    def _valid(self, name: str, item, now: float) -> bool:
+        entry = self._entries.get(item[3])
+        if entry is None or entry.version != item[4]:
+            return False
+        window = self.windows[name]
+        return window is None or now - entry.posted_at < window
+
+    def _compact(self, name: str) -> None:
+        """Rebuild a heap from its live items once stale ones dominate it"""
+        now = time.time()
+        heap = [item for item in self._heaps[name] if self._valid(name, item, now)]
+        heapq.heapify(heap)
+        self._heaps[name] = heap
+        self.compactions += 1
+
+    def _offer_hall(self, entry: LeaderboardEntry) -> None:
+        item = (entry.likes - entry.dislikes, entry.likes, -entry.posted_at, entry.key, entry)
+        if len(self._hall) < self.size:
+            heapq.heappush(self._hall, item)
+        elif item[:4] > self._hall[0][:4]:
+            heapq.heapreplace(self._hall, item)
+
+    def prune(self) -> None:
+        """Move posts older than max_age (final scores) to the all-time hall and compact the heaps"""
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if now - entry.posted_at >= self.max_age]
+        for key in expired:
+            self._offer_hall(self._entries.pop(key))
+        for name, heap in self._heaps.items():
+            if len(heap) > 2 * len(self._entries) + 64:
+                self._compact(name)
+
+    def load(self, live_rows, hall_rows) -> None:
+        """Restore open posts and the best closed posts read from the state database"""
+        for chat_id, message_id, caption, posted_at, likes, dislikes in live_rows:
+            self._record((chat_id, message_id), posted_at, caption, likes, dislikes)
+        for chat_id, message_id, caption, posted_at, likes, dislikes in hall_rows:
+            username, preview = self._describe(caption)
+            self._offer_hall(LeaderboardEntry((chat_id, message_id), posted_at, username, preview, likes, dislikes))
+
+    def top(self, name: str, limit: int = None) -> list:
+        """Best entries of a window, best first; only pops from the top of the heap, never scans it"""
+        limit = limit or self.size
+        now = time.time()
+        heap = self._heaps[name]
+        best = []
+        while heap and len(best) < limit:
+            item = heapq.heappop(heap)
+            if self._valid(name, item, now):
+                best.append(item)
+        for item in best:
+            heapq.heappush(heap, item)
+        entries = [self._entries[item[3]] for item in best]
+        if name == 'all':
+            entries = sorted(entries + [item[-1] for item in self._hall], key=LeaderboardEntry.rank)[:limit]
+        return entries
+
+    def render(self, name: str) -> str:
+        lines = [self.TITLES.get(name, f"🏆 TOP VIDEO ({name})"), ""]
+        entries = self.top(name)
+        if not entries:
+            lines.append("Belum ada video yang mendapat vote.")
+        for rank, entry in enumerate(entries, 1):
+            label = ("🥇", "🥈", "🥉")[rank - 1] if rank <= 3 else f"{rank}."
+            lines.append(f"{label} 👍 {entry.likes} | 👎 {entry.dislikes} (skor {entry.likes - entry.dislikes})")
+            if entry.preview:
+                lines.append(f"    {entry.preview}")
+            lines.append(f"    {post_link(*entry.key)}")
+        return split_message("\n".join(lines))[0]
+
+    @staticmethod
+    def next_digest(now: datetime) -> datetime:
+        due = now.replace(hour=LEADERBOARD_DIGEST_HOUR, minute=0, second=0, microsecond=0)
+        due += timedelta(days=(LEADERBOARD_DIGEST_WEEKDAY - now.weekday()) % 7)
+        return due if due > now else due + timedelta(days=7)
+
+    def start(self, bot: Bot) -> None:
+        if LEADERBOARD_DIGEST_CHAT is None:
+            return
+        self._bot = bot
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._digest_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Flag + wakeup, bukan cancel (lihat OutboundScheduler.shutdown)
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _digest_loop(self) -> None:
+        due = self.next_digest(datetime.now())
+        while not self._stopping:
+            delay = (due - datetime.now()).total_seconds()
+            if delay > 0:
+                # Tidur maksimal satu jam per putaran supaya perubahan jam sistem tetap terkejar
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, 60 * 60))
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                await self.send_digest()
+            except Exception as e:
+                logger.error(f"Failed to post leaderboard digest: {e}")
+            due = self.next_digest(datetime.now())
+
+    async def send_digest(self) -> None:
+        await self._bot.send_message(
+            LEADERBOARD_DIGEST_CHAT,
+            self.render('week'),
+            disable_web_page_preview=True,
+            rate_limit_args={'priority': PRIORITY_CHANNEL_POST}
+        )
+        self.digests_sent += 1
+
+    def stats_text(self) -> str:
+        heaps = " | ".join(f"{name}: {len(heap)}" for name, heap in self._heaps.items())
+        digest = f"ke {LEADERBOARD_DIGEST_CHAT}" if LEADERBOARD_DIGEST_CHAT is not None else "nonaktif"
+        return (
+            f"• Post dilacak: {len(self._entries)} | Hall of fame: {len(self._hall)} | Update: {self.updates}\n"
+            f"• Heap {heaps} | Compact: {self.compactions}\n"
+            f"• Digest mingguan: {digest} | Terkirim: {self.digests_sent}"
+        )
+
+leaderboard = Leaderboard()
+
+class VoteStore:
+    """Authoritative like/dislike counts per channel post, with caption edits coalesced per post"""
+
+    def __init__(self, edit_interval: float = VOTE_EDIT_INTERVAL, max_posts: int = VOTE_MAX_POSTS,
+                 retention: float = VOTE_RETENTION):
+        self.edit_interval = edit_interval
+        self.max_posts = max_posts
+        self.retention = retention
+        self._posts = OrderedDict()  # (chat_id, message_id) -> PostVotes
+        self._next_prune = 0.0
+        self.votes = 0
+        self.repeats = 0
+        self.edits = 0
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def voter_count(self) -> int:
+        return sum(len(post.likers) + len(post.dislikers) for post in self._posts.values())
+
+    def is_expired(self, posted_at: float) -> bool:
+        return time.time() - posted_at > self.retention
+
+    def prune(self) -> None:
+        """Drop posts older than the retention window, at most once per VOTE_PRUNE_INTERVAL"""
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + VOTE_PRUNE_INTERVAL
+        expired = [key for key, post in self._posts.items() if self.is_expired(post.posted_at)]
+        for key in expired:
+            del self._posts[key]
+        if expired:
+            logger.info(f"Vote store pruned {len(expired)} expired post(s)")
+
+    def _add_post(self, chat_id: int, message_id: int, post: PostVotes) -> None:
+        self._posts[(chat_id, message_id)] = post
+        while len(self._posts) > self.max_posts:
+            self._posts.popitem(last=False)
+
+    def register_post(self, chat_id: int, message_id: int, caption: str, sender_id, posted_at: float = None,
+                      likes: int = 0, dislikes: int = 0) -> PostVotes:
+        self.prune()
+        post = PostVotes(caption, sender_id, posted_at if posted_at is not None else time.time(), likes, dislikes)
+        state_store.save_post(chat_id, message_id, sender_id, caption, post.posted_at, likes, dislikes)
+        if worker_index not in (None, 0):
+            # Vote semua post ditangani worker 0 (lihat route_update), yang memuatnya dari database lewat fetch_post
+            return post
+        self._add_post(chat_id, message_id, post)
+        leaderboard.update(chat_id, message_id, post)
+        return post
+
+    def record_vote(self, chat_id: int, message_id: int, post: PostVotes, user_id: int, is_like: bool):
+        """Cast a vote and persist it, returns 'new', 'switched' or 'repeat'"""
+        result = post.cast(user_id, is_like)
+        if result == 'repeat':
+            self.repeats += 1
+        else:
+            self.votes += 1
+            state_store.save_vote(chat_id, message_id, user_id, is_like, post.likes, post.dislikes)
+            leaderboard.update(chat_id, message_id, post)
+        return result
+
+    def load(self, posts, votes) -> None:
+        """Restore posts and voters read from the state database"""
+        voters = {}
+        for chat_id, message_id, user_id, is_like in votes:
+            likers, dislikers = voters.setdefault((chat_id, message_id), ([], []))
+            (likers if is_like else dislikers).append(user_id)
+        for chat_id, message_id, sender_id, caption, posted_at, likes, dislikes in posts:
+            post = PostVotes(caption, sender_id, posted_at, likes, dislikes)
+            likers, dislikers = voters.get((chat_id, message_id), ([], []))
+            post.likers = array('q', sorted(likers))
+            post.dislikers = array('q', sorted(dislikers))
+            self._add_post(chat_id, message_id, post)
+
+    @staticmethod
+    def _query_post(chat_id: int, message_id: int):
+        posts = state_store.query(
+            "SELECT sender_id, caption, posted_at, likes, dislikes FROM posts WHERE chat_id = ? AND message_id = ?",
+            (chat_id, message_id)
+        )
+        if not posts:
+            return None, []
+        votes = state_store.query(
+            "SELECT user_id, is_like FROM votes WHERE chat_id = ? AND message_id = ?", (chat_id, message_id)
+        )
+        return posts[0], votes
+
+    async def fetch_post(self, chat_id: int, message_id: int):
+        """Return the post's counts from memory or the state database (posts evicted or published by another worker)"""
+        post = self._posts.get((chat_id, message_id))
+        if post is not None:
+            return post
+        row, votes = await asyncio.to_thread(self._query_post, chat_id, message_id)
+        # Vote lain untuk post yang sama bisa sudah memuatnya selama query berjalan
+        post = self._posts.get((chat_id, message_id))
+        if post is not None or row is None or self.is_expired(row[2]):
+            return post
+        sender_id, caption, posted_at, likes, dislikes = row
+        post = PostVotes(caption, sender_id, posted_at, likes, dislikes)
+        post.likers = array('q', sorted(user_id for user_id, is_like in votes if is_like))
+        post.dislikers = array('q', sorted(user_id for user_id, is_like in votes if not is_like))
+        self._add_post(chat_id, message_id, post)
+        return post
+
+    def get_or_seed(self, chat_id: int, message_id: int, caption: str, sender_id, posted_at: float):
+        """Return the post's counts, seeding them from the caption for posts not seen since startup"""
+        post = self._posts.get((chat_id, message_id))
+        if post is not None:
+            return post
+        match = VOTE_LINE_RE.search(caption)
+        if not match:
+            return None
+        return self.register_post(
+            chat_id, message_id, caption, sender_id, posted_at,
+            likes=int(match.group(1)), dislikes=int(match.group(2))
+        )
+
+    def schedule_edit(self, bot: Bot, chat_id: int, message_id: int) -> None:
+        """Re-render the caption at most once per edit_interval with the latest counts"""
+        post = self._posts.get((chat_id, message_id))
+        if post is None or post.edit_scheduled or not post.editable:
+            return
+        post.edit_scheduled = True
+        spawn_background(self._edit_later(bot, chat_id, message_id, post))
+
+    async def _edit_later(self, bot: Bot, chat_id: int, message_id: int, post: PostVotes) -> None:
+        try:
+            delay = post.last_edit + self.edit_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Worker lain bisa menerima vote untuk post yang sama, pakai hitungan bersama terbaru
+            shared = await state_backend.vote_counts(chat_id, message_id)
+            if shared is not None:
+                post.likes, post.dislikes = shared
+                leaderboard.update(chat_id, message_id, post)
+            counts = (post.likes, post.dislikes)
+            if counts == post.rendered:
+                return
+            await bot.edit_message_caption(
+                chat_id=chat_id,
+                message_id=message_id,
+                caption=post.render_caption(),
+                reply_markup=build_vote_keyboard(post.sender_id),
+                parse_mode='HTML'
+            )
+            post.rendered = counts
+            post.edit_failures = 0
+            self.edits += 1
+        except BadRequest as e:
+            if "not modified" in e.message.lower():
+                # Caption di Telegram sudah sama dengan hitungan ini
+                post.rendered = counts
+            else:
+                # Pesan dihapus atau tidak bisa diedit lagi: tidak ada gunanya dicoba terus sampai post kedaluwarsa
+                post.editable = False
+                logger.warning(f"Vote caption of message {message_id} can't be edited, giving up: {e}")
+        except Exception as e:
+            # RetryAfter/NetworkError: dicoba lagi beberapa kali, setelah itu tunggu vote berikutnya
+            post.edit_failures += 1
+            logger.error(f"Failed to update vote caption for message {message_id} (attempt {post.edit_failures}): {e}")
+        finally:
+            post.last_edit = time.monotonic()
+            post.edit_scheduled = False
+        # Ada vote baru masuk selama edit berjalan (atau edit gagal sementara), jadwalkan edit berikutnya
+        if (post.likes, post.dislikes) != post.rendered and post.edit_failures < VOTE_EDIT_MAX_RETRIES:
+            self.schedule_edit(bot, chat_id, message_id)
+
+vote_store = VoteStore()
+
+class StateBackend(ABC):
+    """State shared by every bot worker: cooldowns, bans, vote counts and membership results"""
+
+    name = 'base'
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
 
-# Create blacklist file if it doesn't exist
-if not os.path.exists(BLACKLIST_FILE):
-    with open(BLACKLIST_FILE, 'w') as f:
+    @abstractmethod
+    async def claim_cooldown(self, user_id: int, now: float) -> float:
+        """Atomically start the user's cooldown; returns 0 if claimed, else the seconds remaining"""
+
+    @abstractmethod
+    async def release_cooldown(self, user_id: int, claimed_at: float) -> None:
+        """Undo a claim whose submission failed, unless a newer claim replaced it"""
+
+    @abstractmethod
+    async def is_banned(self, user_id: int) -> bool:
+        """True if the user may not submit videos"""
+
+    @abstractmethod
+    async def add_ban(self, user_id: int) -> bool:
+        """Ban a user, returns False if already banned"""
+
+    @abstractmethod
+    async def import_bans(self, path: str) -> int:
+        """Ban every user ID listed in a file, returns the number of new bans"""
+
+    @abstractmethod
+    async def export_bans(self, path: str) -> int:
+        """Write all banned user IDs to a file, returns the number written"""
+
+    @abstractmethod
+    async def ban_count(self) -> int:
+        """Number of banned users"""
+
+    @abstractmethod
+    async def cast_vote(self, chat_id: int, message_id: int, post: PostVotes, user_id: int, is_like: bool) -> str:
+        """Record a vote and update post.likes/post.dislikes, returns 'new', 'switched' or 'repeat'"""
+
+    async def vote_counts(self, chat_id: int, message_id: int):
+        """Latest (likes, dislikes) if another worker may have changed them, else None"""
+        return None
+
+    async def get_membership(self, key):
+        """Membership result cached by any worker, or None"""
+        return None
+
+    async def set_membership(self, key, is_member: bool) -> None:
         pass
 
-# Helper functions
-async def send_log(context: ContextTypes.DEFAULT_TYPE, message: str, is_error: bool = False):
-    """Send log messages to admin"""
-    try:
-        prefix = "❌ ERROR: " if is_error else "ℹ️ INFO: "
-        await context.bot.send_message(ADMIN_ID, f"{prefix}{message}")
-        if is_error:
-            logger.error(message)
+    def stats_text(self) -> str:
+        return f"• Backend: {self.name}"
+
+class LocalStateBackend(StateBackend):
+    """Single-process backend over the in-memory indexes and the SQLite state database"""
+
+    name = 'local'
+
+    async def claim_cooldown(self, user_id: int, now: float) -> float:
+        # Satu event loop: cek dan set terjadi tanpa await di antaranya, jadi sudah atomic
+        last_sent = last_message_time.get(user_id)
+        if last_sent is not None and now - last_sent < COOLDOWN_TIME:
+            return COOLDOWN_TIME - (now - last_sent)
+        set_cooldown(user_id, now)
+        return 0
+
+    async def release_cooldown(self, user_id: int, claimed_at: float) -> None:
+        if last_message_time.get(user_id) == claimed_at:
+            del last_message_time[user_id]
+            state_store.delete_cooldown(user_id)
+
+    async def is_banned(self, user_id: int) -> bool:
+        return blacklist_index.contains(user_id)
+
+    async def add_ban(self, user_id: int) -> bool:
+        return blacklist_index.add(user_id)
+
+    async def import_bans(self, path: str) -> int:
+        return await asyncio.to_thread(blacklist_index.import_file, path)
+
+    async def export_bans(self, path: str) -> int:
+        return await asyncio.to_thread(blacklist_index.export_file, path)
+
+    async def ban_count(self) -> int:
+        return len(blacklist_index)
+
+    async def cast_vote(self, chat_id: int, message_id: int, post: PostVotes, user_id: int, is_like: bool) -> str:
+        return vote_store.record_vote(chat_id, message_id, post, user_id, is_like)
+
+class RespError(Exception):
+    """Error reply from a RESP server"""
+
+class RespClient:
+    """Minimal asyncio client for the Redis serialization protocol (RESP2) with a small connection pool"""
+
+    def __init__(self, host: str, port: int, pool_size: int = STATE_BACKEND_POOL_SIZE, timeout: float = STATE_BACKEND_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = []  # (reader, writer) ready for reuse
+        self._slots = asyncio.Semaphore(pool_size)
+        self.commands = 0
+        self.errors = 0
+
+    @staticmethod
+    def encode(args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    @classmethod
+    async def read_reply(cls, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("RESP connection closed")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            # Error dikembalikan (bukan di-raise) supaya sisa reply pipeline tetap terbaca
+            return RespError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await cls.read_reply(reader) for _ in range(length)]
+        raise ConnectionError(f"Invalid RESP reply: {line[:50]!r}")
+
+    async def pipeline(self, *commands) -> list:
+        """Send several commands in one round trip and return their replies in order"""
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                writer.write(b"".join(self.encode(command) for command in commands))
+                replies = await asyncio.wait_for(self._read_replies(reader, len(commands)), timeout=self.timeout)
+            except BaseException:
+                # Koneksi dalam keadaan tidak jelas (reply setengah terbaca), jangan dipakai lagi
+                self.errors += 1
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+        self.commands += len(commands)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def _read_replies(self, reader: asyncio.StreamReader, count: int) -> list:
+        return [await self.read_reply(reader) for _ in range(count)]
+
+    async def execute(self, *args):
+        return (await self.pipeline(args))[0]
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+class RespStateBackend(StateBackend):
+    """Backend on a Redis-compatible server so several workers share cooldowns, bans, votes and membership"""
+
+    name = 'resp'
+    SCAN_COUNT = 1000  # Ban IDs per SADD/SSCAN round trip
+    # Compare-and-delete: key hanya dihapus kalau masih berisi token claim milik pemanggil
+    RELEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+    def __init__(self, host: str = STATE_BACKEND_HOST, port: int = STATE_BACKEND_PORT, prefix: str = STATE_BACKEND_PREFIX):
+        self.client = RespClient(host, port)
+        self.prefix = prefix
+
+    def _key(self, *parts) -> str:
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    async def open(self) -> None:
+        await self.client.execute("PING")
+        logger.info(f"State backend connected: {self.client.host}:{self.client.port} (prefix {self.prefix!r})")
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    @staticmethod
+    def _claim_token(claimed_at: float) -> str:
+        # PID ikut di token: claim dari proses lain dengan timestamp sama tidak ikut terhapus
+        return f"{os.getpid()}:{claimed_at!r}"
+
+    async def claim_cooldown(self, user_id: int, now: float) -> float:
+        # SET NX PX: hanya satu worker yang bisa membuat key, key hilang sendiri setelah COOLDOWN_TIME
+        key = self._key('cooldown', user_id)
+        claimed, ttl_ms = await self.client.pipeline(
+            ("SET", key, self._claim_token(now), "NX", "PX", int(COOLDOWN_TIME * 1000)),
+            ("PTTL", key)
+        )
+        if claimed == "OK":
+            last_message_time[user_id] = now
+            return 0
+        return max(ttl_ms, 1) / 1000
+
+    async def release_cooldown(self, user_id: int, claimed_at: float) -> None:
+        # GET lalu DEL terpisah tidak aman: key bisa kedaluwarsa dan di-claim worker lain di antaranya
+        await self.client.execute("EVAL", self.RELEASE_SCRIPT, 1, self._key('cooldown', user_id), self._claim_token(claimed_at))
+        if last_message_time.get(user_id) == claimed_at:
+            del last_message_time[user_id]
+
+    async def is_banned(self, user_id: int) -> bool:
+        # File blacklist lokal tetap berlaku (edit manual), sisanya dari set bersama
+        if blacklist_index.contains(user_id):
+            return True
+        return await self.client.execute("SISMEMBER", self._key('bans'), user_id) == 1
+
+    async def add_ban(self, user_id: int) -> bool:
+        blacklist_index.add(user_id)
+        return await self.client.execute("SADD", self._key('bans'), user_id) == 1
+
+    async def import_bans(self, path: str) -> int:
+        # File dibaca per potongan di thread: ban list besar tidak pernah utuh di memori dan loop tidak tertahan disk
+        added = 0
+        f = await asyncio.to_thread(open, path, 'r', errors='ignore')
+        try:
+            while True:
+                ids, at_end = await asyncio.to_thread(self._read_ids, f, self.SCAN_COUNT)
+                if ids:
+                    added += await self.client.execute("SADD", self._key('bans'), *ids)
+                if at_end:
+                    break
+        finally:
+            await asyncio.to_thread(f.close)
+        return added
+
+    @staticmethod
+    def _read_ids(f, limit: int):
+        """Parse up to limit lines, returns the IDs found and whether the file is exhausted"""
+        lines = list(islice(f, limit))
+        return [user_id for user_id in map(BlacklistIndex._parse_id, lines) if user_id is not None], len(lines) < limit
+
+    async def export_bans(self, path: str) -> int:
+        # Ditulis per batch SSCAN lewat thread, set bersama tidak pernah dimuat utuh ke memori
+        key = self._key('bans')
+        tmp_path = f"{path}.tmp"
+        written = 0
+        f = await asyncio.to_thread(open, tmp_path, 'w')
+        try:
+            cursor = "0"
+            while True:
+                cursor, members = await self.client.execute("SSCAN", key, cursor, "COUNT", self.SCAN_COUNT)
+                await asyncio.to_thread(f.writelines, [f"{member}\n" for member in members])
+                written += len(members)
+                if cursor == "0":
+                    break
+            # Ban dari file blacklist lokal (edit manual) yang belum ada di set bersama
+            local_ids = list(blacklist_index._ids)
+            for start in range(0, len(local_ids), self.SCAN_COUNT):
+                chunk = local_ids[start:start + self.SCAN_COUNT]
+                shared = await self.client.pipeline(*[("SISMEMBER", key, user_id) for user_id in chunk])
+                missing = [user_id for user_id, is_shared in zip(chunk, shared) if not is_shared]
+                await asyncio.to_thread(f.writelines, [f"{user_id}\n" for user_id in missing])
+                written += len(missing)
+        finally:
+            await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, path)
+        return written
+
+    async def ban_count(self) -> int:
+        return await self.client.execute("SCARD", self._key('bans'))
+
+    async def cast_vote(self, chat_id: int, message_id: int, post: PostVotes, user_id: int, is_like: bool) -> str:
+        retention_ms = int(VOTE_RETENTION * 1000)
+        choice = "L" if is_like else "D"
+        # SET ... GET atomic per voter: worker mana pun yang menerima klik, pilihan lama terbaca tepat sekali
+        previous = await self.client.execute(
+            "SET", self._key('voter', chat_id, message_id, user_id), choice, "GET", "PX", retention_ms
+        )
+        if previous == choice:
+            vote_store.repeats += 1
+            return 'repeat'
+
+        counts_key = self._key('votes', chat_id, message_id)
+        commands = [
+            # Hitungan awal diambil dari caption saat post pertama kali dilihat
+            ("HSETNX", counts_key, "likes", post.likes),
+            ("HSETNX", counts_key, "dislikes", post.dislikes),
+            ("HINCRBY", counts_key, "likes" if is_like else "dislikes", 1),
+        ]
+        if previous is not None:
+            commands.append(("HINCRBY", counts_key, "dislikes" if is_like else "likes", -1))
+        commands.append(("PEXPIRE", counts_key, retention_ms))
+        commands.append(("HMGET", counts_key, "likes", "dislikes"))
+        likes, dislikes = (await self.client.pipeline(*commands))[-1]
+        post.likes = max(0, int(likes))
+        post.dislikes = max(0, int(dislikes))
+        vote_store.votes += 1
+        state_store.save_vote(chat_id, message_id, user_id, is_like, post.likes, post.dislikes)
+        leaderboard.update(chat_id, message_id, post)
+        return 'new' if previous is None else 'switched'
+
+    async def vote_counts(self, chat_id: int, message_id: int):
+        likes, dislikes = await self.client.execute("HMGET", self._key('votes', chat_id, message_id), "likes", "dislikes")
+        if likes is None or dislikes is None:
+            return None
+        return max(0, int(likes)), max(0, int(dislikes))
+
+    async def get_membership(self, key):
+        value = await self.client.execute("GET", self._key('member', *key))
+        return None if value is None else value == "1"
+
+    async def set_membership(self, key, is_member: bool) -> None:
+        ttl = MEMBERSHIP_CACHE_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL
+        await self.client.execute("SET", self._key('member', *key), int(is_member), "PX", int(ttl * 1000))
+
+    def stats_text(self) -> str:
+        return (
+            f"• Backend: {self.name} ({self.client.host}:{self.client.port})\n"
+            f"• Command: {self.client.commands} | Error koneksi: {self.client.errors}"
+        )
+
+def create_state_backend() -> StateBackend:
+    if STATE_BACKEND == 'resp':
+        return RespStateBackend()
+    return LocalStateBackend()
+
+state_backend = create_state_backend()
+
+class ModerationItem:
+    """A submitted video waiting for review or publication"""
+
+    __slots__ = ('id', 'user_id', 'username', 'file_id', 'duration', 'caption', 'created_at', 'status', 'batch_id',
+                 'attempts', 'retry_at')
+
+    def __init__(self, item_id: int, user_id: int, username: str, file_id: str, duration: int, caption: str,
+                 created_at: float, status: str = 'pending'):
+        self.id = item_id
+        self.user_id = user_id
+        self.username = username
+        self.file_id = file_id
+        self.duration = duration
+        self.caption = caption
+        self.created_at = created_at
+        self.status = status  # pending -> reviewing -> approved -> published, or rejected / failed
+        self.batch_id = None
+        self.attempts = 0  # Failed sends since the last success, not persisted
+        self.retry_at = 0.0  # Monotonic time before which the item is not retried
+
+class ModerationQueue:
+    """Persistent queue of submissions reviewed by the admin in batches and published in the background"""
+
+    def __init__(self, batch_size: int = MODERATION_BATCH_SIZE, max_open_batches: int = MODERATION_MAX_OPEN_BATCHES,
+                 interval: float = MODERATION_REVIEW_INTERVAL):
+        self.batch_size = batch_size
+        self.max_open_batches = max_open_batches
+        self.interval = interval
+        self._items = {}  # item_id -> ModerationItem not yet rejected or published
+        self._pending = deque()  # item ids not yet sent for review, oldest first
+        self._approved = deque()  # item ids waiting for the publisher
+        self._batches = {}  # batch_id -> list of ModerationItem shown in one review message
+        self._next_id = 1
+        self._next_batch = 1
+        self._review_wakeup = asyncio.Event()
+        self._publish_wakeup = asyncio.Event()
+        self._tasks = []
+        self._stopping = False
+        self._bot = None
+        self.submitted = 0
+        self.approved = 0
+        self.rejected = 0
+        self.published = 0
+        self.publish_failures = 0
+        self.failed = 0
+
+    def load(self, rows, max_id: int) -> None:
+        """Restore undecided and approved-but-unpublished items from the database"""
+        for item_id, user_id, username, file_id, duration, caption, status, created_at in rows:
+            # Batch review lama tidak berlaku lagi setelah restart, item masuk review ulang
+            item = ModerationItem(item_id, user_id, username, file_id, duration, caption, created_at, status)
+            self._items[item_id] = item
+            (self._approved if status == 'approved' else self._pending).append(item_id)
+        self._next_id = max_id + 1
+
+    def submit(self, user_id: int, username: str, file_id: str, duration: int, caption: str) -> ModerationItem:
+        item = ModerationItem(self._next_id, user_id, username, file_id, duration, caption, time.time())
+        self._next_id += 1
+        self._items[item.id] = item
+        self._pending.append(item.id)
+        self.submitted += 1
+        state_store.save_moderation_item(item)
+        if len(self._pending) >= self.batch_size:
+            self._review_wakeup.set()
+        return item
+
+    def decide(self, item_id: int, approve: bool):
+        """Approve or reject one item under review, returns the item or None if it was already decided"""
+        item = self._items.get(item_id)
+        if item is None or item.status != 'reviewing':
+            return None
+        if approve:
+            item.status = 'approved'
+            self.approved += 1
+            self._approved.append(item_id)
+            self._publish_wakeup.set()
         else:
-            logger.info(message)
-    except Exception as e:
-        logger.error(f"Failed to send log: {e}")
+            item.status = 'rejected'
+            self.rejected += 1
+            del self._items[item_id]
+        # Ditulis lewat writer thread, handler tidak menunggu disk
+        state_store.save_moderation_status(item_id, item.status)
+        batch = self._batches.get(item.batch_id)
+        if batch is not None and all(entry.status != 'reviewing' for entry in batch):
+            # Batch selesai: beri ruang untuk batch review berikutnya
+            del self._batches[item.batch_id]
+            self._review_wakeup.set()
+        return item
 
-async def check_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id, retry_with_username=False, chat_username=None) -> bool:
-    """Check if user is a member of a chat with robust error handling"""
-    try:
-        # Coba dengan ID numerik terlebih dahulu
+    def decide_batch(self, batch_id: int, approve: bool) -> list:
+        batch = self._batches.get(batch_id, [])
+        decided = [self.decide(item.id, approve) for item in batch if item.status == 'reviewing']
+        return [item for item in decided if item is not None]
+
+    def batch_of(self, item_id: int):
+        item = self._items.get(item_id)
+        return item.batch_id if item is not None else None
+
+    def review_items(self, batch_id) -> list:
+        # Salinan daftar, karena batch dihapus dari _batches begitu semua item diputuskan
+        return list(self._batches.get(batch_id, []))
+
+    def review_message(self, batch_id: int, items: list = None):
+        """Text and keyboard of a review message; decided items are marked and lose their buttons"""
+        items = items if items is not None else self._batches.get(batch_id)
+        if not items:
+            return None, None
+        markers = {'reviewing': '⏳', 'approved': '✅', 'published': '✅', 'rejected': '❌'}
+        lines = [f"🛡️ MODERASI BATCH #{batch_id} ({len(items)} video)\n"]
+        buttons = []
+        for item in items:
+            preview = item.caption or ""
+            if len(preview) > MODERATION_PREVIEW_LENGTH:
+                preview = preview[:MODERATION_PREVIEW_LENGTH] + "…"
+            lines.append(f"{markers.get(item.status, '⏳')} #{item.id} • @{item.username} • {item.duration} detik\n{preview}\n")
+            if item.status == 'reviewing':
+                buttons.append([
+                    InlineKeyboardButton(f"✅ #{item.id}", callback_data=f"mod_a_{item.id}"),
+                    InlineKeyboardButton(f"❌ #{item.id}", callback_data=f"mod_r_{item.id}")
+                ])
+        if buttons:
+            buttons.append([
+                InlineKeyboardButton("✅ Approve semua", callback_data=f"mod_A_{batch_id}"),
+                InlineKeyboardButton("❌ Reject semua", callback_data=f"mod_R_{batch_id}")
+            ])
+        text = split_message("\n".join(lines))[0]
+        return text, InlineKeyboardMarkup(buttons) if buttons else None
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        self._stopping = False
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._review_loop()), loop.create_task(self._publish_loop())]
+        if self._pending:
+            self._review_wakeup.set()
+        if self._approved:
+            self._publish_wakeup.set()
+
+    async def stop(self) -> None:
+        # Flag + wakeup, bukan cancel (lihat OutboundScheduler.shutdown)
+        self._stopping = True
+        self._review_wakeup.set()
+        self._publish_wakeup.set()
+        for task in self._tasks:
+            await task
+        self._tasks = []
+
+    async def _wait(self, event: asyncio.Event, timeout: float = None) -> None:
         try:
-            chat_member = await context.bot.get_chat_member(chat_id, user_id)
-            status = chat_member.status
-            is_member = status in ['creator', 'administrator', 'member']
-            logger.info(f"Membership check for user {user_id} in {chat_id}: {is_member} (status: {status})")
-            return is_member
+            await asyncio.wait_for(event.wait(), timeout=self.interval if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    def _retry_timeout(self, item_ids) -> float:
+        """Seconds until the earliest backed-off item becomes due, capped at the review interval"""
+        now = time.monotonic()
+        delays = [item.retry_at - now for item in map(self._items.get, item_ids) if item is not None and item.retry_at > now]
+        return min([self.interval] + delays)
+
+    async def _failed_attempt(self, item: ModerationItem, error: Exception) -> bool:
+        """Schedule a retry with backoff; returns True when the item ran out of attempts and was dropped"""
+        item.attempts += 1
+        if item.attempts < MODERATION_MAX_ATTEMPTS:
+            delay = min(MODERATION_RETRY_DELAY * 2 ** (item.attempts - 1), MODERATION_RETRY_MAX_DELAY)
+            item.retry_at = time.monotonic() + delay
+            return False
+        # Item yang selalu gagal (file_id rusak, BadRequest) dibuang supaya tidak menahan antrian di belakangnya
+        item.status = 'failed'
+        self._items.pop(item.id, None)
+        self.failed += 1
+        state_store.save_moderation_status(item.id, 'failed')
+        message = f"❌ Video moderasi #{item.id} dari @{item.username} ({item.user_id}) dibuang setelah {item.attempts} kali gagal: {error}"
+        logger.error(message)
+        admin_log_sink.enqueue(message, True)
+        try:
+            await self._bot.send_message(
+                item.user_id,
+                f"❌ Video menfes #{item.id} Anda gagal diproses dan tidak bisa diposting. Silakan kirim ulang videonya.",
+                rate_limit_args={'priority': PRIORITY_REPLY}
+            )
         except Exception as e:
-            # Jika gagal dengan ID numerik dan kita punya username, coba dengan username
-            if retry_with_username and chat_username:
-                logger.info(f"Retrying membership check with username @{chat_username}")
-                try:
-                    chat_member = await context.bot.get_chat_member(f"@{chat_username}", user_id)
-                    status = chat_member.status
-                    is_member = status in ['creator', 'administrator', 'member']
-                    logger.info(f"Username-based membership check for user {user_id} in @{chat_username}: {is_member} (status: {status})")
-                    return is_member
-                except Exception as username_error:
-                    # Jika kedua metode gagal, log error dan kembalikan False
-                    logger.error(f"Both numeric ID and username checks failed: {username_error}")
-                    return False
-            else:
-                # Tidak punya username atau tidak ingin retry, log error dan kembalikan False
-                logger.error(f"Membership check failed and no retry attempted: {e}")
-                return False
-    except Exception as outer_e:
-        # Catch any unexpected error in our logic
-        logger.error(f"Unexpected error in check_membership: {outer_e}")
-        return False
+            logger.warning(f"Failed to notify user {item.user_id} about failed item #{item.id}: {e}")
+        return True
 
-def is_user_blacklisted(user_id: int) -> bool:
-    """Check if user is blacklisted"""
-    try:
-        with open(BLACKLIST_FILE, 'r') as f:
-            blacklist = [line.strip() for line in f.readlines() if line.strip()]
-        return str(user_id) in blacklist
-    except Exception as e:
-        logger.error(f"Error checking blacklist: {e}")
-        return False
+    async def _review_loop(self) -> None:
+        while not self._stopping:
+            await self._wait(self._review_wakeup, self._retry_timeout(self._pending))
+            while self._pending and len(self._batches) < self.max_open_batches and not self._stopping:
+                if not await self._send_review_batch():
+                    break
 
-def add_user_to_blacklist(user_id: int) -> bool:
-    """Add user to blacklist"""
-    try:
-        if is_user_blacklisted(user_id):
+    def _take_review_items(self) -> list:
+        """Pop the next due pending items; items that failed before are sent alone so one bad video cannot sink a batch"""
+        now = time.monotonic()
+        items = []
+        deferred = []
+        while self._pending and len(items) < self.batch_size:
+            item = self._items.get(self._pending.popleft())
+            if item is None or item.status != 'pending':
+                continue
+            if item.retry_at > now or (item.attempts and items):
+                deferred.append(item.id)
+                continue
+            items.append(item)
+            if item.attempts:
+                break
+        self._pending.extendleft(reversed(deferred))
+        return items
+
+    async def _send_review_batch(self) -> bool:
+        """Send one review message; False when nothing could be sent now (failure or every item backing off)"""
+        items = self._take_review_items()
+        if not items:
+            return not self._pending
+        batch_id = self._next_batch
+        self._next_batch += 1
+        for item in items:
+            item.status = 'reviewing'
+            item.batch_id = batch_id
+        try:
+            if len(items) == 1:
+                # sendMediaGroup butuh minimal 2 media
+                await self._bot.send_video(
+                    ADMIN_ID, items[0].file_id, caption=f"#{items[0].id} @{items[0].username}",
+                    rate_limit_args={'priority': PRIORITY_REPLY}
+                )
+            else:
+                await self._bot.send_media_group(
+                    ADMIN_ID,
+                    [InputMediaVideo(item.file_id, caption=f"#{item.id} @{item.username}") for item in items],
+                    rate_limit_args={'priority': PRIORITY_REPLY}
+                )
+            text, reply_markup = self.review_message(batch_id, items)
+            await self._bot.send_message(ADMIN_ID, text, reply_markup=reply_markup, rate_limit_args={'priority': PRIORITY_REPLY})
+        except Exception as e:
+            # Kembalikan ke depan antrian dengan backoff per item, yang sudah terlalu sering gagal dibuang
+            logger.error(f"Failed to send moderation batch #{batch_id}: {e}")
+            retry = []
+            for item in items:
+                item.status = 'pending'
+                item.batch_id = None
+                if not await self._failed_attempt(item, e):
+                    retry.append(item.id)
+            self._pending.extendleft(reversed(retry))
             return False
-        
-        with open(BLACKLIST_FILE, 'a') as f:
-            f.write(f"{user_id}\n")
+        for item in items:
+            item.attempts = 0
+        self._batches[batch_id] = items
         return True
-    except Exception as e:
-        logger.error(f"Error adding user to blacklist: {e}")
-        return False
+
+    def _next_due(self):
+        """First approved item not backing off, rotated to the front of the queue; None when all are waiting"""
+        now = time.monotonic()
+        for _ in range(len(self._approved)):
+            item = self._items[self._approved[0]]
+            if item.retry_at <= now:
+                return item
+            self._approved.rotate(-1)
+        return None
+
+    async def _publish_loop(self) -> None:
+        while not self._stopping:
+            await self._wait(self._publish_wakeup, self._retry_timeout(self._approved))
+            while self._approved and not self._stopping:
+                item = self._next_due()
+                if item is None:
+                    break
+                try:
+                    await self._publish(item)
+                except Exception as e:
+                    self.publish_failures += 1
+                    logger.error(f"Failed to publish moderation item #{item.id} (attempt {item.attempts + 1}): {e}")
+                    if await self._failed_attempt(item, e):
+                        self._approved.popleft()
+                    else:
+                        # Item lain di belakangnya tetap jalan selama item ini menunggu backoff
+                        self._approved.rotate(-1)
+                    continue
+                self._approved.popleft()
+
+    async def _publish(self, item: ModerationItem) -> None:
+        formatted_caption = format_menfes_caption(item.caption, item.username)
+        sent_message = await self._bot.send_video(
+            CHANNEL_ID,
+            item.file_id,
+            caption=formatted_caption,
+            parse_mode='HTML',
+            reply_markup=build_vote_keyboard(item.user_id),
+            rate_limit_args={'priority': PRIORITY_CHANNEL_POST}
+        )
+        vote_store.register_post(sent_message.chat.id, sent_message.message_id, formatted_caption, item.user_id, sent_message.date.timestamp())
+        state_store.save_submission(item.user_id, item.username, sent_message.chat.id, sent_message.message_id, item.duration, item.caption)
+        state_store.save_moderation_status(item.id, 'published', sent_message.chat.id, sent_message.message_id)
+        item.status = 'published'
+        del self._items[item.id]
+        self.published += 1
+        try:
+            await self._bot.send_message(
+                item.user_id,
+                f"✅ Video menfes #{item.id} Anda sudah disetujui admin dan diposting ke channel.",
+                rate_limit_args={'priority': PRIORITY_REPLY}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to notify user {item.user_id} about published item #{item.id}: {e}")
+
+    def stats_text(self) -> str:
+        reviewing = sum(1 for item in self._items.values() if item.status == 'reviewing')
+        return (
+            f"• Mode: {'aktif' if MODERATION_MODE else 'nonaktif'}\n"
+            f"• Menunggu review: {len(self._pending)} | Direview: {reviewing} ({len(self._batches)} pesan) | "
+            f"Siap posting: {len(self._approved)}\n"
+            f"• Disetujui: {self.approved} | Ditolak: {self.rejected} | Diposting: {self.published} | "
+            f"Gagal posting: {self.publish_failures} | Dibuang: {self.failed}"
+        )
+
+moderation_queue = ModerationQueue()
+
+class UpdateGate:
+    """First check for every update: drops non-private chats, banned users and users over their token bucket"""
+
+    BANNED_TEXT = "❌ Anda telah dibanned dari menggunakan bot ini."
+    THROTTLED_TEXT = "⏳ Terlalu banyak pesan. Tunggu sebentar sebelum mengirim lagi."
+
+    def __init__(self, rate: float = GATE_USER_RATE, burst: float = GATE_USER_BURST,
+                 notice_interval: float = GATE_NOTICE_INTERVAL, prune_interval: float = GATE_PRUNE_INTERVAL):
+        self.rate = rate
+        self.burst = burst
+        self.notice_interval = notice_interval
+        self.prune_interval = prune_interval
+        # user_id -> [tokens, updated, last_notice]; user dengan bucket penuh tidak perlu disimpan
+        self._users = {}
+        self._next_prune = time.monotonic() + prune_interval
+        self.passed = 0
+        self.dropped = {'non_private': 0, 'banned': 0, 'throttled': 0}
+        self.notices = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _take(self, user_id: int, now: float):
+        """Refill the user's bucket and try to consume one token; returns (state, allowed)"""
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = [self.burst, now, -math.inf]
+        else:
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+        if state[0] < 1:
+            return state, False
+        state[0] -= 1
+        return state, True
+
+    def _prune(self, now: float) -> None:
+        """Forget users whose bucket has refilled and who have no recent notice to remember"""
+        self._next_prune = now + self.prune_interval
+        idle = [
+            user_id for user_id, (tokens, updated, last_notice) in self._users.items()
+            if tokens + (now - updated) * self.rate >= self.burst and now - last_notice >= self.notice_interval
+        ]
+        for user_id in idle:
+            del self._users[user_id]
+
+    def _drop(self, reason: str) -> None:
+        self.dropped[reason] += 1
+        metrics.inc('menfes_gate_dropped_total', (('reason', reason),))
+        raise ApplicationHandlerStop
+
+    async def _notify(self, update: Update, state: list, now: float, text: str) -> None:
+        """Tell the user why nothing happens, at most once per GATE_NOTICE_INTERVAL"""
+        show = now - state[2] >= self.notice_interval
+        if show:
+            state[2] = now
+            self.notices += 1
+        try:
+            if update.callback_query:
+                # Callback selalu dijawab (tanpa teks kalau notifikasi sedang ditahan), kalau tidak spinner tombol menggantung
+                await update.callback_query.answer(text if show else None)
+            elif show and update.effective_message:
+                await update.effective_message.reply_text(text)
+        except Exception as e:
+            logger.warning(f"Gate notice to {update.effective_user.id} failed: {e}")
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """TypeHandler callback in group -1; raises ApplicationHandlerStop to drop the update"""
+        if update.chat_member is not None:
+            # Join/leave/ban di channel atau grup untuk roster, bukan aksi user ke bot
+            return
+        message = update.effective_message
+        # Tombol vote ada di post channel, jadi callback query tetap lolos walaupun pesannya bukan di chat privat
+        if update.callback_query is None and message is not None and message.chat.type != 'private':
+            self._drop('non_private')
+
+        user = update.effective_user
+        if user is None:
+            return
+
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._prune(now)
+        state, allowed = self._take(user.id, now)
+        if not allowed:
+            await self._notify(update, state, now, self.THROTTLED_TEXT)
+            self._drop('throttled')
+
+        if await is_user_blacklisted(user.id):
+            await self._notify(update, state, now, self.BANNED_TEXT)
+            self._drop('banned')
+        self.passed += 1
+
+    def stats_text(self) -> str:
+        dropped = " | ".join(f"{reason}: {count}" for reason, count in self.dropped.items())
+        return (
+            f"• Lolos: {self.passed} | User dilacak: {len(self._users)}\n"
+            f"• Dibuang: {dropped} | Notifikasi: {self.notices}"
+        )
+
+update_gate = UpdateGate()
 
 # Command handlers
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command"""
     try:
-        # Cek apakah pesan diterima di chat privat (bukan grup)
-        if update.effective_chat.type != 'private':
-            # Abaikan pesan dari grup
-            return
-            
         user_id = update.effective_user.id
         username = update.effective_user.username or "no username"
         
-        # Check if user is blacklisted
-        if is_user_blacklisted(user_id):
-            await update.message.reply_text("❌ Anda telah dibanned dari menggunakan bot ini.")
-            return
-        
         # Create channel name without @ if it exists
         channel_name = CHANNEL_ID[1:] if CHANNEL_ID.startswith('@') else CHANNEL_ID
         
@@ -166,19 +3460,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /help command"""
     try:
-        # Cek apakah pesan diterima di chat privat (bukan grup)
-        if update.effective_chat.type != 'private':
-            # Abaikan pesan dari grup
-            return
-            
         user_id = update.effective_user.id
         username = update.effective_user.username or "no username"
         
-        # Check if user is blacklisted
-        if is_user_blacklisted(user_id):
-            await update.message.reply_text("❌ Anda telah dibanned dari menggunakan bot ini.")
-            return
-        
         await update.message.reply_html(
             f"ℹ️ <b>Bantuan Penggunaan Menfes Video Bot</b>\n\n"
             f"Bot ini memungkinkan Anda mengirim video ke channel {CHANNEL_ID}.\n\n"
@@ -192,6 +3476,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "• Video harus memiliki caption\n"
             "• Interval pengiriman 3 menit\n"
             "• Konten tidak boleh melanggar aturan komunitas\n\n"
+            "Ketik /top untuk melihat video terbaik (/top day, /top week, /top all).\n\n"
             "Jika mengalami masalah, silakan hubungi admin grup."
         )
         
@@ -199,14 +3484,22 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     except Exception as e:
         await send_log(context, f"Error saat mengirim pesan bantuan: {e}", True)
 
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /top command"""
+    try:
+        aliases = {'hari': 'day', 'minggu': 'week', 'semua': 'all'}
+        name = context.args[0].lower() if context.args else 'week'
+        name = aliases.get(name, name)
+        if name not in leaderboard.windows:
+            await update.message.reply_text(f"⚠️ Format yang benar: /top [{'|'.join(leaderboard.windows)}]")
+            return
+        await update.message.reply_text(leaderboard.render(name), disable_web_page_preview=True)
+    except Exception as e:
+        await send_log(context, f"Error saat menampilkan leaderboard: {e}", True)
+
 async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /ban command (admin only)"""
     try:
-        # Cek apakah pesan diterima di chat privat (bukan grup)
-        if update.effective_chat.type != 'private':
-            # Abaikan pesan dari grup
-            return
-            
         user_id = update.effective_user.id
         
         # Check if sender is admin
@@ -228,9 +3521,10 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             return
         
         # Add user to blacklist
-        success = add_user_to_blacklist(int(user_id_to_ban))
+        success = await add_user_to_blacklist(int(user_id_to_ban))
         
         if success:
+            state_store.save_ban(int(user_id_to_ban), reason, user_id)
             await update.message.reply_text(f"✅ User dengan ID {user_id_to_ban} berhasil dibanned.\nAlasan: {reason}")
             await send_log(context, f"Admin {user_id} memban user {user_id_to_ban}. Alasan: {reason}")
         else:
@@ -239,22 +3533,230 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await send_log(context, f"Error saat proses ban user: {e}", True)
         await update.message.reply_text("❌ Terjadi kesalahan saat mencoba memban user.")
 
+async def importban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /importban command (admin only), must be a reply to a ban list document"""
+    try:
+        user_id = update.effective_user.id
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Anda tidak memiliki izin untuk menggunakan perintah ini.")
+            return
+
+        replied = update.message.reply_to_message
+        if not replied or not replied.document:
+            await update.message.reply_text("⚠️ Balas (reply) file daftar ban (.txt, satu user ID per baris) dengan /importban")
+            return
+
+        # Download ke file sementara lalu baca per baris supaya list besar tidak dimuat sekaligus
+        tg_file = await replied.document.get_file()
+        fd, tmp_path = tempfile.mkstemp(prefix='banlist_', suffix='.txt')
+        os.close(fd)
+        try:
+            await tg_file.download_to_drive(tmp_path)
+            added = await state_backend.import_bans(tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+        await update.message.reply_text(f"✅ Import selesai. {added} user baru dibanned (total {await state_backend.ban_count()}).")
+        await send_log(context, f"Admin {user_id} mengimport daftar ban: {added} user baru")
+    except Exception as e:
+        await send_log(context, f"Error saat import daftar ban: {e}", True)
+        await update.message.reply_text("❌ Terjadi kesalahan saat mengimport daftar ban.")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /profile command (admin only): start or stop the sampling profiler"""
+    try:
+        user_id = update.effective_user.id
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Anda tidak memiliki izin untuk menggunakan perintah ini.")
+            return
+
+        action = context.args[0].lower() if context.args else ""
+        if action == "start":
+            if profiler.running:
+                await update.message.reply_text(f"ℹ️ Profiler sudah berjalan.\n{profiler.status_text()}")
+                return
+            duration = PROFILE_DEFAULT_DURATION
+            if len(context.args) > 1:
+                if not context.args[1].isdigit() or int(context.args[1]) < 1:
+                    await update.message.reply_text("⚠️ Durasi harus berupa angka (detik).")
+                    return
+                duration = min(int(context.args[1]), PROFILE_MAX_DURATION)
+            profiler.start(context.bot, duration)
+            await update.message.reply_text(
+                f"🔬 Profiler berjalan selama {duration} detik.\n"
+                "Ringkasan dikirim otomatis saat selesai, atau hentikan lebih awal dengan /profile stop."
+            )
+            await send_log(context, f"Admin {user_id} menjalankan profiler ({duration} detik)")
+        elif action == "stop":
+            text = await profiler.stop()
+            if not text:
+                await update.message.reply_text("ℹ️ Profiler tidak sedang berjalan.")
+                return
+            for chunk in split_message(text):
+                await update.message.reply_text(chunk)
+        else:
+            await update.message.reply_text(
+                "⚠️ Format yang benar: /profile start [detik] atau /profile stop\n"
+                f"{profiler.status_text()}"
+            )
+    except Exception as e:
+        await send_log(context, f"Error saat menjalankan profiler: {e}", True)
+        await update.message.reply_text("❌ Terjadi kesalahan saat menjalankan profiler.")
+
+async def filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /filter command (admin only): manage the banned caption terms"""
+    try:
+        user_id = update.effective_user.id
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Anda tidak memiliki izin untuk menggunakan perintah ini.")
+            return
+
+        action = context.args[0].lower() if context.args else ""
+        text = " ".join(context.args[1:])
+        terms = [term.strip() for term in text.split(",") if term.strip()]
+        if action == "add" and terms:
+            added, _ = await caption_filter.update_terms(add=terms)
+            await update.message.reply_text(
+                f"✅ {len(added)} istilah ditambahkan ({len(terms) - len(added)} sudah ada).\n"
+                f"{caption_filter.stats_text()}"
+            )
+            if added:
+                await send_log(context, f"Admin {user_id} menambah filter caption: {', '.join(added)}")
+        elif action == "remove" and terms:
+            _, removed = await caption_filter.update_terms(remove=terms)
+            await update.message.reply_text(f"✅ {removed} istilah dihapus.\n{caption_filter.stats_text()}")
+            if removed:
+                await send_log(context, f"Admin {user_id} menghapus filter caption: {', '.join(terms)}")
+        elif action == "list":
+            if not len(caption_filter):
+                await update.message.reply_text("ℹ️ Daftar filter caption masih kosong.")
+                return
+            with open(caption_filter.path, 'rb') as f:
+                await update.message.reply_document(
+                    f,
+                    filename=f"banned_terms_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                    caption=f"📄 Filter caption: {len(caption_filter)} istilah"
+                )
+        elif action == "test" and text:
+            term = caption_filter.check(text)
+            await update.message.reply_text(
+                f"Teks ternormalisasi: {normalize_caption(text).strip()}\n"
+                + (f"🚫 Kena filter: {term}" if term else "✅ Lolos filter")
+            )
+        else:
+            await update.message.reply_text(
+                "⚠️ Format yang benar:\n"
+                "/filter add kata1, kata2 (kata utuh; awali dengan * untuk potongan kata)\n"
+                "/filter remove kata1, kata2\n"
+                "/filter list\n"
+                "/filter test teks"
+            )
+    except Exception as e:
+        await send_log(context, f"Error saat mengelola filter caption: {e}", True)
+        await update.message.reply_text("❌ Terjadi kesalahan saat mengelola filter caption.")
+
+async def exportban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /exportban command (admin only)"""
+    try:
+        user_id = update.effective_user.id
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Anda tidak memiliki izin untuk menggunakan perintah ini.")
+            return
+
+        fd, tmp_path = tempfile.mkstemp(prefix='banlist_', suffix='.txt')
+        os.close(fd)
+        try:
+            count = await state_backend.export_bans(tmp_path)
+            with open(tmp_path, 'rb') as f:
+                await update.message.reply_document(
+                    f,
+                    filename=f"blacklist_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                    caption=f"📄 Daftar ban: {count} user"
+                )
+        finally:
+            os.remove(tmp_path)
+    except Exception as e:
+        await send_log(context, f"Error saat export daftar ban: {e}", True)
+        await update.message.reply_text("❌ Terjadi kesalahan saat mengexport daftar ban.")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /stats command (admin only)"""
+    try:
+        if update.effective_user.id != ADMIN_ID:
+            await update.message.reply_text("❌ Anda tidak memiliki izin untuk menggunakan perintah ini.")
+            return
+
+        processor = context.application.update_processor
+        if isinstance(processor, PerUserUpdateProcessor):
+            processing_text = (
+                f"• Mode: concurrent ({processor.max_concurrent_updates} slot)\n"
+                f"• User sedang diproses: {processor.active_users()} | Update dibuang: {processor.dropped}"
+            )
+        else:
+            processing_text = "• Mode: sequential"
+        if worker_index is not None:
+            processing_text += f"\n• Worker: {worker_index}/{WORKER_PROCESSES} (pid {os.getpid()}), statistik di bawah hanya proses ini"
+
+        await update.message.reply_text(
+            "📊 STATISTIK BOT\n\n"
+            "Pemrosesan update:\n"
+            f"{processing_text}\n\n"
+            "Gate update:\n"
+            f"{update_gate.stats_text()}\n\n"
+            "Roster anggota:\n"
+            f"{member_roster.stats_text()}\n\n"
+            "Cache keanggotaan:\n"
+            f"{membership_cache.stats_text()}\n\n"
+            "Blacklist:\n"
+            f"• User dibanned: {await state_backend.ban_count()}\n\n"
+            "State bersama:\n"
+            f"{state_backend.stats_text()}\n\n"
+            "Vote:\n"
+            f"• Post dilacak: {len(vote_store)} | Voter: {vote_store.voter_count()}\n"
+            f"• Vote: {vote_store.votes} | Klik ulang: {vote_store.repeats} | Edit caption: {vote_store.edits}\n\n"
+            "Leaderboard:\n"
+            f"{leaderboard.stats_text()}\n\n"
+            "Validasi video:\n"
+            f"{submission_pipeline.stats_text()}\n\n"
+            "Filter caption:\n"
+            f"{caption_filter.stats_text()}\n\n"
+            "Video duplikat:\n"
+            f"{duplicate_index.stats_text()}\n\n"
+            "Moderasi:\n"
+            f"{moderation_queue.stats_text()}\n\n"
+            "Outbound API:\n"
+            f"{outbound_scheduler.stats_text()}\n\n"
+            "Database:\n"
+            f"{state_store.stats_text()}\n"
+            f"• Cooldown aktif di memori: {len(last_message_time)}\n\n"
+            "Handler:\n"
+            f"{metrics.stats_text()}\n\n"
+            "Profiler:\n"
+            f"{profiler.status_text()}"
+        )
+    except Exception as e:
+        await send_log(context, f"Error saat menampilkan statistik: {e}", True)
+
 # Callback handlers
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button callbacks"""
     query = update.callback_query
-    await query.answer()
     
     try:
-        # Handle different callback data
+        # Handle different callback data. Setiap handler menjawab query-nya sendiri
+        # karena callback query hanya bisa dijawab satu kali
         if query.data == "check_membership":
             await handle_check_membership(update, context)
         elif query.data == "create_menfes":
             await handle_create_menfes(update, context)
         elif query.data.startswith("like_"):
-            await handle_like(update, context)
+            await handle_vote(update, context, is_like=True)
         elif query.data.startswith("dislike_"):
-            await handle_dislike(update, context)
+            await handle_vote(update, context, is_like=False)
+        elif query.data.startswith("mod_"):
+            await handle_moderation(update, context)
+        else:
+            await query.answer()
     except Exception as e:
         await send_log(context, f"Error handling callback: {e}", True)
         try:
@@ -267,20 +3769,8 @@ async def handle_check_membership(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     user_id = query.from_user.id
     
-    # Check if user is blacklisted
-    if is_user_blacklisted(user_id):
-        await query.answer("❌ Anda telah dibanned dari menggunakan bot ini.")
-        await query.edit_message_text(
-            "❌ <b>AKSES DITOLAK</b>\n\n"
-            "Anda telah dibanned dari menggunakan bot ini.\n"
-            "Silakan hubungi admin untuk informasi lebih lanjut.",
-            parse_mode='HTML'
-        )
-        return
-    
-    # Check membership - mengkonversi GROUP_ID ke string jika diperlukan
-    is_group_member = await check_membership(context, user_id, GROUP_ID)
-    is_channel_member = await check_membership(context, user_id, CHANNEL_ID)
+    # Cek keanggotaan grup dan channel secara paralel
+    is_group_member, is_channel_member = await verify_membership(context, user_id)
     
     await send_log(context, f"Callback check_membership for user {user_id}: Group={is_group_member}, Channel={is_channel_member}")
     
@@ -314,11 +3804,14 @@ async def handle_check_membership(update: Update, context: ContextTypes.DEFAULT_
         reply_markup = InlineKeyboardMarkup(buttons)
         
         await query.answer("⚠️ Anda belum bergabung dengan semua grup/channel yang diperlukan")
+        # Backslash tidak boleh ada di dalam ekspresi f-string sebelum Python 3.12
+        missing_group_line = '• Grup kami\n'
+        missing_channel_line = '• Channel kami\n'
         await query.edit_message_text(
             "⚠️ <b>VERIFIKASI GAGAL</b>\n\n"
             "Untuk mengirim menfes, Anda harus bergabung dengan:\n"
-            f"{'' if is_group_member else '• Grup kami\n'}"
-            f"{'' if is_channel_member else '• Channel kami\n'}\n"
+            f"{'' if is_group_member else missing_group_line}"
+            f"{'' if is_channel_member else missing_channel_line}\n"
             "Silakan bergabung terlebih dahulu dengan mengklik tombol di bawah ini.\n"
             "Setelah bergabung, klik tombol <b>Cek Kembali</b> untuk verifikasi.",
             parse_mode='HTML',
@@ -336,6 +3829,7 @@ async def handle_create_menfes(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     user_id = query.from_user.id
     
+    await query.answer()
     await query.message.reply_html(
         "📹 <b>KIRIM VIDEO MENFES ANDA</b>\n\n"
         "Silakan kirim video yang ingin Anda sampaikan.\n"
@@ -350,216 +3844,314 @@ async def handle_create_menfes(update: Update, context: ContextTypes.DEFAULT_TYP
     
     await send_log(context, f"User {user_id} memulai proses pengiriman video menfes")
 
-async def handle_like(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle the like button callback"""
+async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE, is_like: bool) -> None:
+    """Handle the like and dislike button callbacks"""
     query = update.callback_query
     user_id = query.from_user.id
+    chat_id = query.message.chat.id
     message_id = query.message.message_id
     
     # Extract original sender ID from callback data
     original_sender_id = query.data.split('_')[1]
     
-    # Extract current caption
-    current_caption = query.message.caption or ""
-    
-    # Extract current like/dislike counts
-    like_dislike_match = re.search(r'👍 (\d+) \| 👎 (\d+)', current_caption)
-    if not like_dislike_match:
-        await query.answer("❌ Error: Format caption tidak valid")
+    # Voting ditutup untuk post lama supaya data voter tidak tumbuh tanpa batas
+    posted_at = query.message.date.timestamp()
+    if vote_store.is_expired(posted_at):
+        await query.answer("⏳ Voting untuk video ini sudah ditutup")
         return
     
-    likes = int(like_dislike_match.group(1))
-    dislikes = int(like_dislike_match.group(2))
-    
-    # Increment likes
-    likes += 1
-    
-    # Update caption
-    new_caption = re.sub(r'👍 \d+ \| 👎 \d+', f'👍 {likes} | 👎 {dislikes}', current_caption)
-    
-    # Create inline keyboard
-    keyboard = [
-        [
-            InlineKeyboardButton("👍 Like", callback_data=f"like_{original_sender_id}"),
-            InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{original_sender_id}")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Edit message
-    await context.bot.edit_message_caption(
-        chat_id=query.message.chat.id,
-        message_id=message_id,
-        caption=new_caption,
-        reply_markup=reply_markup,
-        parse_mode='HTML'
-    )
-    
-    await query.answer("👍 Anda menyukai video ini!")
-    await send_log(context, f"User {user_id} menyukai video dari user {original_sender_id} (Message ID: {message_id})")
-
-async def handle_dislike(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle the dislike button callback"""
-    query = update.callback_query
-    user_id = query.from_user.id
-    message_id = query.message.message_id
-    
-    # Extract original sender ID from callback data
-    original_sender_id = query.data.split('_')[1]
-    
-    # Extract current caption
-    current_caption = query.message.caption or ""
-    
-    # Extract current like/dislike counts
-    like_dislike_match = re.search(r'👍 (\d+) \| 👎 (\d+)', current_caption)
-    if not like_dislike_match:
+    # Hitungan diambil dari vote_store atau database; caption hanya dibaca untuk post yang belum pernah tercatat
+    post = await vote_store.fetch_post(chat_id, message_id)
+    if post is None:
+        post = vote_store.get_or_seed(chat_id, message_id, query.message.caption_html or "", original_sender_id, posted_at)
+    if post is None:
         await query.answer("❌ Error: Format caption tidak valid")
         return
     
-    likes = int(like_dislike_match.group(1))
-    dislikes = int(like_dislike_match.group(2))
+    # Satu user satu vote per post: klik tombol yang sama diabaikan, klik tombol lawan memindahkan vote
+    result = await state_backend.cast_vote(chat_id, message_id, post, user_id, is_like)
+    if result == 'repeat':
+        await query.answer("ℹ️ Anda sudah memberi vote ini")
+        return
     
-    # Increment dislikes
-    dislikes += 1
+    # Edit caption digabung: maksimal satu edit per post setiap VOTE_EDIT_INTERVAL detik
+    vote_store.schedule_edit(context.bot, chat_id, message_id)
     
-    # Update caption
-    new_caption = re.sub(r'👍 \d+ \| 👎 \d+', f'👍 {likes} | 👎 {dislikes}', current_caption)
+    action = "menyukai" if is_like else "tidak menyukai"
+    if result == 'switched':
+        action = f"mengubah vote menjadi {action}"
+    if is_like:
+        await query.answer("👍 Anda menyukai video ini!")
+    else:
+        await query.answer("👎 Anda tidak menyukai video ini")
+    await send_log(context, f"User {user_id} {action} video dari user {original_sender_id} (Message ID: {message_id})", event='vote')
+
+async def notify_rejected(bot: Bot, items: list) -> None:
+    for item in items:
+        try:
+            await bot.send_message(
+                item.user_id,
+                f"❌ Video menfes #{item.id} Anda tidak disetujui admin dan tidak akan diposting.",
+                rate_limit_args={'priority': PRIORITY_REPLY}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to notify user {item.user_id} about rejected item #{item.id}: {e}")
+
+async def handle_moderation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle approve/reject buttons of a moderation review message (admin only)"""
+    query = update.callback_query
+    if query.from_user.id != ADMIN_ID:
+        await query.answer("❌ Anda tidak memiliki izin untuk menggunakan tombol ini.")
+        return
     
-    # Create inline keyboard
-    keyboard = [
-        [
-            InlineKeyboardButton("👍 Like", callback_data=f"like_{original_sender_id}"),
-            InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{original_sender_id}")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # mod_a_<item>/mod_r_<item> untuk satu video, mod_A_<batch>/mod_R_<batch> untuk seluruh batch
+    _, action, target = query.data.split('_', 2)
+    approve = action in ('a', 'A')
+    if action in ('a', 'r'):
+        batch_id = moderation_queue.batch_of(int(target))
+        batch_items = moderation_queue.review_items(batch_id)
+        item = moderation_queue.decide(int(target), approve)
+        decided = [item] if item is not None else []
+    else:
+        batch_id = int(target)
+        batch_items = moderation_queue.review_items(batch_id)
+        decided = moderation_queue.decide_batch(batch_id, approve)
     
-    # Edit message
-    await context.bot.edit_message_caption(
-        chat_id=query.message.chat.id,
-        message_id=message_id,
-        caption=new_caption,
-        reply_markup=reply_markup,
-        parse_mode='HTML'
-    )
+    if not decided:
+        await query.answer("ℹ️ Video ini sudah diputuskan atau batch sudah kadaluarsa")
+        return
     
-    await query.answer("👎 Anda tidak menyukai video ini")
-    await send_log(context, f"User {user_id} tidak menyukai video dari user {original_sender_id} (Message ID: {message_id})")
+    await query.answer(f"{'✅ Disetujui' if approve else '❌ Ditolak'}: {len(decided)} video")
+    text, reply_markup = moderation_queue.review_message(batch_id, batch_items)
+    if text:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    if not approve:
+        spawn_background(notify_rejected(context.bot, decided))
+    await send_log(context, f"Admin {'menyetujui' if approve else 'menolak'} video moderasi: {', '.join(f'#{item.id}' for item in decided)}")
+
+# Chat member handlers
+async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Keep the member roster in sync with joins, leaves and bans in the channel and group"""
+    member_roster.apply(update.chat_member)
 
 # Message handlers
+class Submission:
+    """A video message on its way through the submission pipeline"""
+
+    __slots__ = ('update', 'context', 'user_id', 'username', 'caption', 'video', 'now', 'cooldown_claimed')
+
+    def __init__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self.update = update
+        self.context = context
+        self.user_id = update.effective_user.id
+        self.username = update.effective_user.username
+        self.caption = update.message.caption
+        self.video = update.message.video
+        self.now = time.time()
+        self.cooldown_claimed = False
+
+# Tahap validasi: menerima Submission, mengembalikan None kalau lolos atau pesan penolakan (HTML) untuk user
+async def check_username(submission: Submission):
+    if not submission.username:
+        return (
+            "⚠️ <b>USERNAME DIPERLUKAN</b>\n\n"
+            "Untuk mengirim menfes, Anda harus memiliki username Telegram.\n"
+            "Silakan atur username di pengaturan profil Telegram Anda terlebih dahulu."
+        )
+
+async def check_caption(submission: Submission):
+    if not submission.caption or submission.caption.strip() == "":
+        return (
+            "⚠️ <b>CAPTION DIPERLUKAN</b>\n\n"
+            "Untuk mengirim menfes, video Anda harus memiliki caption/pesan.\n"
+            "Silakan kirim ulang video dengan menambahkan caption."
+        )
+
+async def check_banned_terms(submission: Submission):
+    term = caption_filter.check(submission.caption)
+    if term is None:
+        return None
+    await send_log(
+        submission.context,
+        f"Caption dari user {submission.user_id} (@{submission.username}) ditolak filter: {term}",
+        event='caption_filter'
+    )
+    # Istilah yang kena tidak disebutkan ke user supaya filter tidak mudah diakali
+    return (
+        "🚫 <b>CAPTION DITOLAK</b>\n\n"
+        "Caption Anda mengandung kata yang tidak diizinkan.\n"
+        "Silakan kirim ulang video dengan caption lain."
+    )
+
+async def check_duration(submission: Submission):
+    if submission.video.duration > MAX_VIDEO_DURATION:
+        return (
+            "⚠️ <b>DURASI TERLALU PANJANG</b>\n\n"
+            f"Durasi video Anda adalah {submission.video.duration} detik.\n"
+            f"Maksimal durasi video yang diperbolehkan adalah {MAX_VIDEO_DURATION} detik."
+        )
+
+async def check_file_size(submission: Submission):
+    file_size = submission.video.file_size
+    if MAX_VIDEO_SIZE and file_size and file_size > MAX_VIDEO_SIZE:
+        return (
+            "⚠️ <b>UKURAN VIDEO TERLALU BESAR</b>\n\n"
+            f"Ukuran video Anda adalah {file_size / (1024 * 1024):.1f} MB.\n"
+            f"Maksimal ukuran video yang diperbolehkan adalah {MAX_VIDEO_SIZE / (1024 * 1024):.0f} MB."
+        )
+
+async def check_mime_type(submission: Submission):
+    mime_type = submission.video.mime_type
+    if ALLOWED_VIDEO_MIME_TYPES and mime_type and mime_type not in ALLOWED_VIDEO_MIME_TYPES:
+        return (
+            "⚠️ <b>FORMAT VIDEO TIDAK DIDUKUNG</b>\n\n"
+            f"Format video Anda ({mime_type}) tidak didukung.\n"
+            "Silakan kirim ulang video dalam format MP4."
+        )
+
+async def check_cooldown(submission: Submission):
+    # Claim atomic di state backend, jadi dua worker tidak bisa sama-sama menerima video dari user yang sama
+    # dalam COOLDOWN_TIME. Claim sekaligus memulai cooldown baru; pipeline melepasnya kalau tahap berikutnya gagal.
+    remaining_time = await state_backend.claim_cooldown(submission.user_id, submission.now)
+    if remaining_time > 0:
+        return (
+            "⏳ <b>MOHON TUNGGU</b>\n\n"
+            f"Anda harus menunggu {int(remaining_time)} detik lagi sebelum dapat mengirim video berikutnya."
+        )
+    submission.cooldown_claimed = True
+
+async def check_duplicate(submission: Submission):
+    # Video yang sama (file_unique_id) ditolak sebelum ada request ke Telegram
+    if await duplicate_index.is_duplicate(submission.video.file_unique_id):
+        return (
+            "♻️ <b>VIDEO SUDAH PERNAH DIKIRIM</b>\n\n"
+            "Video ini sudah pernah dikirim ke channel.\n"
+            "Silakan kirim video lain."
+        )
+
+async def check_joined(submission: Submission):
+    # Cek keanggotaan grup dan channel secara paralel (cache dulu, baru getChatMember)
+    is_group_member, is_channel_member = await verify_membership(submission.context, submission.user_id)
+    if is_group_member and is_channel_member:
+        return None
+    message_text = "⚠️ <b>AKSES DITOLAK</b>\n\n"
+    message_text += "Untuk mengirim menfes, Anda harus bergabung dengan:\n"
+    if not is_group_member:
+        message_text += "• Grup kami\n"
+    if not is_channel_member:
+        message_text += "• Channel kami\n"
+    message_text += "\nSilakan gunakan perintah /start untuk memulai proses verifikasi."
+    return message_text
+
+class SubmissionPipeline:
+    """Ordered validation stages for a submitted video: local checks, then cached, then network"""
+
+    def __init__(self, stages):
+        self.stages = stages  # list of (name, kind, check)
+        self.passed = {name: 0 for name, _, _ in stages}
+        self.rejected = {name: 0 for name, _, _ in stages}
+        self.seconds = {name: 0.0 for name, _, _ in stages}
+
+    async def run(self, submission: Submission) -> bool:
+        """Run the stages in order; on the first rejection reply to the user and return False"""
+        for name, kind, check in self.stages:
+            start = time.perf_counter()
+            try:
+                rejection = await check(submission)
+            except Exception:
+                await self._release(submission)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.seconds[name] += elapsed
+                metrics.observe('menfes_submission_stage_seconds', (('stage', name), ('kind', kind)), elapsed)
+            if rejection is None:
+                self.passed[name] += 1
+                continue
+            self.rejected[name] += 1
+            count_rejection(name)
+            await self._release(submission)
+            logger.info(f"User {submission.user_id} (@{submission.username}) ditolak di tahap {name}")
+            await submission.update.message.reply_html(rejection)
+            return False
+        return True
+
+    @staticmethod
+    async def _release(submission: Submission) -> None:
+        if submission.cooldown_claimed:
+            await state_backend.release_cooldown(submission.user_id, submission.now)
+            submission.cooldown_claimed = False
+
+    def stats_text(self) -> str:
+        lines = []
+        for name, kind, _ in self.stages:
+            runs = self.passed[name] + self.rejected[name]
+            avg_ms = self.seconds[name] / runs * 1000 if runs else 0.0
+            lines.append(f"• {name} ({kind}): lolos {self.passed[name]} | ditolak {self.rejected[name]} | {avg_ms:.2f} ms")
+        return "\n".join(lines)
+
+# Urutan dari yang paling murah: tahap lokal, lalu cache (bisa jatuh ke database), lalu request ke Telegram.
+# User dibanned dan chat non-privat sudah dibuang oleh UpdateGate sebelum sampai ke sini.
+submission_pipeline = SubmissionPipeline([
+    ('username', 'local', check_username),
+    ('caption', 'local', check_caption),
+    ('duration', 'local', check_duration),
+    ('file_size', 'local', check_file_size),
+    ('mime_type', 'local', check_mime_type),
+    ('banned_terms', 'local', check_banned_terms),
+    ('cooldown', 'local', check_cooldown),
+    ('duplicate', 'cached', check_duplicate),
+    ('membership', 'network', check_joined),
+])
+
 async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle video messages"""
     try:
-        # Cek apakah pesan diterima di chat privat (bukan grup)
-        if update.effective_chat.type != 'private':
-            # Abaikan pesan dari grup
-            return
-            
-        user_id = update.effective_user.id
-        username = update.effective_user.username
-        
-        # Cek apakah user memiliki username
-        if not username:
-            await update.message.reply_html(
-                "⚠️ <b>USERNAME DIPERLUKAN</b>\n\n"
-                "Untuk mengirim menfes, Anda harus memiliki username Telegram.\n"
-                "Silakan atur username di pengaturan profil Telegram Anda terlebih dahulu."
-            )
-            await send_log(context, f"User {user_id} mencoba mengirim video tanpa username")
-            return
-            
-        # Cek apakah ada caption
-        caption = update.message.caption
-        if not caption or caption.strip() == "":
-            await update.message.reply_html(
-                "⚠️ <b>CAPTION DIPERLUKAN</b>\n\n"
-                "Untuk mengirim menfes, video Anda harus memiliki caption/pesan.\n"
-                "Silakan kirim ulang video dengan menambahkan caption."
-            )
-            await send_log(context, f"User {user_id} (@{username}) mencoba mengirim video tanpa caption")
+        submission = Submission(update, context)
+        if not await submission_pipeline.run(submission):
             return
-            
+
+        user_id = submission.user_id
+        username = submission.username
+        caption = submission.caption
+        video_duration = submission.video.duration
+        file_unique_id = submission.video.file_unique_id
+        now = submission.now
         first_name = update.effective_user.first_name or ""
         last_name = update.effective_user.last_name or ""
         full_name = f"{first_name} {last_name}".strip()
         
-        # Check if user is blacklisted
-        if is_user_blacklisted(user_id):
-            await update.message.reply_text("❌ Anda telah dibanned dari menggunakan bot ini.")
-            return
-        
-        # Cek keanggotaan grup dengan metode yang lebih robust
-        is_group_member = await check_membership(
-            context, 
-            user_id, 
-            GROUP_ID, 
-            retry_with_username=True, 
-            chat_username=GROUP_USERNAME
-        )
-        
-        # Cek keanggotaan channel dengan metode yang lebih robust
-        is_channel_member = await check_membership(
-            context, 
-            user_id, 
-            CHANNEL_NUMERIC_ID if CHANNEL_NUMERIC_ID else CHANNEL_ID, 
-            retry_with_username=True, 
-            chat_username=CHANNEL_ID.replace('@', '') if CHANNEL_ID.startswith('@') else CHANNEL_ID
-        )
-        
-        if not is_group_member or not is_channel_member:
-            message_text = "⚠️ <b>AKSES DITOLAK</b>\n\n"
-            message_text += "Untuk mengirim menfes, Anda harus bergabung dengan:\n"
-            
-            if not is_group_member:
-                message_text += "• Grup kami\n"
-            
-            if not is_channel_member:
-                message_text += "• Channel kami\n"
-            
-            message_text += "\nSilakan gunakan perintah /start untuk memulai proses verifikasi."
-            
-            await update.message.reply_html(message_text)
-            return
-            
-        # Check cooldown
-        now = time.time()
-        if user_id in last_message_time and (now - last_message_time[user_id] < COOLDOWN_TIME):
-            remaining_time = int(COOLDOWN_TIME - (now - last_message_time[user_id]))
-            await update.message.reply_html(
-                "⏳ <b>MOHON TUNGGU</b>\n\n"
-                f"Anda harus menunggu {remaining_time} detik lagi sebelum dapat mengirim video berikutnya."
-            )
-            return
-        
-        # Check video duration
-        video_duration = update.message.video.duration
-        if video_duration > MAX_VIDEO_DURATION:
+        if MODERATION_MODE:
+            # Video masuk antrian; admin me-review per batch dan publisher yang memposting ke channel
+            item = moderation_queue.submit(user_id, username, submission.video.file_id, video_duration, caption)
+            duplicate_index.add(file_unique_id, now)
             await update.message.reply_html(
-                "⚠️ <b>DURASI TERLALU PANJANG</b>\n\n"
-                f"Durasi video Anda adalah {video_duration} detik.\n"
-                f"Maksimal durasi video yang diperbolehkan adalah {MAX_VIDEO_DURATION} detik."
+                "🕒 <b>VIDEO MASUK ANTRIAN MODERASI</b>\n\n"
+                f"Video Anda (#{item.id}) akan diposting ke channel setelah disetujui admin.\n"
+                "Anda akan mendapat pesan saat video sudah diposting."
             )
+            await send_log(context, f"User {user_id} (@{username}) mengirim video #{item.id} ke antrian moderasi ({video_duration} detik)")
             return
         
         # Format caption baru dengan username dan informasi bot
-        formatted_caption = f"📨 <b>MENFES VIDEO</b>\n\n"
-        
-        if caption:
-            formatted_caption += f"<b>Pesan:</b>\n{caption}\n\n"
-            
-        formatted_caption += f"<i>Dikirim oleh: @{username}</i>\n"
-        formatted_caption += f"<i>Via: @TemanRandomMenfes_bot</i>"
+        formatted_caption = format_menfes_caption(caption, username)
         
         # Send video to channel
-        sent_message = await context.bot.send_video(
-            CHANNEL_ID,
-            update.message.video.file_id,
-            caption=formatted_caption,
-            parse_mode='HTML'
-        )
-        
-        # Update last message time
-        last_message_time[user_id] = now
+        try:
+            sent_message = await context.bot.send_video(
+                CHANNEL_ID,
+                submission.video.file_id,
+                caption=formatted_caption,
+                parse_mode='HTML',
+                reply_markup=build_vote_keyboard(user_id)
+            )
+        except Exception:
+            # Video tidak terkirim, user boleh langsung mencoba lagi
+            await state_backend.release_cooldown(user_id, now)
+            raise
+        vote_store.register_post(sent_message.chat.id, sent_message.message_id, formatted_caption, user_id, sent_message.date.timestamp())
+        duplicate_index.add(file_unique_id, now)
+        state_store.save_submission(user_id, username, sent_message.chat.id, sent_message.message_id, video_duration, caption)
         
         # Send confirmation to sender
         await update.message.reply_html(
@@ -568,118 +4160,32 @@ async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "Terima kasih telah menggunakan Menfes Video Bot!"
         )
         
-        # Send detailed log to admin
-        await context.bot.send_message(
-            ADMIN_ID,
-            f"📤 <b>VIDEO MENFES TERKIRIM</b>\n\n"
-            f"<b>Pengirim:</b>\n"
+        # Detail pengiriman masuk ke digest admin bersama log lainnya
+        await send_log(
+            context,
+            f"📤 VIDEO MENFES TERKIRIM\n"
+            f"User {user_id} (@{username}) mengirim video menfes dengan durasi {video_duration} detik\n"
+            f"Pengirim:\n"
             f"• ID: {user_id}\n"
             f"• Username: @{username}\n"
             f"• Nama: {full_name}\n\n"
-            f"<b>Detail Video:</b>\n"
+            f"Detail Video:\n"
             f"• Durasi: {video_duration} detik\n"
             f"• Caption: {caption}\n"
             f"• Message ID: {sent_message.message_id}\n"
-            f"• Waktu: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            parse_mode='HTML'
-        )
-        
-        await send_log(context, f"User {user_id} (@{username}) mengirim video menfes dengan durasi {video_duration} detik")
-    except Exception as e:
-        await send_log(context, f"Error saat memproses video: {e}", True)
-        await update.message.reply_text("❌ Terjadi kesalahan saat mengirim video Anda. Silakan coba lagi nanti.")
-        
-        # Check cooldown
-        now = time.time()
-        if user_id in last_message_time and (now - last_message_time[user_id] < COOLDOWN_TIME):
-            remaining_time = int(COOLDOWN_TIME - (now - last_message_time[user_id]))
-            await update.message.reply_html(
-                "⏳ <b>MOHON TUNGGU</b>\n\n"
-                f"Anda harus menunggu {remaining_time} detik lagi sebelum dapat mengirim video berikutnya."
-            )
-            return
-        
-        # Check video duration
-        video_duration = update.message.video.duration
-        if video_duration > MAX_VIDEO_DURATION:
-            await update.message.reply_html(
-                "⚠️ <b>DURASI TERLALU PANJANG</b>\n\n"
-                f"Durasi video Anda adalah {video_duration} detik.\n"
-                f"Maksimal durasi video yang diperbolehkan adalah {MAX_VIDEO_DURATION} detik."
-            )
-            return
-        
-        # Get caption if any
-        caption = update.message.caption or ""
-        
-        # Create keyboard for like/dislike buttons
-        keyboard = [
-            [
-                InlineKeyboardButton("👍 Like", callback_data=f"like_{user_id}"),
-                InlineKeyboardButton("👎 Dislike", callback_data=f"dislike_{user_id}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Send video to channel
-        sent_message = await context.bot.send_video(
-            CHANNEL_ID,
-            update.message.video.file_id,
-            caption=f"{caption}\n\n<i>👍 0 | 👎 0</i>" if caption else "<i>👍 0 | 👎 0</i>",
-            parse_mode='HTML',
-            reply_markup=reply_markup
-        )
-        
-        # Update last message time
-        last_message_time[user_id] = now
-        
-        # Send confirmation to sender
-        await update.message.reply_html(
-            "✅ <b>VIDEO BERHASIL DIKIRIM!</b>\n\n"
-            "Video Anda telah berhasil dikirim ke channel secara anonim.\n"
-            "Terima kasih telah menggunakan Menfes Video Bot!"
-        )
-        
-        # Send detailed log to admin
-        await context.bot.send_message(
-            ADMIN_ID,
-            f"📤 <b>VIDEO MENFES TERKIRIM</b>\n\n"
-            f"<b>Pengirim:</b>\n"
-            f"• ID: {user_id}\n"
-            f"• Username: @{username}\n"
-            f"• Nama: {full_name}\n\n"
-            f"<b>Detail Video:</b>\n"
-            f"• Durasi: {video_duration} detik\n"
-            f"• Caption: {caption if caption else '(Tidak ada caption)'}\n"
-            f"• Message ID: {sent_message.message_id}\n"
-            f"• Waktu: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            parse_mode='HTML'
+            f"• Waktu: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
-        
-        await send_log(context, f"User {user_id} (@{username}) mengirim video menfes dengan durasi {video_duration} detik")
     except Exception as e:
         await send_log(context, f"Error saat memproses video: {e}", True)
         await update.message.reply_text("❌ Terjadi kesalahan saat mengirim video Anda. Silakan coba lagi nanti.")
 
 async def handle_other_messages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle non-video messages"""
-    # Cek apakah pesan diterima di chat privat (bukan grup)
-    if update.effective_chat.type != 'private':
-        # Abaikan pesan dari grup
-        return
-        
     # Skip if message is a command or video (already handled)
     if update.message.video or (update.message.text and update.message.text.startswith('/')):
         return
         
     try:
-        user_id = update.effective_user.id
-        
-        # Check if user is blacklisted
-        if is_user_blacklisted(user_id):
-            await update.message.reply_text("❌ Anda telah dibanned dari menggunakan bot ini.")
-            return
-            
         await update.message.reply_html(
             "📹 <b>PERHATIAN</b>\n\n"
             "Bot ini hanya menerima video menfes.\n"
@@ -689,69 +4195,976 @@ async def handle_other_messages(update: Update, context: ContextTypes.DEFAULT_TY
     except Exception as e:
         await send_log(context, f"Error saat memproses pesan non-video: {e}", True)
 
-async def set_bot_description(application: Application) -> None:
-    """Set bot description and commands on startup"""
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while updates of the same user run one at a time, in order"""
+
+    def __init__(self, max_concurrent_updates: int, max_queued_per_user: int = PER_USER_QUEUE_LIMIT):
+        super().__init__(max_concurrent_updates)
+        self.max_queued_per_user = max_queued_per_user
+        self._queues = {}  # user_id -> deque of coroutines waiting behind the running one
+        self.dropped = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def active_users(self) -> int:
+        return len(self._queues)
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            # Update tanpa user (misal post channel) tidak perlu diurutkan
+            await coroutine
+            return
+
+        pending = self._queues.get(user.id)
+        if pending is not None:
+            # User ini sedang diproses: antrikan di belakangnya dan lepas slot concurrency,
+            # jadi satu user maksimal memakai satu slot
+            if len(pending) >= self.max_queued_per_user:
+                self.dropped += 1
+                coroutine.close()
+                logger.warning(f"Dropping update from user {user.id}: {len(pending)} update(s) already queued")
+                return
+            pending.append(coroutine)
+            return
+
+        pending = self._queues[user.id] = deque()
+        try:
+            await self._run(coroutine)
+            while pending:
+                await self._run(pending.popleft())
+        finally:
+            # Antrian kosong dihapus supaya memori tidak tumbuh per user
+            del self._queues[user.id]
+            while pending:
+                pending.popleft().close()
+
+    @staticmethod
+    async def _run(coroutine) -> None:
+        try:
+            await coroutine
+        except Exception as e:
+            logger.error(f"Unhandled error while processing update: {e}")
+
+class WebhookServer:
+    """Minimal HTTP/1.1 server that accepts Telegram webhook updates and queues them for the Application"""
+
+    def __init__(self, application: Application, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET_TOKEN):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self._server = None
+        self._connections = set()
+        self.accepted = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port, limit=WEBHOOK_MAX_HEADER)
+        logger.info(f"Webhook server listening on http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            # Tutup koneksi keep-alive yang masih menunggu request berikutnya
+            for task in list(self._connections):
+                task.cancel()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            # Keep-alive: layani beberapa request di koneksi yang sama sampai client menutup
+            while await self._handle_request(reader, writer):
+                pass
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Webhook connection error: {e}")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: str, keep_alive: bool = False) -> None:
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+    async def _reject(self, writer: asyncio.StreamWriter, status: str) -> bool:
+        self.rejected += 1
+        await self._respond(writer, status)
+        return False
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Handle one request, returns True if the connection can be reused"""
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=WEBHOOK_READ_TIMEOUT)
+        request_line, *header_lines = head.decode('latin-1').split("\r\n")
+        parts = request_line.split(" ")
+        if len(parts) != 3:
+            return await self._reject(writer, "400 Bad Request")
+        method, path, version = parts
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if path.split("?", 1)[0] != self.path:
+            return await self._reject(writer, "404 Not Found")
+        if method != "POST":
+            return await self._reject(writer, "405 Method Not Allowed")
+        if not hmac.compare_digest(
+            headers.get("x-telegram-bot-api-secret-token", "").encode(), self.secret_token.encode()
+        ):
+            return await self._reject(writer, "403 Forbidden")
+        if not headers.get("content-length", "").isdigit():
+            return await self._reject(writer, "411 Length Required")
+        length = int(headers["content-length"])
+        if length > WEBHOOK_MAX_BODY:
+            return await self._reject(writer, "413 Payload Too Large")
+
+        body = await asyncio.wait_for(reader.readexactly(length), timeout=WEBHOOK_READ_TIMEOUT)
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Webhook received invalid update: {e}")
+            return await self._reject(writer, "400 Bad Request")
+
+        # Update langsung masuk antrian, handler jalan setelah response terkirim
+        self.application.update_queue.put_nowait(update)
+        self.accepted += 1
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        await self._respond(writer, "200 OK", keep_alive)
+        return keep_alive
+
+WEBHOOK_SECRET_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+def webhook_config_error():
+    """Why the webhook settings are unusable, or None when they are fine"""
+    # Tanpa secret token siapa pun yang tahu URL-nya bisa mengirim update palsu (termasuk from.id = ADMIN_ID)
+    if not WEBHOOK_SECRET_TOKEN_RE.fullmatch(WEBHOOK_SECRET_TOKEN):
+        return "WEBHOOK_SECRET_TOKEN wajib diisi (1-256 karakter: A-Z, a-z, 0-9, _ dan -)"
+    if not WEBHOOK_URL.startswith('https://') or len(WEBHOOK_URL) <= len('https://'):
+        return "WEBHOOK_URL wajib diisi dengan URL HTTPS publik, misal https://bot.example.com/menfes-webhook"
+    return None
+
+async def run_webhook(application: Application) -> None:
+    """Run the bot with a local webhook server instead of long polling"""
+    error = webhook_config_error()
+    if error:
+        sys.exit(error)
+    server = WebhookServer(application)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # Urutan hook sama dengan run_polling: post_init, ..., stop, post_stop, shutdown, post_shutdown
     try:
-        await application.bot.set_my_description(
-            "✨ Menfes Video Bot ✨\n\n"
-            "Kirim video ke channel. Aturan:\n"
-            f"• Maksimal {MAX_VIDEO_DURATION} detik\n"
-            "• Wajib memiliki caption/pesan\n"
-            "• Wajib memiliki username Telegram\n"
-            "• Interval pengiriman 3 menit\n"
-            "• Tidak mengandung konten sensitif\n\n"
-            "Cara penggunaan: Kirim video beserta caption sebagai pesan."
+        async with application:
+            try:
+                if application.post_init:
+                    await application.post_init(application)
+                await server.start()
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET_TOKEN,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                await application.start()
+                logger.info(f"Webhook set to {WEBHOOK_URL}")
+                await stop_event.wait()
+            finally:
+                await server.stop()
+                if application.running:
+                    await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+    finally:
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# Mode multi-proses: supervisor polling, worker memproses
+worker_index = None  # Index of this process in worker mode, None when running as a single process
+
+def route_update(update: Update, workers: int) -> int:
+    """Index of the worker that handles an update"""
+    # Vote, /top dan moderasi ke worker 0: hitungan vote, edit caption, leaderboard dan antrian moderasi
+    # semua post ada di satu proses
+    query = update.callback_query
+    if query is not None and (query.data or "").startswith(('like_', 'dislike_', 'mod_')):
+        return 0
+    message = update.message
+    if message is not None:
+        if (message.text or "").startswith('/top'):
+            return 0
+        if MODERATION_MODE and message.video:
+            return 0
+    if update.chat_member is not None:
+        # effective_user bisa admin yang melakukan ban; entri roster milik worker anggota yang bersangkutan
+        return update.chat_member.new_chat_member.user.id % workers
+    # Semua update lain dari satu user ke worker yang sama, jadi urutan dan cooldown-nya terjaga
+    user = update.effective_user
+    return (user.id if user else update.update_id) % workers
+
+def run_worker(index: int, updates, taken, global_bucket: SharedTokenBucket, group_slots: list, admin_events) -> None:
+    """Entry point of a worker process started by WorkerSupervisor"""
+    global worker_index, LOG_FILE
+    worker_index = index
+    # Ctrl+C mengenai seluruh process group; worker dihentikan supervisor lewat sentinel (atau SIGTERM)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    root, ext = os.path.splitext(LOG_FILE)
+    LOG_FILE = f"{root}.worker{index}{ext}"
+    setup_logging()
+    outbound_scheduler.use_shared_budget(global_bucket, group_slots)
+    duplicate_index.filter_authoritative = False
+    # Satu digest log untuk admin: worker lain meneruskan event-nya ke worker 0
+    if index == 0:
+        admin_log_sink.collect_from(admin_events)
+    else:
+        admin_events.cancel_join_thread()
+        admin_log_sink.forward_to(admin_events)
+    if METRICS_PORT:
+        metrics_server.port = METRICS_PORT + index
+    try:
+        asyncio.run(_run_worker(index, updates, taken))
+    finally:
+        stop_logging()
+
+def _next_updates(updates, limit: int = 100) -> list:
+    """Block up to a second for the next update, then take whatever else is already queued"""
+    try:
+        batch = [updates.get(timeout=1)]
+    except queue.Empty:
+        return []
+    while batch[-1] is not None and len(batch) < limit:
+        try:
+            batch.append(updates.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+async def _run_worker(index: int, updates, taken) -> None:
+    application = build_application(polling=False)
+    stop_event = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        logger.info(f"Worker {index} started (pid {os.getpid()})")
+        try:
+            while not stop_event.is_set():
+                for data in await asyncio.to_thread(_next_updates, updates):
+                    if data is None:
+                        # Sentinel dari supervisor: semua update sebelumnya sudah masuk update_queue
+                        stop_event.set()
+                        break
+                    # Dicatat sebelum diproses: kalau worker crash, supervisor mengirim ulang hanya yang belum diambil
+                    taken.value = data['update_id']
+                    await application.update_queue.put(Update.de_json(data, application.bot))
+        finally:
+            # stop() menyelesaikan update yang sudah ada di update_queue dulu
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            logger.info(f"Worker {index} stopped")
+
+class WorkerSupervisor:
+    """Receives updates once and routes them to worker processes, restarting workers that crash"""
+
+    def __init__(self, workers: int = WORKER_PROCESSES):
+        self.workers = workers
+        # spawn: worker mulai dari interpreter bersih, tanpa event loop, thread atau koneksi milik supervisor
+        self._context = multiprocessing.get_context('spawn')
+        # Budget global dan grup/channel dibagi semua worker; bucket chat privat cukup per worker
+        self._global_bucket = SharedTokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_RATE, self._context)
+        self._group_slots = [
+            SharedTokenBucket(OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST, self._context)
+            for _ in range(WORKER_GROUP_SLOTS)
+        ]
+        self._queues = [self._context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self._admin_events = self._context.Queue(LOG_QUEUE_SIZE)  # admin log events of workers 1..N-1 for worker 0
+        self._taken = [self._context.Value('q', -1) for _ in range(workers)]  # last update_id each worker took
+        self._sent = [deque() for _ in range(workers)]  # (update_id, data) put in the queue, maybe not taken yet
+        self._processes = [None] * workers
+        self._started_at = [0.0] * workers
+        self._restart_at = [None] * workers  # monotonic time a crashed worker is due to be restarted
+        self._backoff = [WORKER_RESTART_DELAY] * workers
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.routed = [0] * workers
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._queues[index], self._taken[index], self._global_bucket, self._group_slots, self._admin_events),
+            name=f"menfes-worker-{index}"
         )
-        
-        await application.bot.set_my_commands([
-            ("start", "Mulai bot dan verifikasi keanggotaan"),
-            ("help", "Bantuan penggunaan bot"),
-            ("ban", "Ban user dari menggunakan bot (admin only)")
-        ])
-        
-        # Dapatkan ID numeric dari channel dan grup yang digunakan
-        global CHANNEL_NUMERIC_ID, GROUP_ID
-        
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Worker {index} spawned (pid {process.pid})")
+
+    def _check_workers(self, now: float) -> None:
+        """Restart workers that exited on their own, backing off when one keeps crashing"""
+        for index, process in enumerate(self._processes):
+            if self._restart_at[index] is not None:
+                if now >= self._restart_at[index]:
+                    self._restart_at[index] = None
+                    self.restarts += 1
+                    self._spawn(index)
+                continue
+            if process.is_alive():
+                continue
+            if now - self._started_at[index] >= WORKER_STABLE_TIME:
+                self._backoff[index] = WORKER_RESTART_DELAY
+            delay = self._backoff[index]
+            self._backoff[index] = min(delay * 2, WORKER_RESTART_MAX_DELAY)
+            self._restart_at[index] = now + delay
+            waiting = self._replace_queue(index)
+            logger.error(
+                f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}, "
+                f"restarting in {delay}s ({waiting} update(s) waiting)"
+            )
+            process.close()
+
+    def _forget_taken(self, index: int) -> None:
+        taken = self._taken[index].value
+        sent = self._sent[index]
+        while sent and sent[0][0] <= taken:
+            sent.popleft()
+
+    def _replace_queue(self, index: int) -> int:
+        """Give a crashed worker's successor a fresh queue holding the updates it never took"""
+        # Antrian lama tidak dipakai lagi: worker yang di-kill saat memegang lock baca-nya membuat get() macet selamanya
+        old_queue = self._queues[index]
+        old_queue.close()
+        old_queue.cancel_join_thread()
+        self._forget_taken(index)
+        self._queues[index] = self._context.Queue(WORKER_QUEUE_SIZE)
+        for _, data in self._sent[index]:
+            self._queues[index].put_nowait(data)
+        return len(self._sent[index])
+
+    async def _monitor(self) -> None:
+        while not self._stopping:
+            self._check_workers(time.monotonic())
+            # Flag + wakeup, bukan cancel (lihat OutboundScheduler.shutdown)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _route(self, update: Update) -> None:
+        index = route_update(update, self.workers)
+        data = update.to_dict()
+        self._forget_taken(index)
+        while True:
+            try:
+                # Antrian dibaca ulang tiap percobaan, bisa sudah diganti kalau worker-nya crash
+                self._queues[index].put_nowait(data)
+                break
+            except queue.Full:
+                # Worker tertinggal atau sedang restart: polling ditahan, update tidak dibuang
+                if self._stopping:
+                    logger.warning(f"Update {update.update_id} dropped, worker {index} queue full at shutdown")
+                    return
+                await asyncio.sleep(0.05)
+        self._sent[index].append((update.update_id, data))
+        self.routed[index] += 1
+
+    async def _poll(self, bot: Bot, stop_event: asyncio.Event) -> None:
+        offset = None
+        while not stop_event.is_set():
+            poll = asyncio.ensure_future(bot.get_updates(
+                offset=offset,
+                timeout=WORKER_POLL_TIMEOUT,
+                read_timeout=WORKER_POLL_TIMEOUT + 5,
+                allowed_updates=Update.ALL_TYPES
+            ))
+            stop_wait = asyncio.ensure_future(stop_event.wait())
+            await asyncio.wait({poll, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            stop_wait.cancel()
+            if not poll.done():
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except Exception as e:
+                logger.warning(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self._route(update)
+                offset = update.update_id + 1
+        if offset is not None:
+            # Konfirmasi offset ke Telegram supaya update yang sudah dibagi tidak dikirim ulang saat start berikutnya
+            try:
+                await bot.get_updates(offset=offset, timeout=0)
+            except Exception as e:
+                logger.warning(f"Failed to confirm update offset {offset}: {e}")
+
+    def _stop_workers(self) -> None:
+        """Let every worker finish its queued updates, killing the ones that don't within the timeout"""
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        running = []
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            if self._restart_at[index] is not None:
+                logger.warning(f"Worker {index} not running, {len(self._sent[index])} update(s) left unprocessed")
+                continue
+            try:
+                self._queues[index].put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+            running.append((index, process))
+        for index, process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop within {WORKER_SHUTDOWN_TIMEOUT}s, terminating")
+                process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+        for worker_queue in self._queues + [self._admin_events]:
+            worker_queue.close()
+            worker_queue.cancel_join_thread()
+
+    async def run(self) -> None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        monitor = None
+        bot_kwargs = {}
+        if BOT_API_BASE_URL:
+            bot_kwargs['base_url'] = BOT_API_BASE_URL
+        if BOT_API_BASE_FILE_URL:
+            bot_kwargs['base_file_url'] = BOT_API_BASE_FILE_URL
+        try:
+            async with Bot(BOT_TOKEN, **bot_kwargs) as bot:
+                await bot.delete_webhook()
+                # Bootstrap sekali di sini, worker cukup membaca chat ID dari bootstrap_cache (lihat set_bot_description)
+                bootstrap_cache.load()
+                await set_bot_profile(bot)
+                await _resolve_chat_ids_once(bot)
+                for index in range(self.workers):
+                    self._spawn(index)
+                monitor = loop.create_task(self._monitor())
+                logger.info(f"Supervisor polling for {self.workers} worker(s)")
+                await self._poll(bot, stop_event)
+        finally:
+            self._stopping = True
+            self._wakeup.set()
+            if monitor is not None:
+                await monitor
+            await asyncio.to_thread(self._stop_workers)
+            logger.info(f"Supervisor stopped: {sum(self.routed)} update(s) routed, {self.restarts} worker restart(s)")
+
+def collect_runtime_metrics():
+    """Gauges read from the other components when the metrics endpoint is scraped"""
+    for priority, depth in outbound_scheduler.queue_depths().items():
+        yield 'menfes_bot_api_queue_depth', (('priority', priority),), depth
+    yield 'menfes_bot_api_retry_after_total', (), outbound_scheduler.retry_after_hits
+    yield 'menfes_membership_cache_entries', (), len(membership_cache)
+    for result in ('hits', 'misses', 'coalesced', 'stale_hits', 'errors'):
+        yield 'menfes_membership_cache_lookups_total', (('result', result),), getattr(membership_cache, result)
+    yield 'menfes_roster_members', (), len(member_roster)
+    for result, count in (('hit', member_roster.hits), ('fallback', member_roster.fallbacks)):
+        yield 'menfes_roster_lookups_total', (('result', result),), count
+    yield 'menfes_blacklist_size', (), len(blacklist_index)
+    yield 'menfes_gate_users_tracked', (), len(update_gate)
+    yield 'menfes_vote_posts_tracked', (), len(vote_store)
+    yield 'menfes_votes_total', (), vote_store.votes
+    yield 'menfes_cooldowns_active', (), len(last_message_time)
+    yield 'menfes_log_records_dropped_total', (), log_records_dropped()
+    yield 'menfes_duplicates_caught_total', (), duplicate_index.caught
+    yield 'menfes_caption_filter_terms', (), len(caption_filter)
+    yield 'menfes_duplicate_db_lookups_total', (), duplicate_index.db_lookups
+
+metrics.add_collector(collect_runtime_metrics)
+metrics.describe('menfes_bot_api_retry_after_total', 'counter', "RetryAfter responses received from Telegram")
+metrics.describe('menfes_membership_cache_lookups_total', 'counter', "Membership cache lookups by result")
+metrics.describe('menfes_roster_members', 'gauge', "Channel/group members known to the local roster")
+metrics.describe('menfes_roster_lookups_total', 'counter', "Membership checks answered by the roster or sent to the API")
+metrics.describe('menfes_votes_total', 'counter', "Like/dislike votes recorded")
+metrics.describe('menfes_log_records_dropped_total', 'counter', "Log records dropped because the log queue was full")
+metrics.describe('menfes_duplicates_caught_total', 'counter', "Resubmitted videos rejected by file_unique_id")
+metrics.describe('menfes_duplicate_db_lookups_total', 'counter', "Duplicate checks that needed a database lookup")
+metrics.describe('menfes_caption_filter_terms', 'gauge', "Banned terms compiled into the caption filter")
+
+class MetricsServer:
+    """Local HTTP server exposing the metrics in Prometheus text format"""
+
+    def __init__(self, listen: str = METRICS_LISTEN, port: int = METRICS_PORT, path: str = METRICS_PATH):
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port, limit=WEBHOOK_MAX_HEADER)
+        logger.info(f"Metrics endpoint listening on http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Satu request per koneksi, cukup untuk scraper Prometheus
         try:
-            # Ambil info channel
-            channel_info = await application.bot.get_chat(CHANNEL_ID)
-            CHANNEL_NUMERIC_ID = channel_info.id
-            logger.info(f"Channel ID resolved: {CHANNEL_ID} -> {CHANNEL_NUMERIC_ID}")
-            
-            # Ambil info grup berdasarkan username
-            group_info = await application.bot.get_chat(f"@{GROUP_USERNAME}")
-            GROUP_ID = group_info.id
-            logger.info(f"Group ID resolved: @{GROUP_USERNAME} -> {GROUP_ID}")
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=WEBHOOK_READ_TIMEOUT)
+            parts = head.decode('latin-1').split("\r\n", 1)[0].split(" ")
+            if len(parts) != 3 or parts[0] != "GET" or parts[1].split("?", 1)[0] != self.path:
+                status, body = "404 Not Found", b""
+            else:
+                status, body = "200 OK", metrics.render().encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Metrics connection error: {e}")
+        finally:
+            writer.close()
+
+metrics_server = MetricsServer()
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a helper thread and probes loop lag and task count, while enabled"""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, lag_interval: float = PROFILE_LAG_INTERVAL):
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self._thread = None
+        self._thread_stop = threading.Event()
+        self._monitor = None
+        self._stopping = False
+        self._loop_ident = None
+        self._stacks = {}  # collapsed stack "outer;...;inner" -> samples
+        self._lags = []
+        self._task_counts = []
+        self._peak_tasks = None  # Counter of coroutine names when the task count peaked
+        self._bot = None
+        self.started_at = None
+        self.deadline = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, bot: Bot, duration: float) -> None:
+        """Start sampling from inside the event loop for at most `duration` seconds"""
+        loop = asyncio.get_running_loop()
+        self._bot = bot
+        self._loop_ident = threading.get_ident()
+        self._stacks = {}
+        self._lags = []
+        self._task_counts = []
+        self._peak_tasks = None
+        self._stopping = False
+        self.started_at = time.time()
+        self.deadline = loop.time() + duration
+        self._thread_stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        self._thread.start()
+        self._monitor = loop.create_task(self._monitor_loop())
+
+    async def stop(self) -> str:
+        """Stop sampling, write the collapsed stacks to PROFILE_DIR and return the summary text"""
+        if not self.running:
+            return ""
+        # Flag, bukan cancel (lihat OutboundScheduler.shutdown)
+        self._stopping = True
+        self._thread_stop.set()
+        thread, self._thread = self._thread, None
+        await asyncio.to_thread(thread.join)
+        if self._monitor is not asyncio.current_task():
+            await self._monitor
+        self._monitor = None
+        path = await asyncio.to_thread(self._write)
+        return self.summary(path)
+
+    # Stack sampling (thread profiler)
+    def _sample_loop(self) -> None:
+        stacks = self._stacks
+        while not self._thread_stop.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_ident)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                key = ";".join(reversed(names))
+                stacks[key] = stacks.get(key, 0) + 1
+
+    # Event loop lag dan jumlah task
+    async def _monitor_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self._lags.append(max(0.0, loop.time() - start - self.lag_interval))
+            tasks = asyncio.all_tasks()
+            if not self._task_counts or len(tasks) > max(self._task_counts):
+                self._peak_tasks = Counter(task.get_coro().__qualname__ for task in tasks)
+            self._task_counts.append(len(tasks))
+            if loop.time() >= self.deadline and not self._stopping:
+                spawn_background(self._stop_and_report())
+                return
+
+    async def _stop_and_report(self) -> None:
+        text = await self.stop()
+        try:
+            for chunk in split_message(text):
+                await self._bot.send_message(ADMIN_ID, chunk, rate_limit_args={'priority': PRIORITY_REPLY})
         except Exception as e:
-            logger.error(f"Failed to resolve chat IDs: {e}")
+            logger.error(f"Failed to send profile summary: {e}")
+
+    # Hasil
+    def _write(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"menfes_{datetime.fromtimestamp(self.started_at).strftime('%Y%m%d_%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    @staticmethod
+    def _is_idle(stack: str) -> bool:
+        # Event loop menunggu I/O di selector = tidak ada pekerjaan
+        return stack.rsplit(";", 1)[-1].startswith("select (selectors.py")
+
+    @staticmethod
+    def _percentile(values, pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def summary(self, path: str) -> str:
+        total = sum(self._stacks.values())
+        busy = {stack: count for stack, count in self._stacks.items() if not self._is_idle(stack)}
+        busy_total = sum(busy.values())
+        self_time = Counter()
+        inclusive = Counter()
+        for stack, count in busy.items():
+            frames = stack.split(";")
+            self_time[frames[-1]] += count
+            for name in set(frames):
+                if "(menfes.py:" in name:
+                    inclusive[name] += count
+
+        def top(counter):
+            return [f"{count / busy_total * 100:5.1f}% {name}" for name, count in counter.most_common(PROFILE_TOP)] or ["-"]
+
+        lags_ms = [lag * 1000 for lag in self._lags]
+        peak = ", ".join(f"{name} x{count}" for name, count in (self._peak_tasks or Counter()).most_common(3))
+        avg_tasks = sum(self._task_counts) / len(self._task_counts) if self._task_counts else 0
+        lines = [
+            "🔬 HASIL PROFILER",
+            "",
+            f"• Durasi: {time.time() - self.started_at:.0f} detik | Sampel: {total} (sibuk {busy_total / total * 100 if total else 0:.1f}%)",
+            f"• Lag event loop: p50 {self._percentile(lags_ms, 50):.1f} ms | p99 {self._percentile(lags_ms, 99):.1f} ms | "
+            f"max {max(lags_ms, default=0):.1f} ms",
+            f"• Task asyncio: rata-rata {avg_tasks:.0f} | max {max(self._task_counts, default=0)}" + (f" ({peak})" if peak else ""),
+            f"• File: {path}",
+            "",
+            "Hot spot (self):",
+            *top(self_time),
+            "",
+            "Fungsi menfes.py (inklusif):",
+            *top(inclusive),
+        ]
+        return "\n".join(lines)
+
+    def status_text(self) -> str:
+        if not self.running:
+            return "• Profiler: mati"
+        remaining = self.deadline - asyncio.get_running_loop().time()
+        return f"• Profiler: jalan, sisa {max(0, remaining):.0f} detik | Stack unik: {len(self._stacks)}"
+
+profiler = SamplingProfiler()
+
+async def post_init(application: Application) -> None:
+    """Start background services once the bot is initialized"""
+    state_store.open()
+    await state_backend.open()
+    await asyncio.to_thread(caption_filter.open)
+    load_state()
+    spawn_background(state_sweeper())
+    admin_log_sink.start(application.bot)
+    member_roster.start(application.bot)
+    if worker_index in (None, 0):
+        # Di mode worker, publikasi moderasi dan digest leaderboard hanya dijalankan worker 0 (lihat route_update)
+        moderation_queue.start(application.bot)
+        leaderboard.start(application.bot)
+    if METRICS_PORT:
+        await metrics_server.start()
+    await set_bot_description(application)
+
+async def post_stop(application: Application) -> None:
+    """Flush pending admin logs and state writes before the bot shuts down"""
+    await metrics_server.stop()
+    if profiler.running:
+        await profiler.stop()
+    await moderation_queue.stop()
+    await leaderboard.stop()
+    await member_roster.stop()
+    await admin_log_sink.stop()
+    await state_backend.close()
+    await asyncio.to_thread(state_store.close)
+
+BOT_DESCRIPTION = (
+    "✨ Menfes Video Bot ✨\n\n"
+    "Kirim video ke channel. Aturan:\n"
+    f"• Maksimal {MAX_VIDEO_DURATION} detik\n"
+    "• Wajib memiliki caption/pesan\n"
+    "• Wajib memiliki username Telegram\n"
+    "• Interval pengiriman 3 menit\n"
+    "• Tidak mengandung konten sensitif\n\n"
+    "Cara penggunaan: Kirim video beserta caption sebagai pesan."
+)
+
+BOT_COMMANDS = [
+    ("start", "Mulai bot dan verifikasi keanggotaan"),
+    ("help", "Bantuan penggunaan bot"),
+    ("top", "Video terbaik hari ini, minggu ini & sepanjang masa"),
+    ("ban", "Ban user dari menggunakan bot (admin only)"),
+    ("importban", "Import daftar ban dari file (admin only)"),
+    ("exportban", "Export daftar ban ke file (admin only)"),
+    ("stats", "Statistik bot (admin only)"),
+    ("profile", "Profiler sampling start/stop (admin only)"),
+    ("filter", "Kelola kata terlarang di caption (admin only)"),
+]
+
+class BootstrapCache:
+    """JSON file remembering startup work already done: hashes of what was sent to Telegram and resolved chat IDs"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except (ValueError, OSError) as e:
+            logger.warning(f"Bootstrap cache {self.path} unreadable, starting fresh: {e}")
+            self.data = {}
+
+    def _write(self, data: dict) -> None:
+        # Nama tmp per proses: di mode worker supervisor dan worker bisa menyimpan bersamaan
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def save(self) -> None:
+        try:
+            await asyncio.to_thread(self._write, dict(self.data))
+        except OSError as e:
+            logger.error(f"Failed to save bootstrap cache: {e}")
+
+    @staticmethod
+    def content_hash(value) -> str:
+        return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+bootstrap_cache = BootstrapCache(BOOTSTRAP_CACHE_FILE)
+
+async def set_bot_description(application: Application) -> None:
+    """Set bot description and commands on startup and resolve the chat IDs"""
+    bootstrap_cache.load()
+    if worker_index is not None:
+        # Deskripsi, command dan chat ID sudah diurus supervisor sebelum worker dijalankan (lihat WorkerSupervisor.run)
+        await resolve_chat_ids(application.bot, refresh=False)
+        return
+    await set_bot_profile(application.bot)
+    await resolve_chat_ids(application.bot)
+
+async def set_bot_profile(bot: Bot) -> None:
+    """Send the description and commands, skipped when unchanged since the last start"""
+    changed = False
+    try:
+        # Hash termasuk ID bot, jadi ganti token berarti deskripsi dan command dikirim ulang
+        description_hash = bootstrap_cache.content_hash([bot.id, BOT_DESCRIPTION])
+        if bootstrap_cache.data.get('description_hash') != description_hash:
+            await bot.set_my_description(BOT_DESCRIPTION)
+            bootstrap_cache.data['description_hash'] = description_hash
+            changed = True
         
-        logger.info("Bot description and commands set successfully")
+        commands_hash = bootstrap_cache.content_hash([bot.id, BOT_COMMANDS])
+        if bootstrap_cache.data.get('commands_hash') != commands_hash:
+            await bot.set_my_commands(BOT_COMMANDS)
+            bootstrap_cache.data['commands_hash'] = commands_hash
+            changed = True
+        
+        logger.info(f"Bot description and commands {'set' if changed else 'unchanged, skipped'}")
     except Exception as e:
         logger.error(f"Error setting bot description and commands: {e}")
+    if changed:
+        await bootstrap_cache.save()
 
-def main() -> None:
-    """Start the bot"""
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+def _apply_chat_id(name: str, chat_id: int) -> None:
+    global CHANNEL_NUMERIC_ID, GROUP_ID
+    if name == CHANNEL_ID:
+        CHANNEL_NUMERIC_ID = chat_id
+    else:
+        GROUP_ID = chat_id
+
+async def _resolve_chat_ids_once(bot: Bot) -> bool:
+    """Look up the numeric IDs of the channel and group, returns True if both are known"""
+    cached = bootstrap_cache.data.setdefault('chat_ids', {})
+    resolved = True
+    for name in (CHANNEL_ID, f"@{GROUP_USERNAME}"):
+        try:
+            chat_info = await bot.get_chat(name)
+        except Exception as e:
+            # Satu lookup yang gagal tidak menghalangi lookup lainnya; sementara pakai ID dari cache kalau ada
+            logger.error(f"Failed to resolve chat ID of {name}: {e}")
+            if name in cached:
+                _apply_chat_id(name, cached[name])
+            resolved = False
+            continue
+        if cached.get(name) != chat_info.id:
+            if name in cached:
+                logger.warning(f"Chat ID of {name} changed: {cached[name]} -> {chat_info.id}")
+            cached[name] = chat_info.id
+            await bootstrap_cache.save()
+        _apply_chat_id(name, chat_info.id)
+        logger.info(f"Chat ID resolved: {name} -> {chat_info.id}")
+    return resolved
+
+async def refresh_chat_ids(bot: Bot) -> None:
+    """Keep retrying the chat ID lookups with backoff until both succeed"""
+    delay = CHAT_ID_RETRY_DELAY
+    while not await _resolve_chat_ids_once(bot):
+        logger.warning(f"Chat IDs not fully resolved, retrying in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, CHAT_ID_RETRY_MAX_DELAY)
+
+async def resolve_chat_ids(bot: Bot, refresh: bool = True) -> None:
+    """Use chat IDs cached from the last run right away and refresh them in the background"""
+    cached = bootstrap_cache.data.get('chat_ids', {})
+    group_name = f"@{GROUP_USERNAME}"
+    if CHANNEL_ID in cached and group_name in cached:
+        _apply_chat_id(CHANNEL_ID, cached[CHANNEL_ID])
+        _apply_chat_id(group_name, cached[group_name])
+        logger.info(f"Chat IDs loaded from cache: {CHANNEL_ID} -> {CHANNEL_NUMERIC_ID}, {group_name} -> {GROUP_ID}")
+        if refresh:
+            spawn_background(refresh_chat_ids(bot))
+        return
+    # Belum ada cache: coba sekali sebelum mulai menerima update, sisanya diulang di background
+    if not await _resolve_chat_ids_once(bot):
+        spawn_background(refresh_chat_ids(bot))
+
+def build_application(request=None, rate_limiter=outbound_scheduler, polling: bool = True) -> Application:
+    """Create the Application with all handlers registered"""
+    builder = Application.builder().token(BOT_TOKEN)
+    if not polling:
+        # Worker tidak mengambil update sendiri, update datang dari WorkerSupervisor
+        builder = builder.updater(None)
+    if request is not None:
+        # Dipakai benchmark untuk mengganti koneksi ke Telegram dengan Bot API palsu
+        builder = builder.request(request).get_updates_request(request)
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    if BOT_API_BASE_FILE_URL:
+        builder = builder.base_file_url(BOT_API_BASE_FILE_URL)
+    if rate_limiter is not None:
+        builder = builder.rate_limiter(rate_limiter)
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    application = builder.build()
     
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("ban", ban_command))
+    # Add command handlers (setiap handler dibungkus untuk metrics latency/error)
+    # Gate jalan duluan untuk semua update; update yang dibuang tidak sampai ke handler lain
+    application.add_handler(TypeHandler(Update, update_gate.check), group=-1)
+    application.add_handler(CommandHandler("start", instrument_handler("start", start_command)))
+    application.add_handler(CommandHandler("help", instrument_handler("help", help_command)))
+    application.add_handler(CommandHandler("top", instrument_handler("top", top_command)))
+    application.add_handler(CommandHandler("ban", instrument_handler("ban", ban_command)))
+    application.add_handler(CommandHandler("profile", instrument_handler("profile", profile_command)))
+    application.add_handler(CommandHandler("filter", instrument_handler("filter", filter_command)))
+    application.add_handler(CommandHandler("importban", instrument_handler("importban", importban_command)))
+    application.add_handler(CommandHandler("exportban", instrument_handler("exportban", exportban_command)))
+    application.add_handler(CommandHandler("stats", instrument_handler("stats", stats_command)))
     
     # Add callback query handler
-    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(CallbackQueryHandler(instrument_handler("button_callback", button_callback)))
+    
+    if MEMBER_ROSTER:
+        application.add_handler(ChatMemberHandler(
+            instrument_handler("chat_member", handle_chat_member), ChatMemberHandler.CHAT_MEMBER
+        ))
     
     # Add message handlers
-    application.add_handler(MessageHandler(filters.VIDEO, handle_video))
-    application.add_handler(MessageHandler(filters.ALL, handle_other_messages))
+    application.add_handler(MessageHandler(filters.VIDEO, instrument_handler("handle_video", handle_video)))
+    application.add_handler(MessageHandler(filters.ALL, instrument_handler("handle_other_messages", handle_other_messages)))
     
-    # Set bot description and commands on startup
-    application.post_init = set_bot_description
+    # Set bot description and commands on startup, start/stop background services
+    application.post_init = post_init
+    application.post_stop = post_stop
+    return application
+
+def main() -> None:
+    """Start the bot"""
+    if WORKER_PROCESSES > 1 and USE_WEBHOOK:
+        sys.exit("WORKER_PROCESSES > 1 hanya mendukung polling, set USE_WEBHOOK = False")
+    if USE_WEBHOOK and webhook_config_error():
+        sys.exit(webhook_config_error())
+    setup_logging()
+    if WORKER_PROCESSES > 1:
+        # Supervisor tidak memproses update sendiri, Application dibuat di tiap worker
+        logger.info(f"Starting Menfes Video Bot with {WORKER_PROCESSES} workers...")
+        try:
+            asyncio.run(WorkerSupervisor().run())
+        finally:
+            stop_logging()
+        return
+
+    # Create application
+    application = build_application()
     
     # Start the bot
     logger.info("Starting Menfes Video Bot...")
-    application.run_polling()
+    try:
+        if USE_WEBHOOK:
+            asyncio.run(run_webhook(application))
+        else:
+            # chat_member tidak termasuk update default Telegram, harus diminta eksplisit untuk roster
+            application.run_polling(allowed_updates=Update.ALL_TYPES if MEMBER_ROSTER else None)
+    finally:
+        stop_logging()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,279 @@
+"""Local stand-in for a Redis server, enough for menfes.py's shared state backend (STATE_BACKEND = 'resp').
+
+Data hanya di memori, cocok untuk test dan development beberapa worker di satu mesin.
+Untuk production pakai Redis 6.2+ atau Valkey.
+
+Contoh:
+    python3 menfes_state_server.py                 # listen di 127.0.0.1:6379
+    python3 menfes_state_server.py --port 6380
+"""
+import argparse
+import asyncio
+import fnmatch
+import logging
+import time
+
+logger = logging.getLogger("menfes_state_server")
+
+# Tidak ada interpreter Lua: EVAL hanya menerima script yang dipakai menfes.py, teksnya harus sama persis
+# dengan RespStateBackend.RELEASE_SCRIPT
+COMPARE_AND_DELETE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+
+class CommandError(Exception):
+    """Sent back to the client as a RESP error reply"""
+
+
+class StateServer:
+    """In-memory key-value store speaking RESP2, implementing the commands menfes.py uses"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379):
+        self.host = host
+        self.port = port
+        self._data = {}  # key -> str | set | dict
+        self._expires = {}  # key -> monotonic deadline
+        self._server = None
+        self.commands = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"State server listening on {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # Protocol
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                try:
+                    reply = self.execute(args)
+                except CommandError as e:
+                    reply = e
+                writer.write(self.encode(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command (misal dari telnet/nc)
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+    @classmethod
+    def encode(cls, reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, CommandError):
+            return f"-ERR {reply}\r\n".encode()
+        if isinstance(reply, bool):
+            return f":{int(reply)}\r\n".encode()
+        if isinstance(reply, int):
+            return f":{reply}\r\n".encode()
+        if isinstance(reply, Status):
+            return f"+{reply}\r\n".encode()
+        if isinstance(reply, (list, tuple)):
+            return f"*{len(reply)}\r\n".encode() + b"".join(cls.encode(item) for item in reply)
+        data = str(reply).encode()
+        return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+    # Storage
+    def _alive(self, key: str) -> bool:
+        deadline = self._expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            del self._expires[key]
+            self._data.pop(key, None)
+        return key in self._data
+
+    def _get(self, key: str, kind):
+        if not self._alive(key):
+            return None
+        value = self._data[key]
+        if not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _get_or_create(self, key: str, kind):
+        value = self._get(key, kind)
+        if value is None:
+            value = self._data[key] = kind()
+        return value
+
+    def execute(self, args):
+        if not args:
+            raise CommandError("empty command")
+        self.commands += 1
+        handler = getattr(self, f"cmd_{args[0].lower()}", None)
+        if handler is None:
+            raise CommandError(f"unknown command '{args[0]}'")
+        try:
+            return handler(*args[1:])
+        except (TypeError, ValueError):
+            raise CommandError(f"wrong arguments for '{args[0]}' command")
+
+    # Commands
+    def cmd_ping(self, message=None):
+        return Status("PONG") if message is None else message
+
+    def cmd_flushall(self):
+        self._data.clear()
+        self._expires.clear()
+        return Status("OK")
+
+    def cmd_get(self, key):
+        return self._get(key, str)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        ttl_ms = None
+        for unit, scale in (("PX", 1), ("EX", 1000)):
+            if unit in options:
+                ttl_ms = int(options[options.index(unit) + 1]) * scale
+        exists = self._alive(key)
+        previous = self._get(key, str) if "GET" in options else None
+        if ("NX" in options and exists) or ("XX" in options and not exists):
+            return previous if "GET" in options else None
+        self._data[key] = value
+        if ttl_ms is not None:
+            self._expires[key] = time.monotonic() + ttl_ms / 1000
+        elif "KEEPTTL" not in options:
+            self._expires.pop(key, None)
+        return previous if "GET" in options else Status("OK")
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self._data[key]
+                self._expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_eval(self, script, numkeys, *args):
+        numkeys = int(numkeys)
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == COMPARE_AND_DELETE_SCRIPT:
+            # Satu event loop: GET dan DEL di sini tidak bisa diselingi command lain, sama seperti script di Redis
+            return self.cmd_del(keys[0]) if self.cmd_get(keys[0]) == argv[0] else 0
+        raise CommandError("NOSCRIPT only the scripts used by menfes.py are supported")
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_pexpire(self, key, ttl_ms):
+        if not self._alive(key):
+            return 0
+        self._expires[key] = time.monotonic() + int(ttl_ms) / 1000
+        return 1
+
+    def cmd_pttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self._expires.get(key)
+        return -1 if deadline is None else max(0, int((deadline - time.monotonic()) * 1000))
+
+    def cmd_keys(self, pattern):
+        return [key for key in list(self._data) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+    def cmd_sadd(self, key, *members):
+        members_set = self._get_or_create(key, set)
+        before = len(members_set)
+        members_set.update(members)
+        return len(members_set) - before
+
+    def cmd_srem(self, key, *members):
+        members_set = self._get(key, set) or set()
+        before = len(members_set)
+        members_set.difference_update(members)
+        return before - len(members_set)
+
+    def cmd_sismember(self, key, member):
+        return int(member in (self._get(key, set) or ()))
+
+    def cmd_scard(self, key):
+        return len(self._get(key, set) or ())
+
+    def cmd_sscan(self, key, cursor, *options):
+        # Cursor = posisi di daftar member terurut; cukup untuk set yang tidak berubah selama scan
+        count = int(options[options.index("COUNT") + 1]) if "COUNT" in options else 10
+        members = sorted(self._get(key, set) or ())
+        start = int(cursor)
+        end = start + count
+        return ["0" if end >= len(members) else str(end), members[start:end]]
+
+    def cmd_hsetnx(self, key, field, value):
+        fields = self._get_or_create(key, dict)
+        if field in fields:
+            return 0
+        fields[field] = value
+        return 1
+
+    def cmd_hset(self, key, *pairs):
+        fields = self._get_or_create(key, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in fields
+            fields[field] = value
+        return added
+
+    def cmd_hincrby(self, key, field, amount):
+        fields = self._get_or_create(key, dict)
+        fields[field] = str(int(fields.get(field, 0)) + int(amount))
+        return int(fields[field])
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        values = self._get(key, dict) or {}
+        return [values.get(field) for field in fields]
+
+
+class Status(str):
+    """Simple string reply (+OK) as opposed to a bulk string"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    return parser.parse_args(argv)
+
+
+async def serve(args) -> None:
+    server = StateServer(args.host, args.port)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main(argv=None) -> None:
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""End-to-end soak test: menfes.py (proses asli, polling) melawan server Bot API palsu di localhost.
+
+Populasi user sintetis mengirim /start, /help, video, pesan biasa, tombol "Cek Kembali" dan vote
+dengan laju rata-rata --user-rate update per user per jam selama --hours jam trafik. --speedup
+memadatkan trafik itu (misal --hours 4 --speedup 8 = 30 menit nyata dengan laju 8x lipat).
+Yang dilaporkan: throughput, latency p50/p90/p99/max (update dibuat sampai balasan pertama bot),
+RSS bot dari waktu ke waktu dan panggilan Bot API per update.
+
+Bot dijalankan dari salinan menfes.py di direktori sementara dengan BOT_API_BASE_URL diarahkan
+ke server palsu; konfigurasi lain bisa diganti lewat --set NAMA=nilai (literal Python).
+
+Contoh:
+    python3 soak_menfes.py                                     # 1 jam trafik 2000 user, real time
+    python3 soak_menfes.py --users 5000 --hours 4 --speedup 16 --output soak.json
+    python3 soak_menfes.py --speedup 60 --set CONCURRENT_UPDATES=32 --set COOLDOWN_TIME=3
+
+Dengan --speedup besar, limit kirim Telegram yang ditiru OutboundScheduler (misal 20 post per menit ke
+channel) ikut jadi batas throughput; naikkan OUTBOUND_GROUP_RATE/OUTBOUND_GLOBAL_RATE lewat --set kalau
+yang mau diukur bot-nya sendiri.
+"""
+import argparse
+import ast
+import asyncio
+import html
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qsl
+
+from bench_menfes import percentile
+
+BOT_TOKEN = "123456:SOAK"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Menfes Soak", "username": "menfes_soak_bot"}
+CHANNEL_CHAT = {"id": -1001000000001, "type": "channel", "title": "Soak Channel", "username": "gantichlu"}
+GROUP_CHAT = {"id": -1001000000002, "type": "supergroup", "title": "Soak Group", "username": "teman_random_grup"}
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+# Campuran update: (jenis, bobot)
+TRAFFIC_MIX = (
+    ("start", 8),
+    ("help", 3),
+    ("check_membership", 8),
+    ("video", 20),
+    ("text", 11),
+    ("vote", 50),
+)
+
+
+class FakeTelegramServer:
+    """Asyncio HTTP/1.1 server speaking the subset of the Bot API menfes.py uses"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, non_member_rate: float = 0.05, max_posts: int = 200):
+        self.host = host
+        self.port = port
+        self.non_member_rate = non_member_rate
+        self._server = None
+        self._connections = set()
+        self._updates = deque()  # (update_id, payload) not yet confirmed through getUpdates' offset
+        self._new_updates = asyncio.Event()
+        self._message_id = 0
+        self.posts = deque(maxlen=max_posts)  # recent channel posts (message dicts) that users can vote on
+        self._posts_by_id = {}
+        self.calls = Counter()
+        self.confirmed = 0
+        # Update yang menunggu balasan pertama bot: callback per query ID, pesan per chat (FIFO)
+        self._pending_callbacks = {}
+        self._pending_messages = {}
+        self.latencies = []
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    def pending_replies(self) -> int:
+        return len(self._pending_callbacks) + sum(len(times) for times in self._pending_messages.values())
+
+    def backlog(self) -> int:
+        return len(self._updates)
+
+    # Traffic in
+    def push_update(self, update_id: int, payload: dict, expects_reply: bool = True) -> None:
+        payload["update_id"] = update_id
+        self._updates.append((update_id, payload))
+        self._new_updates.set()
+        if not expects_reply:
+            return
+        now = time.monotonic()
+        if "callback_query" in payload:
+            self._pending_callbacks[payload["callback_query"]["id"]] = now
+        else:
+            self._pending_messages.setdefault(payload["message"]["chat"]["id"], deque()).append(now)
+
+    def _replied(self, key, by_chat: bool) -> None:
+        if by_chat:
+            times = self._pending_messages.get(key)
+            if not times:
+                return
+            sent_at = times.popleft()
+            if not times:
+                del self._pending_messages[key]
+        else:
+            sent_at = self._pending_callbacks.pop(key, None)
+            if sent_at is None:
+                return
+        self.latencies.append(time.monotonic() - sent_at)
+
+    # HTTP
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                path = request_line.split()[1].decode()
+                result = await self.dispatch(path.rsplit("/", 1)[-1], self._parse_body(headers, body))
+                response = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(response)}\r\n\r\n".encode()
+                    + response
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _parse_body(headers: dict, body: bytes) -> dict:
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return dict(parse_qsl(body.decode()))
+        # multipart (upload file) tidak dipakai trafik soak
+        return {}
+
+    # Bot API
+    def _message(self, chat: dict, params: dict) -> dict:
+        self._message_id += 1
+        message = {"message_id": self._message_id, "date": int(time.time()), "chat": chat, "from": BOT_USER}
+        for field in ("text", "caption"):
+            if field in params:
+                # Simpan sebagai teks polos seperti yang dikirim balik Telegram (tanpa entity)
+                message[field] = html.unescape(HTML_TAG_RE.sub("", params[field]))
+        return message
+
+    def _chat(self, chat_id) -> dict:
+        if chat_id in ("@gantichlu", str(CHANNEL_CHAT["id"])):
+            return CHANNEL_CHAT
+        if chat_id in ("@teman_random_grup", str(GROUP_CHAT["id"])):
+            return GROUP_CHAT
+        return {"id": int(chat_id), "type": "private", "first_name": "User"}
+
+    async def dispatch(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChat":
+            return self._chat(params.get("chat_id"))
+        if method == "getChatMember":
+            user_id = int(params.get("user_id", 0))
+            status = "left" if (user_id * 2654435761 % 1000) / 1000 < self.non_member_rate else "member"
+            return {"status": status, "user": {"id": user_id, "is_bot": False, "first_name": "User"}}
+        if method == "answerCallbackQuery":
+            self._replied(params.get("callback_query_id"), by_chat=False)
+            return True
+        if method in ("sendMessage", "sendVideo"):
+            chat = self._chat(params.get("chat_id"))
+            message = self._message(chat, params)
+            if chat["type"] == "private":
+                self._replied(chat["id"], by_chat=True)
+            elif chat is CHANNEL_CHAT and method == "sendVideo":
+                message["video"] = {"file_id": params.get("video", "v"), "file_unique_id": "u", "width": 1, "height": 1, "duration": 5}
+                self.posts.append(message)
+                self._posts_by_id[message["message_id"]] = message
+                while len(self._posts_by_id) > len(self.posts):
+                    self._posts_by_id.pop(next(iter(self._posts_by_id)))
+            return message
+        if method in ("editMessageCaption", "editMessageText"):
+            post = self._posts_by_id.get(int(params.get("message_id", 0)))
+            if post is not None and "caption" in params:
+                post["caption"] = html.unescape(HTML_TAG_RE.sub("", params["caption"]))
+            return post or True
+        # setMyDescription, setMyCommands, deleteWebhook, dll.
+        return True
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 0) or 0)
+        while self._updates and self._updates[0][0] < offset:
+            self._updates.popleft()
+            self.confirmed += 1
+        if not self._updates and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return [payload for _, payload in list(self._updates)[:limit]]
+
+
+class TrafficGenerator:
+    """Synthetic user population replayed as a Poisson stream of updates"""
+
+    def __init__(self, server: FakeTelegramServer, users: int, rate: float, seed: int = 1):
+        self.server = server
+        self.users = users
+        self.rate = rate  # updates per real second
+        self._random = random.Random(seed)
+        self._kinds = [kind for kind, _ in TRAFFIC_MIX]
+        self._weights = [weight for _, weight in TRAFFIC_MIX]
+        self._next_id = 1
+        self.sent = Counter()
+
+    def _user(self) -> dict:
+        # Sebagian kecil user jauh lebih aktif (distribusi Pareto), seperti trafik asli
+        if self._random.random() < 0.3:
+            index = min(self.users - 1, int((self._random.paretovariate(1.2) - 1) * 10))
+        else:
+            index = self._random.randrange(self.users)
+        user_id = 1_000_000 + index
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        # Sekitar 3% user tidak punya username
+        if user_id % 33:
+            user["username"] = f"user{user_id}"
+        return user
+
+    def _private_message(self, user: dict, **fields) -> dict:
+        message = {
+            "message_id": self._next_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+            "from": user,
+        }
+        message.update(fields)
+        return {"message": message}
+
+    def make_update(self):
+        """Returns (payload, expects_reply)"""
+        kind = self._random.choices(self._kinds, self._weights)[0]
+        if kind == "vote" and not self.server.posts:
+            kind = "video"
+        user = self._user()
+        self.sent[kind] += 1
+        if kind in ("start", "help"):
+            text = f"/{kind}"
+            entities = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+            return self._private_message(user, text=text, entities=entities), True
+        if kind == "text":
+            return self._private_message(user, text=f"halo {self._next_id}"), True
+        if kind == "video":
+            video = {
+                "file_id": f"video-{self._next_id}",
+                "file_unique_id": f"uniq-{self._next_id}",
+                "width": 720,
+                "height": 1280,
+                "duration": self._random.choice((5, 10, 15, 25, 45)),
+                "mime_type": "video/mp4",
+                "file_size": self._random.randrange(200_000, 20_000_000),
+            }
+            return self._private_message(user, caption=f"menfes dari {user['id']}", video=video), True
+        if kind == "check_membership":
+            # Tombol ada di pesan sambutan dari bot di chat privat user
+            data = "check_membership"
+            message = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+                "from": BOT_USER,
+                "text": "Selamat datang",
+            }
+        else:
+            # Post baru lebih sering divote daripada post lama
+            posts = self.server.posts
+            post = posts[len(posts) - 1 - min(len(posts) - 1, int(self._random.expovariate(0.1)))]
+            data, message = ("like_" if self._random.random() < 0.75 else "dislike_") + "1", dict(post)
+        callback = {"id": str(self._next_id), "from": user, "chat_instance": "soak", "data": data, "message": message}
+        return {"callback_query": callback}, True
+
+    async def run(self, duration: float) -> None:
+        deadline = time.monotonic() + duration
+        next_at = time.monotonic()
+        while next_at < deadline:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Kirim semua update yang jatuh tempo sekaligus supaya laju tinggi tetap tercapai
+            while next_at <= time.monotonic() and next_at < deadline:
+                payload, expects_reply = self.make_update()
+                self.server.push_update(self._next_id, payload, expects_reply)
+                self._next_id += 1
+                next_at += self._random.expovariate(self.rate)
+
+
+def read_rss_kb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def prepare_bot(workdir: str, base_url: str, overrides) -> str:
+    """Copy menfes.py into workdir with its config constants replaced, returns the script path"""
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(source_dir, "menfes.py")) as f:
+        source = f.read()
+    settings = {"BOT_TOKEN": repr(BOT_TOKEN), "BOT_API_BASE_URL": repr(base_url)}
+    for item in overrides:
+        name, _, value = item.partition("=")
+        ast.literal_eval(value)  # hanya literal, ditolak kalau bukan
+        settings[name.strip()] = value.strip()
+    for name, value in settings.items():
+        source, count = re.subn(rf"^{name} = .*$", lambda _: f"{name} = {value}", source, count=1, flags=re.M)
+        if not count:
+            raise SystemExit(f"Unknown menfes.py setting: {name}")
+    script = os.path.join(workdir, "menfes.py")
+    with open(script, "w") as f:
+        f.write(source)
+    return script
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="menfes_soak_")
+    server = FakeTelegramServer(non_member_rate=args.non_member_rate)
+    await server.start()
+    script = prepare_bot(workdir, server.base_url, args.set)
+    log_path = os.path.join(workdir, "bot.log")
+    rate = args.users * args.user_rate / 3600 * args.speedup
+    duration = args.hours * 3600 / args.speedup
+
+    with open(log_path, "w") as log_file:
+        bot = await asyncio.create_subprocess_exec(
+            sys.executable, script, cwd=workdir, stdout=log_file, stderr=asyncio.subprocess.STDOUT
+        )
+    samples = []
+    try:
+        # Tunggu bot mulai polling sebelum trafik dimulai
+        started_wait = time.monotonic()
+        while not server.calls["getUpdates"]:
+            if bot.returncode is not None or time.monotonic() - started_wait > 60:
+                raise SystemExit(f"Bot did not start polling, see {log_path}")
+            await asyncio.sleep(0.1)
+
+        generator = TrafficGenerator(server, args.users, rate, args.seed)
+        started = time.monotonic()
+        traffic = asyncio.get_running_loop().create_task(generator.run(duration))
+
+        async def sample() -> None:
+            elapsed = time.monotonic() - started
+            rss = read_rss_kb(bot.pid)
+            samples.append({
+                "elapsed_s": round(elapsed, 1),
+                "updates_sent": sum(generator.sent.values()),
+                "updates_confirmed": server.confirmed,
+                "backlog": server.backlog(),
+                "awaiting_reply": server.pending_replies(),
+                "rss_mb": round(rss / 1024, 1) if rss else None,
+            })
+            print(
+                f"[{elapsed:8.1f}s] sent {samples[-1]['updates_sent']:>8}  confirmed {server.confirmed:>8}  "
+                f"backlog {server.backlog():>6}  rss {samples[-1]['rss_mb']} MB",
+                file=sys.stderr
+            )
+
+        while not traffic.done():
+            await asyncio.wait([traffic], timeout=args.sample_interval)
+            await sample()
+        await traffic
+
+        # Beri waktu bot menghabiskan backlog dan balasan yang masih antri
+        drain_deadline = time.monotonic() + args.drain
+        while (server.backlog() or server.pending_replies()) and time.monotonic() < drain_deadline:
+            await asyncio.sleep(0.2)
+        await sample()
+        elapsed = time.monotonic() - started
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(bot.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                bot.kill()
+                await bot.wait()
+        await server.stop()
+
+    sent = sum(generator.sent.values())
+    latencies = server.latencies
+    api_calls = {method: count for method, count in sorted(server.calls.items()) if method != "getUpdates"}
+    rss_values = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    # Pertumbuhan RSS diukur dari sampel setelah pemanasan (10% pertama) supaya import/cache awal tidak ikut
+    warm = rss_values[len(rss_values) // 10] if rss_values else None
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": {
+            "users": args.users,
+            "hours_simulated": args.hours,
+            "speedup": args.speedup,
+            "user_rate_per_hour": args.user_rate,
+            "target_updates_per_sec": round(rate, 1),
+            "overrides": args.set,
+            "seed": args.seed,
+        },
+        "updates_sent": sent,
+        "updates_by_kind": dict(sorted(generator.sent.items())),
+        "updates_confirmed": server.confirmed,
+        "duration_s": round(elapsed, 1),
+        "throughput_per_sec": round(server.confirmed / elapsed, 1) if elapsed else 0.0,
+        "replies": len(latencies),
+        "unanswered": server.pending_replies(),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p90": round(percentile(latencies, 90) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        },
+        "api_calls": sum(api_calls.values()),
+        "api_calls_per_update": round(sum(api_calls.values()) / sent, 3) if sent else 0.0,
+        "api_calls_by_method": api_calls,
+        "rss_mb": {
+            "first": rss_values[0] if rss_values else None,
+            "after_warmup": warm,
+            "last": rss_values[-1] if rss_values else None,
+            "max": max(rss_values) if rss_values else None,
+            "growth_after_warmup": round(rss_values[-1] - warm, 1) if rss_values else None,
+        },
+        "samples": samples,
+        "bot_exit_code": bot.returncode,
+        "bot_log": log_path,
+    }
+    if not args.keep:
+        shutil.copy(log_path, os.path.join(tempfile.gettempdir(), "menfes_soak_bot.log"))
+        report["bot_log"] = os.path.join(tempfile.gettempdir(), "menfes_soak_bot.log")
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000, help="size of the synthetic user population")
+    parser.add_argument("--user-rate", type=float, default=6, help="average updates per user per hour")
+    parser.add_argument("--hours", type=float, default=1, help="hours of traffic to replay")
+    parser.add_argument("--speedup", type=float, default=1, help="replay the traffic this many times faster than real time")
+    parser.add_argument("--non-member-rate", type=float, default=0.05, help="fraction of users getChatMember reports as not joined")
+    parser.add_argument("--sample-interval", type=float, default=10, help="seconds between throughput/RSS samples")
+    parser.add_argument("--drain", type=float, default=60, help="max seconds to wait for the bot to catch up after the traffic stops")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a menfes.py setting, e.g. --set CONCURRENT_UPDATES=32 (repeatable)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="keep the bot's working directory (database, logs)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()